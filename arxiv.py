@@ -8,12 +8,20 @@ See:
   - https://github.com/titipata/arxivpy
  """
 import re
+import sys
+import asyncio
+import tempfile
+from os import remove
+from os.path import exists as _exists
 from datetime import timedelta
 import datetime
-from time import sleep
-from random import uniform
-from feedparser import parse
-from json import load, dump
+from json import load, dump, loads, dumps
+from aiohttp import ClientError
+from fetcher import AsyncFetcher, TokenBucket, run_sync, iter_sync, discard
+from fetcher import amerge, PageSizer, CircuitBreaker, FetchError
+from atom import AtomParser, iter_entries
+from matcher import KeywordMatcher
+from metrics import REGISTRY
 
 
 __author__ = 'Christophe Ecabert'
@@ -21,6 +29,9 @@ __author__ = 'Christophe Ecabert'
 # Arxiv entry point
 _base_url = 'http://export.arxiv.org/api/query?'
 
+_pages = REGISTRY.counter('paperbot_pages_fetched_total',
+                          'Result pages received from arxiv')
+
 
 def _is_category(entry):
   """
@@ -42,14 +53,56 @@ def _is_paper_id(entry):
   return res is not None
 
 
+def _arxiv_id(url):
+  """
+  Extract arxiv identifier without version from an article url
+  :param url: Url, i.e. `http://arxiv.org/abs/2001.01234v2`
+  :return:  str, i.e. `2001.01234`
+  """
+  arxiv_id = url.split('/abs/')[-1]
+  return re.sub(r"v\d+$", '', arxiv_id)
+
+
+def feed_name(category):
+  """
+  Name identifying a set of categories, independent of their order
+  :param category:  str or list of categories
+  :return:  str, i.e. `cs.CV,cs.LG`
+  """
+  if isinstance(category, str):
+    return category
+  return ','.join(sorted(set(category)))
+
+
+def _date_range(date_from, date_to=None):
+  """
+  Build a submission date range clause
+  :param date_from: First submission date, `YYYY-MM-DD` or datetime.date
+  :param date_to:   Last submission date (included), defaults to `date_from`
+  :return:  str, i.e. `submittedDate:[202001010000+TO+202001022359]`
+  """
+  def _fmt(d):
+    if isinstance(d, datetime.date):
+      d = d.strftime('%Y-%m-%d')
+    return d.replace('-', '')
+
+  date_to = date_to or date_from
+  return 'submittedDate:[{}0000+TO+{}2359]'.format(_fmt(date_from),
+                                                   _fmt(date_to))
+
+
 class Search:
   """ User defined search request """
 
-  def __init__(self, search):
+  def __init__(self, search, date_from=None, date_to=None):
     """
     Constructor
     :param search:  List or str, list of categories/paper id or plain arxiv
                     search
+    :param date_from: Restrict search to articles submitted since this date,
+                      `YYYY-MM-DD` or datetime.date, optional
+    :param date_to:   Restrict search to articles submitted until this date
+                      (included), defaults to `date_from`
     """
 
     # Search queries -> text
@@ -78,6 +131,15 @@ class Search:
         # Raw query
         self.search_query = search
 
+    # Submission window, evaluated by arxiv
+    if date_from is not None:
+      clause = _date_range(date_from, date_to)
+      if self.search_query:
+        self.search_query = '%28{}%29+AND+{}'.format(self.search_query,
+                                                     clause)
+      else:
+        self.search_query = clause
+
   @classmethod
   def FromSubject(cls, subject):
     """
@@ -136,23 +198,45 @@ class Search:
 
 class Article:
   """
-  Container for an article reference
+  Container for an article reference. Attributes are stored in slots, author
+  names are interned and text fields are normalized on first access so large
+  collections of articles stay compact.
 
   Arguments
   ---------
 
   title: str      Article's title
-  authors:  list  List of authors
+  authors:  tuple Authors
   summary:  str   Article's summary
   link: str       Link to article's main page
+  keywords: list  Keywords matched by the article
+  arxiv_id: str   Arxiv identifier without version
+  category: str   Primary category
   """
 
+  __slots__ = ('_title',
+               'authors',
+               '_summary',
+               'date',
+               'link',
+               'keywords',
+               'arxiv_id',
+               'category',
+               '_clean')
+
+  # Bits of `_clean`, set once text field is normalized
+  _TITLE = 1
+  _SUMMARY = 2
+
   def __init__(self,
                title: str,
                authors: list,
                summary: str,
                date: str,
-               link: str):
+               link: str,
+               keywords: list = None,
+               arxiv_id: str = None,
+               category: str = None):
     """
     Constructor
     :param title:   Article's title
@@ -160,12 +244,231 @@ class Article:
     :param summary: Summary
     :param date:    Submitted date
     :param link:    Reference to paper
+    :param keywords: Keywords matched by the article
+    :param arxiv_id: Arxiv identifier, extracted from `link` if not provided
+    :param category: Primary category
     """
-    self.title = title.replace('\n', ' ').replace('  ', ' ')
-    self.authors = authors
-    self.summary = summary.replace('\n', ' ').replace('  ', ' ')
+    self._title = title
+    self.authors = tuple(sys.intern(a) for a in authors)
+    self._summary = summary
     self.date = date
     self.link = link
+    self.keywords = keywords or ()
+    self.arxiv_id = arxiv_id or _arxiv_id(link)
+    self.category = sys.intern(category) if category else category
+    self._clean = 0
+
+  @property
+  def title(self):
+    if not self._clean & Article._TITLE:
+      self._title = ' '.join(self._title.split())
+      self._clean |= Article._TITLE
+    return self._title
+
+  @property
+  def summary(self):
+    if not self._clean & Article._SUMMARY:
+      self._summary = ' '.join(self._summary.split())
+      self._clean |= Article._SUMMARY
+    return self._summary
+
+  def __repr__(self):
+    return 'Article({}, {!r})'.format(self.arxiv_id, self.title)
+
+  def nbytes(self):
+    """
+    Approximate memory used by the article, interned author names excluded
+    :return:  int
+    """
+    return (sys.getsizeof(self) +
+            sys.getsizeof(self._title) +
+            sys.getsizeof(self._summary) +
+            sys.getsizeof(self.authors) +
+            sys.getsizeof(self.date) +
+            sys.getsizeof(self.link) +
+            sys.getsizeof(self.arxiv_id))
+
+  def to_json(self):
+    """
+    Serialize into a compact, single line, json array
+    :return:  str
+    """
+    return dumps([self.arxiv_id,
+                  self.title,
+                  self.authors,
+                  self.summary,
+                  self.date,
+                  self.link,
+                  self.category,
+                  self.keywords],
+                 ensure_ascii=False,
+                 separators=(',', ':'))
+
+  @classmethod
+  def FromJson(cls, line):
+    """
+    Create article from its json representation, see `to_json`
+    :param line:  str
+    :return:  Article
+    """
+    fields = loads(line)
+    arxiv_id, title, authors, summary, date, link, category = fields[:7]
+    art = cls(title=title,
+              authors=authors,
+              summary=summary,
+              date=date,
+              link=link,
+              keywords=fields[7] if len(fields) > 7 else None,
+              arxiv_id=arxiv_id,
+              category=category)
+    art._clean = Article._TITLE | Article._SUMMARY
+    return art
+
+
+def dump_articles(articles, f):
+  """
+  Write articles in json lines format, one article per line
+  :param articles:  Iterable of Article
+  :param f:         File object opened in text mode
+  :return:  Number of articles written
+  """
+  n = 0
+  for art in articles:
+    f.write(art.to_json())
+    f.write('\n')
+    n += 1
+  return n
+
+
+def iter_articles(f):
+  """
+  Read articles stored in json lines format
+  :param f: File object opened in text mode
+  :return:  Generator of Article
+  """
+  for line in f:
+    if line.strip():
+      yield Article.FromJson(line)
+
+
+class ArticleSpool:
+  """
+  Append only sequence of articles held in memory up to a budget. Beyond it,
+  articles are moved to a temporary file, in json lines format, and read back
+  when iterating. Articles must not be appended while iterating.
+  """
+
+  def __init__(self, budget=32 * 2 ** 20, folder=None):
+    """
+    Constructor
+    :param budget:  Memory allowed for the articles, in bytes. None means no
+                    limit
+    :param folder:  Folder where the temporary file is created, system's
+                    default if None
+    """
+    self.budget = budget
+    self._folder = folder
+    self._articles = []
+    self._size = 0
+    self._file = None
+    self._n_spilled = 0
+
+  def __len__(self):
+    return self._n_spilled + len(self._articles)
+
+  def __iter__(self):
+    if self._file is not None:
+      self._file.flush()
+      self._file.seek(0)
+      yield from iter_articles(self._file)
+    yield from self._articles
+
+  @property
+  def spilled(self):
+    """ Number of articles stored on disk """
+    return self._n_spilled
+
+  def append(self, article):
+    """
+    Add an article, spill the ones in memory if the budget is exceeded
+    :param article: Article
+    """
+    self._articles.append(article)
+    self._size += article.nbytes()
+    if self.budget is not None and self._size > self.budget:
+      if self._file is None:
+        self._file = tempfile.TemporaryFile(mode='w+',
+                                            encoding='utf-8',
+                                            dir=self._folder)
+      self._file.seek(0, 2)
+      self._n_spilled += dump_articles(self._articles, self._file)
+      self._articles = []
+      self._size = 0
+
+  def extend(self, articles):
+    """
+    Add several articles
+    :param articles:  Iterable of Article
+    """
+    for art in articles:
+      self.append(art)
+
+  def close(self):
+    """ Release the temporary file """
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+    self._articles = []
+    self._n_spilled = 0
+    self._size = 0
+
+
+class _DailyCheckpoint:
+  """
+  Progress of the daily search of a submission day, saved after every page:
+  query -> index of the next result and whether the query is completed. A
+  search interrupted by an error resumes where it stopped.
+  """
+
+  def __init__(self, filename, date):
+    """
+    Constructor, reload progress of the same submission day if any
+    :param filename:  Path to the checkpoint file, nothing is saved if None
+    :param date:      Submission date, `YYYY-MM-DD`
+    """
+    self._filename = filename
+    self._state = {'date': date, 'queries': {}}
+    if filename is not None and _exists(filename):
+      with open(filename, 'r') as f:
+        state = load(f)
+      if state.get('date') == date:
+        self._state = state
+
+  def get(self, query):
+    """
+    Progress of a query
+    :param query: Search query
+    :return:  Tuple (index of the next result, completed)
+    """
+    start, done = self._state['queries'].get(query, (0, False))
+    return start, done
+
+  def update(self, query, start, done=False):
+    """
+    Save progress of a query
+    :param query: Search query
+    :param start: Index of the next result
+    :param done:  True if the query is completed
+    """
+    self._state['queries'][query] = (start, done)
+    if self._filename is not None:
+      with open(self._filename, 'w') as f:
+        dump(self._state, f)
+
+  def remove(self):
+    """ Search completed, forget progress """
+    if self._filename is not None and _exists(self._filename):
+      remove(self._filename)
 
 
 class ArxivParser:
@@ -173,26 +476,78 @@ class ArxivParser:
 
   def __init__(self,
                category=None,
-               wait_time=5.0):
+               wait_time=5.0,
+               store=None,
+               cache=None,
+               index=None,
+               limiter=None,
+               sharded=False,
+               memory_budget=32 * 2 ** 20,
+               sizer=None,
+               breaker=None):
     """
     Create Arxiv wrapper
     :param category:  str or list of categories to search for
     :param wait_time: Waiting time between to batch request
+    :param store:     ArticleStore where fetched articles are persisted,
+                      optional. Fetching stops at the first stored article.
+    :param cache:     ResponseCache serving repeated queries locally, optional
+    :param index:     SearchIndex updated with fetched articles, optional
+    :param limiter:   TokenBucket shared with other wrappers, optional
+    :param sharded:   If True, daily searches query every category on its own
+                      and concurrently, results are merged afterward
+    :param memory_budget: Memory allowed for the results of
+                          `run_daily_search`, in bytes, spilled to disk
+                          beyond
+    :param sizer:     PageSizer adapting the number of results per page of
+                      daily searches, shared with other wrappers, optional
+    :param breaker:   CircuitBreaker shared with other wrappers, optional
     """
 
     self.category = category or 'cs.CV'
+    self.feed = feed_name(self.category)
     self.wait_time = wait_time
+    self.store = store
+    self.cache = cache
+    self.index = index
+    self.sharded = sharded
+    self.memory_budget = memory_budget
+    # Shared by every request sent to arxiv, survives between searches
+    self._limiter = limiter or TokenBucket.FromWaitTime(wait_time)
+    self._sizer = sizer or PageSizer()
+    self._breaker = breaker or CircuitBreaker()
 
   @classmethod
-  def from_config(cls, filename):
+  def from_config(cls, filename, store=None, cache=None, index=None):
     """
     Create ArxivParser object from config file
     :param filename:  Path to the configuration file
+    :param store:     ArticleStore where fetched articles are persisted
+    :param cache:     ResponseCache serving repeated queries locally
+    :param index:     SearchIndex updated with fetched articles
     :return:  ArxivParser object
     """
     with open(filename, 'r') as f:
       data = load(f)
-    return cls(**data)
+    return cls(store=store, cache=cache, index=index, **data)
+
+  def for_category(self, category):
+    """
+    Create a wrapper searching other categories. It shares the store, cache,
+    index, rate limit, page sizing and circuit breaker of this one.
+    :param category:  str or list of categories to search for
+    :return:  ArxivParser object
+    """
+    return ArxivParser(category=category,
+                       wait_time=self.wait_time,
+                       store=self.store,
+                       cache=self.cache,
+                       index=self.index,
+                       limiter=self._limiter,
+                       sharded=self.sharded,
+                       memory_budget=self.memory_budget,
+                       sizer=self._sizer,
+                       breaker=self._breaker)
 
   def save_config(self, filename):
     """
@@ -201,83 +556,481 @@ class ArxivParser:
     """
     with open(filename, 'w') as f:
       data = {'category': self.category,
-              'wait_time': self.wait_time}
+              'wait_time': self.wait_time,
+              'sharded': self.sharded,
+              'memory_budget': self.memory_budget}
       dump(data, f)
 
-  def _query_daily_paper(self,
-                         start,
-                         max_results,
-                         res_per_iter):
+  def _persist(self, articles):
     """
-    Perform a query
-    :param start: Start index
-    :param max_results:   Ending index
-    :param res_per_iter: Number of article parsing per iteration
-          this control so not too many articles are parsed at once
+    Add fetched articles to the store and search index, if any
+    :param articles:  List of Article
     """
+    if self.store is not None:
+      self.store.add(articles, feed=self.feed)
+    if self.index is not None:
+      self.index.add(articles)
 
-    articles = []
-    n_left = max_results
-    n_start = start
-    # Process request by batch
+  @staticmethod
+  def _daily_submission_date():
+    """
+    Submission date of the papers announced today
+    :return:  str, `YYYY-MM-DD`
+    """
     submitted_date = datetime.date.today()
     if submitted_date.weekday() == 0:   # Is it monday ?
       submitted_date -= timedelta(3)
     else:
       submitted_date -= timedelta(1)
-    submitted_date_str = submitted_date.strftime('%Y-%m-%d')
-    while n_left > 0:
-      # Define search
-      search = Search(search=self.category).Finalize(start=n_start,
-                                                     max_results=res_per_iter)
-      # Call webserver
-      res = parse(search)
-      if res.get('status') != 200:
-        print('HTTP Error {} in query'.format(res.get('status', 'no status')))
-        break
-
-      # Get entries + update number of results left to downloads
-      entries = res.get('entries')
-      n_left -= len(entries)
-      n_start += len(entries)
-      if len(entries) == 0:
-        print('No more fetch')
-        break
-      for entry in entries:
-        date = entry.get('date', '')
-        if submitted_date_str in date:
-          articles.append(entry)
-        else:
-          n_left = 0
+    return submitted_date.strftime('%Y-%m-%d')
+
+  def _query_daily_paper(self,
+                         start=0,
+                         max_results=None,
+                         res_per_iter=None):
+    """
+    Perform a query
+    :param start: Start index
+    :param max_results:   Ending index, None to fetch the whole submission day
+    :param res_per_iter: Number of article parsing per iteration
+          this control so not too many articles are parsed at once. None
+          adapts it to the observed transfers
+    :return:  List of Article
+    """
+    return run_sync(self._aquery_daily_paper(start=start,
+                                             max_results=max_results,
+                                             res_per_iter=res_per_iter))
+
+  async def _aquery_daily_paper(self,
+                                start=0,
+                                max_results=None,
+                                res_per_iter=None):
+    """
+    Perform a query asynchronously, see `_aiter_daily_paper`
+    :param start: Start index
+    :param max_results:   Ending index, None to fetch the whole submission day
+    :param res_per_iter: Number of article parsing per iteration
+          this control so not too many articles are parsed at once. None
+          adapts it to the observed transfers
+    :return:  List of Article
+    """
+    return [article async for article in
+            self._aiter_daily_paper(start=start,
+                                    max_results=max_results,
+                                    res_per_iter=res_per_iter)]
+
+  async def _aiter_daily_paper(self,
+                               start=0,
+                               max_results=None,
+                               res_per_iter=None,
+                               checkpoint=None):
+    """
+    Iterate over the articles submitted for today's announcement, most recent
+    first, stops at the first article stored by a previous run. The next page
+    is downloaded while the current one is parsed. In sharded mode,
+    categories are queried concurrently under the shared rate limit and
+    merged on their submission date, cross-listed articles are reported once.
+    Articles are persisted page by page, if a checkpoint is given a search
+    interrupted by an error resumes from the failed page.
+    :param start: Start index
+    :param max_results:   Ending index, None to fetch the whole submission day
+    :param res_per_iter: Number of article parsing per iteration
+          this control so not too many articles are parsed at once. None
+          adapts it to the observed transfers
+    :param checkpoint:  Path to the checkpoint file, optional
+    :return:  Asynchronous generator of Article
+    :raises FetchError: once the articles fetched are produced, if a query
+                        failed
+    """
+    submitted_date_str = self._daily_submission_date()
+    progress = _DailyCheckpoint(checkpoint, submitted_date_str)
+    # Stored during this run, do not stop at them
+    persisted = set()
+    errors = []
+    categories = self.category
+    if isinstance(categories, str):
+      categories = [categories]
+    if not self.sharded or len(categories) == 1:
+      query = self._aiter_daily_shard(category=self.category,
+                                      submitted_date_str=submitted_date_str,
+                                      start=start,
+                                      max_results=max_results,
+                                      res_per_iter=res_per_iter,
+                                      progress=progress,
+                                      persisted=persisted)
+    else:
+      shards = [self._aiter_daily_shard(category=c,
+                                        submitted_date_str=submitted_date_str,
+                                        start=start,
+                                        max_results=max_results,
+                                        res_per_iter=res_per_iter,
+                                        progress=progress,
+                                        persisted=persisted,
+                                        errors=errors)
+                for c in categories]
+      query = amerge(shards,
+                     key=lambda article: article.date,
+                     reverse=True,
+                     buffer_size=res_per_iter or 100)
+    seen = set()
+    try:
+      async for article in query:
+        if article.arxiv_id in seen:
+          continue
+        seen.add(article.arxiv_id)
+        yield article
+        if max_results is not None and len(seen) >= max_results:
+          return
+    finally:
+      await query.aclose()
+    if errors:
+      raise FetchError('; '.join(errors))
+    progress.remove()
+
+  async def _aiter_daily_shard(self,
+                               category,
+                               submitted_date_str,
+                               start,
+                               max_results,
+                               res_per_iter,
+                               progress,
+                               persisted,
+                               errors=None):
+    """
+    Iterate over the articles of some categories submitted on a given day,
+    stops at the first article stored by a previous run. Articles are
+    persisted once their page has been consumed, then the progress is saved.
+    A page left partially consumed saves the index right after the last
+    article produced. A search resumed from its checkpoint does not stop at
+    the stored articles, other shards may have stored the cross-listed ones.
+    :param category:  str or list of categories
+    :param submitted_date_str:  Submission date, `YYYY-MM-DD`
+    :param start: Start index
+    :param max_results:   Ending index, None to fetch the whole submission day
+    :param res_per_iter:  Number of results per page, adaptive if None
+    :param progress:      _DailyCheckpoint of the search
+    :param persisted:     Set of IDs stored during this search, updated
+    :param errors:        List where errors are reported instead of being
+                          raised, optional
+    :return:  Asynchronous generator of Article
+    """
+    search = Search(search=category, date_from=submitted_date_str)
+    key = search.search_query
+    resume, done = progress.get(key)
+    if done:
+      return
+    page = []
+
+    def _save_page():
+      self._persist(page)
+      persisted.update(art.arxiv_id for art in page)
+      page.clear()
+
+    def _on_page(next_start):
+      _save_page()
+      progress.update(key, next_start)
+
+    query = self._aiter_query(search=search,
+                              start=max(start, resume),
+                              res_per_iter=res_per_iter,
+                              max_results=max_results,
+                              sizer=self._sizer if res_per_iter is None else
+                              None,
+                              on_page=_on_page)
+    # Index of the article following the last one produced
+    consumed = max(start, resume)
+    early_stop = self.store is not None and resume == 0
+    try:
+      index = consumed
+      async for index, article in query:
+        if submitted_date_str not in article.date:
           break
-      # Sleep for a while to avoid IP ban
-      if n_left > res_per_iter:
-        sleep(self.wait_time + uniform(0, 3))
-    return articles
+        if (early_stop and
+            article.arxiv_id not in persisted and
+            self.store.in_feed(self.feed, article.arxiv_id)):
+          # Already fetched by a previous run, older ones as well
+          break
+        page.append(article)
+        consumed = index + 1
+        yield article
+      _save_page()
+      progress.update(key, index, done=True)
+    except Exception as e:
+      if errors is None:
+        raise
+      # Do not hold up other shards
+      print('Search of {} failed: {}'.format(category, e))
+      errors.append('{}: {}'.format(feed_name(category), e))
+    finally:
+      await query.aclose()
+      if page:
+        _save_page()
+        progress.update(key, consumed)
+
+  async def _aiter_query(self,
+                         search,
+                         start,
+                         res_per_iter,
+                         max_results=None,
+                         sizer=None,
+                         on_page=None):
+    """
+    Iterate over the results of a query page by page. Entries are parsed while
+    they are downloaded and the next page is requested while the current one
+    is consumed. Stopping the iteration drops the current transfer. Once the
+    first page is received, the total number of results reported by arxiv
+    bounds the pagination. Requests are retried by the fetcher, interrupted
+    transfers and empty pages before the end of the results are requested
+    again from where they stopped.
+    :param search:  Search to run
+    :param start:   Index of the first result
+    :param res_per_iter:  Number of results per page
+    :param max_results:   Maximum number of results, unbounded if None
+    :param sizer:         PageSizer choosing the number of results per page,
+                          replaces `res_per_iter` if provided
+    :param on_page:       Callable invoked with the index of the next result
+                          once the entries of a page have been consumed,
+                          optional
+    :return:  Asynchronous generator of tuple (index, Article)
+    :raises FetchError: if a page can not be fetched, retries included
+    """
+    def _page_size():
+      return sizer.size if sizer is not None else res_per_iter
+
+    n_left = max_results if max_results is not None else float('inf')
+    n_start = start
+    n_failures = 0
+    async with AsyncFetcher(limiter=self._limiter,
+                            cache=self.cache,
+                            breaker=self._breaker) as fetcher:
+      next_start = n_start
+      next_size = _page_size()
+      next_url = search.Finalize(start=n_start, max_results=next_size)
+      pending = fetcher.prefetch(next_url)
+      try:
+        while n_left > 0:
+          page_size = next_size
+          url = next_url
+          # Wait for current page
+          try:
+            res = await pending
+          except (ClientError, asyncio.TimeoutError) as e:
+            raise FetchError('HTTP Error {} in query'.format(e)) from e
+          finally:
+            pending = None
+          if res.status != 200:
+            res.close()
+            raise FetchError('HTTP Error {} in query'.format(res.status))
+          _pages.inc()
+          # Send request for next page, rate limiter controls when it is
+          # actually sent
+          if n_left > page_size:
+            next_start = n_start + page_size
+            next_size = _page_size()
+            next_url = search.Finalize(start=next_start,
+                                       max_results=next_size)
+            pending = fetcher.prefetch(next_url)
+          # Parse entries while they are downloaded
+          n_entries = 0
+          error = None
+          parser = AtomParser()
+          try:
+            async for entry in iter_entries(res.iter_chunks(), parser):
+              yield n_start + n_entries, Article(**entry)
+              n_entries += 1
+              if n_entries >= n_left:
+                break
+          except (ClientError, asyncio.TimeoutError) as e:
+            error = e
+          finally:
+            res.close()
+          if sizer is not None and error is None:
+            sizer.observe(n_entries, res.nbytes, res.transfer_seconds)
+
+          # Update number of results left to downloads
+          n_left -= n_entries
+          n_start += n_entries
+          if parser.total_results is not None:
+            n_left = min(n_left, parser.total_results - n_start)
+          if error is None and n_entries == 0 and \
+                  parser.total_results is not None and n_left > 0:
+            # Arxiv sporadically answers with an empty page, it must not be
+            # served again from the cache when retrying
+            error = 'empty page at {}'.format(n_start)
+            if self.cache is not None:
+              self.cache.remove(url)
+          if error is not None:
+            fetcher.record(success=False)
+            n_failures += 1
+            if n_failures > fetcher.max_retries:
+              raise FetchError('HTTP Error {} in query'.format(error))
+            print('HTTP Error {} in query, retrying'.format(error))
+            await asyncio.sleep(fetcher.retry_delay(n_failures))
+          else:
+            n_failures = 0
+            if on_page is not None:
+              on_page(n_start)
+            if n_entries == 0:
+              print('No more fetch')
+              break
+          # Short page, prefetched offset is wrong or missing
+          if n_left > 0 and (pending is None or next_start != n_start):
+            if pending is not None:
+              discard(pending)
+            next_start = n_start
+            next_size = _page_size()
+            next_url = search.Finalize(start=next_start,
+                                       max_results=next_size)
+            pending = fetcher.prefetch(next_url)
+      finally:
+        # Discard prefetched page if not needed anymore
+        if pending is not None:
+          discard(pending)
 
   def run_daily_search(self,
-                       keywords=()):
+                       keywords=(),
+                       checkpoint=None):
     """
     Run daily search on arxiv. Can filter articles based on specific keywords
-    :param keywords:  List of keywords to filter paper
-    :return: List of articles matching the criterions
-    """
-
-    # Query all articles publish today (i.e. submitted yesterday)
-    articles = []
-    daily_articles = self._query_daily_paper(0, 200, 100)
-    for art in daily_articles:
-      title = art.title
-      authors = [author['name'] for author in art.authors]
-      summary = art.summary
-      link = art.link
-      date = art.date
-      paper = Article(title, authors, summary, date, link)
-      if (len(keywords) == 0 or
-        any([kw in paper.title.lower() for kw in keywords])):
-        articles.append(paper)
+    :param keywords:  List of keywords or KeywordMatcher to filter paper
+    :param checkpoint:  Path to the checkpoint file, optional
+    :return: ArticleSpool of articles matching the criterions, spilled to disk
+             beyond `memory_budget`
+    """
+    articles = ArticleSpool(budget=self.memory_budget)
+    articles.extend(self.iter_daily_articles(keywords, checkpoint=checkpoint))
     return articles
 
+  def iter_daily_articles(self,
+                          keywords=(),
+                          checkpoint=None):
+    """
+    Run daily search on arxiv and yield matching articles as soon as their
+    page is parsed, see `aiter_daily_articles`
+    :param keywords:  List of keywords or KeywordMatcher to filter paper
+    :param checkpoint:  Path to the checkpoint file, optional
+    :return:  Generator of Article
+    """
+    return iter_sync(self.aiter_daily_articles(keywords,
+                                               checkpoint=checkpoint))
+
+  async def aiter_daily_articles(self,
+                                 keywords=(),
+                                 checkpoint=None):
+    """
+    Run daily search on arxiv and yield matching articles as soon as their
+    page is parsed. Pages are fetched until the submission day is exhausted.
+    If a store is attached, newly fetched articles are persisted and the
+    articles of the same day fetched by a previous run are yielded
+    afterwards. If a checkpoint is given, a search that failed resumes from
+    the failed page when run again, earlier pages are served by the store.
+    :param keywords:  List of keywords or KeywordMatcher to filter paper
+    :param checkpoint:  Path to the checkpoint file, optional
+    :return:  Asynchronous generator of Article
+    :raises FetchError: if arxiv could not be queried, after the articles
+                        fetched so far are produced
+    """
+    matcher = keywords
+    if not isinstance(matcher, KeywordMatcher):
+      matcher = KeywordMatcher(keywords)
+
+    def _select(paper):
+      paper.keywords = matcher.match(paper)
+      return len(matcher) == 0 or paper.keywords
+
+    # Query all articles publish today (i.e. submitted yesterday)
+    known = set()
+    query = self._aiter_daily_paper(checkpoint=checkpoint)
+    try:
+      async for paper in query:
+        known.add(paper.arxiv_id)
+        if _select(paper):
+          yield paper
+    finally:
+      await query.aclose()
+    if self.store is not None:
+      # Complete with the ones fetched previously
+      for paper in self.store.by_date(self._daily_submission_date(),
+                                      feed=self.feed):
+        if paper.arxiv_id not in known and _select(paper):
+          yield paper
+
+  def backfill(self,
+               date_from,
+               date_to=None,
+               checkpoint=None,
+               res_per_iter=100):
+    """
+    Harvest all articles submitted within a range of dates, most recent
+    first. Articles are streamed and added to the store if any. If a
+    checkpoint is given, the position in the results is saved after every
+    page and a subsequent call for the same range resumes from there.
+    Articles around the resume point can be produced twice.
+    :param date_from: First submission date, `YYYY-MM-DD`
+    :param date_to:   Last submission date (included), `YYYY-MM-DD`,
+                      defaults to today
+    :param checkpoint:  Path to the checkpoint file, optional
+    :param res_per_iter:  Number of results per page
+    :return:  Generator of Article
+    """
+    return iter_sync(self._abackfill(date_from=date_from,
+                                     date_to=date_to,
+                                     checkpoint=checkpoint,
+                                     res_per_iter=res_per_iter))
+
+  async def _abackfill(self,
+                       date_from,
+                       date_to,
+                       checkpoint,
+                       res_per_iter):
+    """
+    Harvest all articles submitted within a range of dates, see `backfill`
+    :return:  Asynchronous generator of Article
+    """
+    date_to = date_to or datetime.date.today().strftime('%Y-%m-%d')
+    # Resume previous run if it targets the same range
+    search = Search(search=self.category, date_from=date_from, date_to=date_to)
+    cursor = {'query': search.search_query,
+              'start': 0,
+              'last_date': None}
+    if checkpoint is not None and _exists(checkpoint):
+      with open(checkpoint, 'r') as f:
+        state = load(f)
+      if state.get('query') == cursor['query']:
+        cursor = state
+
+    def _save_cursor(page):
+      self._persist(page)
+      if checkpoint is not None:
+        with open(checkpoint, 'w') as f:
+          dump(cursor, f)
+
+    page = []
+    query = self._aiter_query(search=search,
+                              start=cursor['start'],
+                              res_per_iter=res_per_iter)
+    try:
+      async for index, article in query:
+        date = article.date[:10]
+        if date < date_from:
+          break
+        last_date = cursor['last_date']
+        if date <= date_to and (last_date is None or article.date <= last_date):
+          page.append(article)
+          yield article
+          cursor['last_date'] = article.date
+        # Checkpoint once the consumer handled a complete page
+        if (index + 1) % res_per_iter == 0:
+          cursor['start'] = index + 1
+          _save_cursor(page)
+          page = []
+    finally:
+      await query.aclose()
+    # Range completed
+    self._persist(page)
+    if checkpoint is not None and _exists(checkpoint):
+      remove(checkpoint)
+
 
 if __name__ == '__main__':
 
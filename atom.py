@@ -0,0 +1,119 @@
+# coding=utf-8
+"""
+Incremental parser for the Atom feed returned by Arxiv API.
+
+The document is parsed while it is downloaded, entries are reported as soon as
+they are complete and discarded from the tree afterwards. Only the fields
+needed to build an `Article` are extracted.
+
+See:
+  - https://arxiv.org/help/api/user-manual#_details_of_atom_results_returned
+"""
+from time import monotonic
+from xml.etree.ElementTree import XMLPullParser
+from metrics import REGISTRY
+
+__author__ = 'Christophe Ecabert'
+
+
+_atom = '{http://www.w3.org/2005/Atom}'
+_arxiv = '{http://arxiv.org/schemas/atom}'
+_opensearch = '{http://a9.com/-/spec/opensearch/1.1/}'
+
+_entries = REGISTRY.counter('paperbot_entries_parsed_total',
+                            'Atom entries parsed')
+_parse_seconds = REGISTRY.histogram('paperbot_parse_seconds',
+                                    'Time spent parsing a page, download '
+                                    'excluded')
+
+
+def _text(elem, tag):
+  """
+  Text of the first child with a given tag
+  :param elem:  Parent element
+  :param tag:   Child's tag
+  :return:  str, empty if child is missing
+  """
+  child = elem.find(tag)
+  if child is None:
+    return ''
+  return child.text or ''
+
+
+def _to_entry(elem):
+  """
+  Extract entry's fields
+  :param elem:  `<entry>` element
+  :return:  dict, arguments of `Article`
+  """
+  link = ''
+  for child in elem.iterfind(_atom + 'link'):
+    if child.get('rel', 'alternate') == 'alternate':
+      link = child.get('href', '')
+      break
+  category = elem.find(_arxiv + 'primary_category')
+  return {'title': _text(elem, _atom + 'title'),
+          'authors': [_text(a, _atom + 'name')
+                      for a in elem.iterfind(_atom + 'author')],
+          'summary': _text(elem, _atom + 'summary'),
+          'date': _text(elem, _atom + 'published'),
+          'link': link or _text(elem, _atom + 'id'),
+          'category': category.get('term') if category is not None else None}
+
+
+class AtomParser:
+  """ Push parser for Arxiv Atom feed """
+
+  def __init__(self):
+    """ Constructor """
+    self._parser = XMLPullParser(events=('start', 'end'))
+    self._root = None
+    # Filled once `<opensearch:totalResults>` is parsed
+    self.total_results = None
+
+  def feed(self, data):
+    """
+    Parse a new chunk of the document
+    :param data:  bytes
+    :return:  List of entries completed by this chunk, see `_to_entry`
+    """
+    self._parser.feed(data)
+    entries = []
+    for event, elem in self._parser.read_events():
+      if event == 'start':
+        if self._root is None:
+          self._root = elem
+      elif elem.tag == _atom + 'entry':
+        # Arxiv reports query errors as an entry
+        if '/api/errors' not in _text(elem, _atom + 'id'):
+          entries.append(_to_entry(elem))
+        self._root.remove(elem)
+      elif elem.tag == _opensearch + 'totalResults':
+        self.total_results = int(elem.text)
+    return entries
+
+  def close(self):
+    """ Finish parsing """
+    self._parser.close()
+
+
+async def iter_entries(chunks, parser=None):
+  """
+  Parse a stream of chunks and yield entries as soon as they are available.
+  Stopping the iteration stops consuming `chunks`.
+  :param chunks:  Asynchronous iterator of bytes
+  :param parser:  AtomParser to use, optional
+  :return:  Asynchronous generator of entries, see `_to_entry`
+  """
+  parser = parser or AtomParser()
+  elapsed = 0.0
+  try:
+    async for chunk in chunks:
+      start = monotonic()
+      entries = parser.feed(chunk)
+      elapsed += monotonic() - start
+      _entries.inc(len(entries))
+      for entry in entries:
+        yield entry
+  finally:
+    _parse_seconds.observe(elapsed)
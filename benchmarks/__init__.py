@@ -0,0 +1,9 @@
+# coding=utf-8
+"""
+Offline benchmarks of the bot's pipeline.
+
+Run from the repository's root with `python -m benchmarks.run`. Arxiv and
+Slack are replaced by local servers, see `feeds`, `fake_arxiv` and
+`fake_slack`.
+"""
+__author__ = 'Christophe Ecabert'
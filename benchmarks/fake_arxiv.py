@@ -0,0 +1,128 @@
+# coding=utf-8
+"""
+Local stand-in for export.arxiv.org.
+
+Serves synthetic entries, see `feeds.make_entries`, filtered by category and
+submission date as arxiv does, with pagination and gzip compression. Latency
+and transient failures (503) can be injected.
+"""
+import gzip
+import random
+import re
+from threading import Lock, Thread
+from time import sleep
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+from benchmarks.feeds import render_feed
+
+__author__ = 'Christophe Ecabert'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+
+class FakeArxiv:
+  """ Arxiv API served from a background thread """
+
+  def __init__(self, entries, latency=0.0, error_rate=0.0, seed=0):
+    """
+    Constructor, starts serving right away
+    :param entries:     Entries served, most recent first
+    :param latency:     Delay before answering a request, in seconds
+    :param error_rate:  Probability of answering with a 503
+    :param seed:        Random seed for the failures
+    """
+    self.entries = entries
+    self.latency = latency
+    self.error_rate = error_rate
+    # Counters
+    self.requests = 0
+    self.errors = 0
+    self.bytes_sent = 0
+    self._rnd = random.Random(seed)
+    self._lock = Lock()
+    fake = self
+
+    class _Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_GET(self):
+        fake._handle(self)
+
+      def log_message(self, fmt, *args):
+        pass
+
+    self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    self._thread = Thread(target=self._server.serve_forever,
+                          name='fake_arxiv',
+                          daemon=True)
+    self._thread.start()
+
+  @property
+  def base_url(self):
+    """ Value to use for `arxiv._base_url` """
+    return 'http://127.0.0.1:{}/api/query?'.format(
+      self._server.server_address[1])
+
+  def close(self):
+    """ Stop serving """
+    self._server.shutdown()
+    self._server.server_close()
+
+  def _select(self, search_query):
+    """
+    Entries matching a query
+    :param search_query:  Decoded `search_query` parameter
+    :return:  List of entries
+    """
+    cats = set(re.findall(r'cat:([\w.\-]+)', search_query))
+    window = re.search(r'submittedDate:\[(\d{8})\d*\s+TO\s+(\d{8})\d*\]',
+                       search_query)
+    res = []
+    for e in self.entries:
+      if cats and not cats.intersection(e['categories']):
+        continue
+      if window is not None:
+        day = e['published'][:10].replace('-', '')
+        if not window.group(1) <= day <= window.group(2):
+          continue
+      res.append(e)
+    return res
+
+  def _handle(self, request):
+    """
+    Answer a query
+    :param request: BaseHTTPRequestHandler
+    """
+    with self._lock:
+      self.requests += 1
+      fail = self._rnd.random() < self.error_rate
+    if self.latency > 0.0:
+      sleep(self.latency)
+    if fail:
+      with self._lock:
+        self.errors += 1
+      request.send_response(503)
+      request.send_header('Retry-After', '1')
+      request.send_header('Content-Length', '0')
+      request.end_headers()
+      return
+    params = parse_qs(urlparse(request.path).query)
+    start = int(params.get('start', ['0'])[0])
+    max_results = int(params.get('max_results', ['10'])[0])
+    selected = self._select(params.get('search_query', [''])[0])
+    body = render_feed(selected[start:start + max_results],
+                       total_results=len(selected),
+                       start=start)
+    request.send_response(200)
+    request.send_header('Content-Type', 'application/atom+xml')
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+      body = gzip.compress(body, compresslevel=5)
+      request.send_header('Content-Encoding', 'gzip')
+    request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+    with self._lock:
+      self.bytes_sent += len(body)
@@ -0,0 +1,127 @@
+# coding=utf-8
+"""
+Local stand-in for Slack Web API.
+
+Accepts `chat.postMessage` calls and records the posted messages. Latency
+and rate limiting (429 with `Retry-After`) can be injected.
+"""
+import json
+import random
+from threading import Lock, Thread
+from time import sleep, monotonic
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+
+__author__ = 'Christophe Ecabert'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+
+class FakeSlack:
+  """ Slack Web API served from a background thread """
+
+  def __init__(self, latency=0.0, rate_limit_rate=0.0, retry_after=1,
+               seed=0):
+    """
+    Constructor, starts serving right away
+    :param latency:         Delay before answering a call, in seconds
+    :param rate_limit_rate: Probability of answering with a 429
+    :param retry_after:     `Retry-After` sent with 429, in seconds
+    :param seed:            Random seed for the rate limiting
+    """
+    self.latency = latency
+    self.rate_limit_rate = rate_limit_rate
+    self.retry_after = retry_after
+    # Recorded activity, tuple (monotonic time, channel, payload)
+    self.messages = []
+    self.rate_limited = 0
+    self._rnd = random.Random(seed)
+    self._lock = Lock()
+    fake = self
+
+    class _Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_POST(self):
+        fake._handle(self)
+
+      def log_message(self, fmt, *args):
+        pass
+
+    self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    self._thread = Thread(target=self._server.serve_forever,
+                          name='fake_slack',
+                          daemon=True)
+    self._thread.start()
+
+  @property
+  def base_url(self):
+    """ Value to use as `base_url` of a slack WebClient """
+    return 'http://127.0.0.1:{}/api/'.format(self._server.server_address[1])
+
+  def close(self):
+    """ Stop serving """
+    self._server.shutdown()
+    self._server.server_close()
+
+  @staticmethod
+  def _payload(request):
+    """
+    Decode call's arguments, sent as json or form
+    :param request: BaseHTTPRequestHandler
+    :return:  dict
+    """
+    length = int(request.headers.get('Content-Length', '0'))
+    raw = request.rfile.read(length).decode('utf-8')
+    if 'json' in request.headers.get('Content-Type', ''):
+      return json.loads(raw or '{}')
+    payload = {k: v[0] for k, v in parse_qs(raw).items()}
+    if 'blocks' in payload:
+      payload['blocks'] = json.loads(payload['blocks'])
+    return payload
+
+  def _reply(self, request, status, body, headers=()):
+    """
+    Send a json answer
+    :param request: BaseHTTPRequestHandler
+    :param status:  Http status
+    :param body:    dict
+    :param headers: Additional headers, list of (name, value)
+    """
+    data = json.dumps(body).encode('utf-8')
+    request.send_response(status)
+    request.send_header('Content-Type', 'application/json')
+    request.send_header('Content-Length', str(len(data)))
+    for name, value in headers:
+      request.send_header(name, value)
+    request.end_headers()
+    request.wfile.write(data)
+
+  def _handle(self, request):
+    """
+    Answer an API call
+    :param request: BaseHTTPRequestHandler
+    """
+    payload = self._payload(request)
+    if self.latency > 0.0:
+      sleep(self.latency)
+    if not request.path.endswith('/chat.postMessage'):
+      self._reply(request, 200, {'ok': True})
+      return
+    with self._lock:
+      limited = self._rnd.random() < self.rate_limit_rate
+      if limited:
+        self.rate_limited += 1
+      else:
+        self.messages.append((monotonic(), payload.get('channel'), payload))
+        ts = '{:.6f}'.format(len(self.messages))
+    if limited:
+      self._reply(request, 429, {'ok': False, 'error': 'ratelimited'},
+                  headers=[('Retry-After', str(self.retry_after))])
+      return
+    self._reply(request, 200, {'ok': True,
+                               'channel': payload.get('channel'),
+                               'ts': ts})
@@ -0,0 +1,141 @@
+# coding=utf-8
+"""
+Generator of synthetic Arxiv Atom feeds.
+
+Entries mimic the ones returned by export.arxiv.org: titles of a dozen words,
+abstracts of 150 to 250 words, up to 15 authors and cross-listed categories.
+Submission dates are spread over a number of days, most recent first, as
+returned by a query sorted by submission date.
+"""
+import random
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import escape
+
+__author__ = 'Christophe Ecabert'
+
+
+_words = ('neural', 'network', 'learning', 'deep', 'image', 'segmentation',
+          'transformer', 'attention', 'graph', 'model', 'training', 'data',
+          'representation', 'generative', 'adversarial', 'gan', 'diffusion',
+          'reconstruction', 'radiance', 'field', 'detection', 'tracking',
+          'pose', 'estimation', 'robust', 'efficient', 'sparse', 'dense',
+          'supervised', 'unsupervised', 'contrastive', 'video', 'depth',
+          'point', 'cloud', 'rendering', 'optimization', 'benchmark', 'loss',
+          'policy', 'reinforcement', 'language', 'vision', 'multimodal',
+          'inference', 'uncertainty', 'bayesian', 'kernel', 'convolutional',
+          'recurrent', 'face', 'recognition', 'synthesis', 'texture', 'mesh',
+          'we', 'propose', 'a', 'novel', 'method', 'for', 'the', 'of', 'and',
+          'with', 'on', 'results', 'show', 'outperforms', 'state', 'art')
+
+_names = ('Alice', 'Bob', 'Chen', 'Dmitri', 'Elena', 'Fatima', 'Giulia',
+          'Hiroshi', 'Ines', 'Jonas', 'Kavya', 'Lucas', 'Mei', 'Nadia',
+          'Omar', 'Priya', 'Quentin', 'Rosa', 'Sven', 'Tariq')
+_surnames = ('Smith', 'Wang', 'Müller', 'Rossi', 'Dubois', 'Kim', 'Silva',
+             'Ivanov', 'Nguyen', 'Garcia', 'Sato', 'Kowalski', 'Haddad',
+             'Ecabert', 'Novak', 'Jensen', 'Okafor', 'Singh', 'Moreau')
+
+DEFAULT_CATEGORIES = ('cs.CV', 'cs.AI', 'cs.LG', 'stat.ML', 'cs.GR')
+
+
+def _sentence(rnd, n_words):
+  """
+  Random sequence of words
+  :param rnd:     random.Random
+  :param n_words: Number of words
+  :return:  str
+  """
+  return ' '.join(rnd.choice(_words) for _ in range(n_words))
+
+
+def make_entries(n_entries,
+                 days=1,
+                 last_day=None,
+                 categories=DEFAULT_CATEGORIES,
+                 cross_list=0.3,
+                 seed=0):
+  """
+  Create synthetic entries, most recent submission first
+  :param n_entries:   Number of entries
+  :param days:        Number of submission days the entries are spread over
+  :param last_day:    Most recent submission date, defaults to yesterday
+  :param categories:  Categories entries are assigned to
+  :param cross_list:  Probability for an entry to be cross-listed
+  :param seed:        Random seed
+  :return:  List of dict with keys: id, title, summary, authors, published,
+            categories
+  """
+  rnd = random.Random(seed)
+  last_day = last_day or date.today() - timedelta(1)
+  last = datetime(last_day.year, last_day.month, last_day.day, 23, 59, 59)
+  span = days * 24 * 3600
+  step = span / max(n_entries, 1)
+  prefix = last_day.strftime('%y%m')
+  entries = []
+  for k in range(n_entries):
+    published = last - timedelta(seconds=int(k * step))
+    cats = [rnd.choice(categories)]
+    if rnd.random() < cross_list:
+      cats.append(rnd.choice(categories))
+    authors = ['{} {}'.format(rnd.choice(_names), rnd.choice(_surnames))
+               for _ in range(rnd.randint(1, 15))]
+    entries.append({'id': '{}.{:05d}'.format(prefix, k),
+                    'title': _sentence(rnd, rnd.randint(6, 15)).capitalize(),
+                    'summary': _sentence(rnd, rnd.randint(150, 250)) + '.',
+                    'authors': authors,
+                    'published': published.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    'categories': list(dict.fromkeys(cats))})
+  return entries
+
+
+def _entry_xml(entry):
+  """
+  Atom representation of an entry
+  :param entry: dict, see `make_entries`
+  :return:  str
+  """
+  url = 'http://arxiv.org/abs/{}v1'.format(entry['id'])
+  authors = ''.join('<author><name>{}</name></author>'.format(escape(a))
+                    for a in entry['authors'])
+  cats = ''.join('<category term="{}" '
+                 'scheme="http://arxiv.org/schemas/atom"/>'.format(c)
+                 for c in entry['categories'])
+  return ('<entry><id>{url}</id>'
+          '<updated>{date}</updated><published>{date}</published>'
+          '<title>{title}</title><summary>{summary}</summary>{authors}'
+          '<link href="{url}" rel="alternate" type="text/html"/>'
+          '<link title="pdf" href="{pdf}" rel="related" '
+          'type="application/pdf"/>'
+          '<arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom"'
+          ' term="{primary}" scheme="http://arxiv.org/schemas/atom"/>'
+          '{cats}</entry>\n').format(url=url,
+                                     pdf=url.replace('/abs/', '/pdf/'),
+                                     date=entry['published'],
+                                     title=escape(entry['title']),
+                                     summary=escape(entry['summary']),
+                                     authors=authors,
+                                     primary=entry['categories'][0],
+                                     cats=cats)
+
+
+def render_feed(entries, total_results=None, start=0):
+  """
+  Atom document for a page of results
+  :param entries:       Entries of the page
+  :param total_results: Number of results of the whole query, defaults to
+                        the number of entries
+  :param start:         Position of the first entry in the results
+  :return:  bytes
+  """
+  if total_results is None:
+    total_results = len(entries)
+  head = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+          '<title type="html">ArXiv Query</title>\n'
+          '<opensearch:totalResults '
+          'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{}'
+          '</opensearch:totalResults>\n'
+          '<opensearch:startIndex '
+          'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{}'
+          '</opensearch:startIndex>\n').format(total_results, start)
+  body = ''.join(_entry_xml(e) for e in entries)
+  return (head + body + '</feed>\n').encode('utf-8')
@@ -0,0 +1,258 @@
+# coding=utf-8
+"""
+Run the offline benchmarks and report throughput and latency of each stage.
+
+  python -m benchmarks.run [--entries 1000] [--latency 0.05] [--only parse]
+
+Every benchmark runs against local servers, nothing is sent to arxiv or
+Slack. Results can be saved as json to compare two revisions.
+"""
+import tempfile
+from argparse import ArgumentParser
+from collections import OrderedDict
+from datetime import datetime
+from functools import partial
+from json import dump
+from os.path import join as _join
+from statistics import median
+from threading import Lock
+from time import perf_counter
+from types import SimpleNamespace
+import arxiv
+from arxiv import ArxivParser, Search, Article
+from atom import AtomParser
+from bot import MessageDispatcher
+from index import SearchIndex
+from matcher import KeywordMatcher
+from outbox import Outbox
+from render import BlockRenderer
+from store import ArticleStore
+from benchmarks.feeds import make_entries, render_feed, DEFAULT_CATEGORIES
+from benchmarks.fake_arxiv import FakeArxiv
+from benchmarks.fake_slack import FakeSlack
+
+__author__ = 'Christophe Ecabert'
+
+
+def _timed(fn, repeat):
+  """
+  Run a function several times
+  :param fn:      Callable without argument
+  :param repeat:  Number of runs
+  :return:  Tuple (list of durations in seconds, last result)
+  """
+  durations = []
+  res = None
+  for _ in range(repeat):
+    start = perf_counter()
+    res = fn()
+    durations.append(perf_counter() - start)
+  return durations, res
+
+
+def _articles(entries):
+  """
+  Convert synthetic entries into articles, through the actual parser
+  :param entries: Entries, see `make_entries`
+  :return:  List of Article
+  """
+  parser = AtomParser()
+  return [Article(**e) for e in parser.feed(render_feed(entries))]
+
+
+def bench_search(args, entries):
+  """ Build and finalize daily searches """
+  n = 20000
+  day = ArxivParser._daily_submission_date()
+
+  def _run():
+    for k in range(n):
+      Search(search=list(DEFAULT_CATEGORIES), date_from=day).Finalize(
+        start=k, max_results=100)
+
+  durations, _ = _timed(_run, args.repeat)
+  return {'searches_per_s': n / median(durations)}
+
+
+def bench_parse(args, entries):
+  """ Parse result pages fed by 16KB chunks """
+  pages = [render_feed(entries[k:k + 100], len(entries), k)
+           for k in range(0, len(entries), 100)]
+  n_bytes = sum(len(p) for p in pages)
+
+  def _run():
+    n = 0
+    for page in pages:
+      parser = AtomParser()
+      for k in range(0, len(page), 16384):
+        n += len(parser.feed(page[k:k + 16384]))
+      parser.close()
+    return n
+
+  durations, n = _timed(_run, args.repeat)
+  t = median(durations)
+  return {'entries_per_s': n / t, 'mb_per_s': n_bytes / t / 1e6}
+
+
+def bench_match(args, entries):
+  """ Match articles against a keyword list """
+  articles = _articles(entries)
+  keywords = ['segmentation', '"neural radiance field"', 'diffus*',
+              'pose estimation', 'contrastive', 'point cloud', 'gan',
+              'mesh', 'bayesian', 'transformer*'] * (args.keywords // 10 + 1)
+  keywords = [kw if k < 10 else '{}{}'.format(kw, k)
+              for k, kw in enumerate(keywords[:args.keywords])]
+  matcher = KeywordMatcher(keywords)
+
+  def _run():
+    return sum(1 for art in articles if matcher.match(art))
+
+  durations, n_match = _timed(_run, args.repeat)
+  return {'articles_per_s': len(articles) / median(durations),
+          'matched': n_match,
+          'keywords': len(matcher)}
+
+
+def bench_query_daily(args, entries):
+  """ Download and parse today's submissions, `_query_daily_paper` """
+  server = FakeArxiv(entries,
+                     latency=args.latency,
+                     error_rate=args.error_rate,
+                     seed=args.seed)
+  arxiv._base_url = server.base_url
+  try:
+    def _run():
+      parser = ArxivParser(category=list(DEFAULT_CATEGORIES),
+                           wait_time=args.wait_time,
+                           sharded=args.sharded)
+      return parser, parser._query_daily_paper()
+
+    durations, (parser, articles) = _timed(_run, args.repeat)
+  finally:
+    server.close()
+  t = median(durations)
+  return {'seconds': t,
+          'articles': len(articles),
+          'articles_per_s': len(articles) / t,
+          'page_size': parser._sizer.size,
+          'requests': server.requests // args.repeat,
+          'errors': server.errors // args.repeat,
+          'bytes': server.bytes_sent // args.repeat}
+
+
+def bench_daily_search(args, entries):
+  """ Daily search with keyword matching, store and index, cold start """
+  server = FakeArxiv(entries, latency=args.latency, seed=args.seed)
+  arxiv._base_url = server.base_url
+  keywords = ['segmentation', 'diffus*', 'gan', '"point cloud"']
+  try:
+    def _run():
+      folder = tempfile.mkdtemp()
+      parser = ArxivParser(category=list(DEFAULT_CATEGORIES),
+                           wait_time=args.wait_time,
+                           store=ArticleStore(_join(folder, 'articles.db')),
+                           index=SearchIndex(_join(folder, 'index.db')),
+                           sharded=args.sharded)
+      return parser.run_daily_search(keywords)
+
+    durations, articles = _timed(_run, args.repeat)
+  finally:
+    server.close()
+  t = median(durations)
+  return {'seconds': t, 'matched': len(articles)}
+
+
+def bench_post(args, entries):
+  """ Render articles, pack them and post them to Slack, `_post_articles` """
+  articles = _articles(entries)
+  server = FakeSlack(latency=args.slack_latency,
+                     rate_limit_rate=args.slack_429,
+                     seed=args.seed)
+  outbox = Outbox(token='xoxb-benchmark',
+                  rate=args.slack_rate,
+                  backoff=0.1,
+                  base_url=server.base_url)
+  try:
+    def _run():
+      # Only the attributes used by `_post_articles`
+      dispatcher = SimpleNamespace(_renderer=BlockRenderer(),
+                                   _outbox=outbox,
+                                   _dedup=None,
+                                   _messages=OrderedDict(),
+                                   _messages_lock=Lock())
+      dispatcher._post_blocks = partial(MessageDispatcher._post_blocks,
+                                        dispatcher)
+      matchers = {'C{}'.format(k): KeywordMatcher() for k in range(2)}
+      MessageDispatcher._post_articles(dispatcher, matchers, articles)
+      # Messages of a channel are sent in order
+      for channel in matchers:
+        outbox.post(channel, text='done').result()
+
+    durations, _ = _timed(_run, args.repeat)
+  finally:
+    outbox.close()
+    server.close()
+  t = median(durations)
+  latencies = [b[0] - a[0] for a, b in zip(server.messages,
+                                           server.messages[1:])]
+  return {'seconds': t,
+          'articles_per_s': 2 * len(articles) / t,
+          'messages': len(server.messages) // args.repeat,
+          'median_gap_s': median(latencies) if latencies else 0.0,
+          'rate_limited': server.rate_limited}
+
+
+_benchmarks = {'search': bench_search,
+               'parse': bench_parse,
+               'match': bench_match,
+               'query_daily': bench_query_daily,
+               'daily_search': bench_daily_search,
+               'post': bench_post}
+
+
+if __name__ == '__main__':
+  p = ArgumentParser('PaperBot benchmarks')
+  p.add_argument('--only', type=str, nargs='+', choices=list(_benchmarks),
+                 default=list(_benchmarks), help='Benchmarks to run')
+  p.add_argument('--entries', type=int, default=1000,
+                 help='Number of synthetic entries')
+  p.add_argument('--days', type=int, default=3,
+                 help='Number of submission days the entries spread over')
+  p.add_argument('--keywords', type=int, default=50,
+                 help='Number of keywords for matching')
+  p.add_argument('--latency', type=float, default=0.05,
+                 help='Latency of the fake arxiv server, in seconds')
+  p.add_argument('--error_rate', type=float, default=0.0,
+                 help='Probability of a 503 from the fake arxiv server')
+  p.add_argument('--wait_time', type=float, default=0.0,
+                 help='Time between two arxiv requests, in seconds')
+  p.add_argument('--sharded', action='store_true',
+                 help='Search each category with its own query')
+  p.add_argument('--slack_latency', type=float, default=0.01,
+                 help='Latency of the fake Slack server, in seconds')
+  p.add_argument('--slack_429', type=float, default=0.0,
+                 help='Probability of a 429 from the fake Slack server')
+  p.add_argument('--slack_rate', type=float, default=0.0,
+                 help='Messages per second and channel, 0 for no limit')
+  p.add_argument('--repeat', type=int, default=3,
+                 help='Number of runs, the median is reported')
+  p.add_argument('--seed', type=int, default=0, help='Random seed')
+  p.add_argument('--output', type=str, default=None,
+                 help='Json file where to save the results')
+  args = p.parse_args()
+
+  last_day = datetime.strptime(ArxivParser._daily_submission_date(),
+                               '%Y-%m-%d').date()
+  entries = make_entries(args.entries,
+                         days=args.days,
+                         last_day=last_day,
+                         seed=args.seed)
+  results = {}
+  for name in args.only:
+    results[name] = _benchmarks[name](args, entries)
+    print('{:<14}'.format(name) +
+          '  '.join('{}={:.4g}'.format(k, v) if isinstance(v, float) else
+                    '{}={}'.format(k, v) for k, v in results[name].items()))
+  if args.output is not None:
+    with open(args.output, 'w') as f:
+      dump({'args': vars(args), 'results': results}, f, indent=2)
@@ -1,18 +1,73 @@
 # coding=utf-8
-from os import environ
+from os import environ, remove
 from os.path import join as _join
 from os.path import exists as _exists
-from re import compile as _re_compile
 from datetime import datetime
 from slack import RTMClient
 import asyncio
-import schedule
 from argparse import ArgumentParser
-from arxiv import ArxivParser
+from arxiv import ArxivParser, ArticleSpool, Search, feed_name
+from jobs import JobExecutor
+from fetcher import FetchError
+from store import ArticleStore
+from http_cache import ResponseCache
+from index import SearchIndex
+from subscriptions import Subscriptions, parse_subscription
+from collections import defaultdict, namedtuple, OrderedDict
+from outbox import Outbox
+from router import CommandRouter
+from render import BlockRenderer, BlockPacker, LinePacker
+from ranker import TfidfRanker
+from dedup import NearDuplicateIndex
+from scheduler import Scheduler
+from matcher import KeywordMatcher, parse_keywords, normalize_keyword
+import re
 from json import load, dump
+from threading import Lock
+from itertools import count
+from time import monotonic, time
+from metrics import REGISTRY, MetricsServer
 
 __author__ = 'Christophe Ecabert'
 
+# Daily search, every day at 9am. Searches can also follow arxiv's
+# announcements: `0 20 * * 0-4 America/New_York`
+_default_schedule = '0 9 * * *'
+# Daily search interrupted by arxiv errors, resumed later: delay of the first
+# attempt in seconds, doubled at every attempt
+_retry_delay = 600.0
+_max_deferrals = 3
+# Papers reacted to kept per channel, and messages whose papers are known
+_max_liked = 200
+_max_tracked_messages = 2000
+# Entries of a channel held back to gather near-duplicates
+_cluster_window = 20
+# Abstracts sent per reply in a thread, and how papers are referred to
+_max_abstracts = 5
+_paper_ref = re.compile(r'#(\d+)\b|\b(\d{4}\.\d{4,5}|'
+                        r'[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?\b')
+_entry_number = re.compile(r'\[(\d+)\]')
+# Part of an article shown in a digest
+_DigestItem = namedtuple('_DigestItem', ['arxiv_id', 'link', 'title'])
+_compact_header = ('_Reply in the thread with paper numbers, i.e. #3, or '
+                   'arXiv IDs to read their abstracts._')
+
+_match_seconds = REGISTRY.histogram('paperbot_match_seconds',
+                                    'Time spent matching an article against '
+                                    'the keywords of a channel',
+                                    buckets=(1e-5, 5e-5, 1e-4, 5e-4, 1e-3,
+                                             5e-3, 1e-2))
+_matches = REGISTRY.counter('paperbot_matches_total',
+                            'Articles matching the keywords of a channel, by '
+                            'channel')
+_search_seconds = REGISTRY.histogram('paperbot_daily_search_seconds',
+                                     'Duration of a daily search, fetch and '
+                                     'posting included',
+                                     buckets=(1.0, 5.0, 10.0, 30.0, 60.0,
+                                              120.0, 300.0, 600.0))
+_commands = REGISTRY.counter('paperbot_commands_total',
+                             'Commands received, by name')
+
 
 class BotCommand:
   """ Container for bot command """
@@ -37,34 +92,6 @@ class BotCommand:
     self._channel = channel
     self._web_client = web_client
 
-  @classmethod
-  def FromText(cls, search, payload):
-    """
-    Construct command from a regex + payload
-    :param search:    Regex object to look for commands
-    :param payload:   Message payloads
-    :return:  BotCommand object.
-    """
-    #  Access data
-    data = payload.get('data', None)
-    text = data.get('text', None)
-    web_client = payload.get('web_client', None)
-    #  Bot is mentionned ?
-    if text:
-      res = search.search(text)
-      if res:
-        #  Detect command
-        channel_id = data.get('channel', None)
-        user = data.get('user', None)
-        cmd = res.groups()[1]
-        args = None if len(res.groups()) == 2 else res.groups()[2]
-        return cls(command=cmd,
-                   args=args,
-                   user=user,
-                   channel=channel_id,
-                   web_client=web_client)
-    return cls(web_client=web_client)
-
   @property
   def cmd(self):
       return self._cmd
@@ -94,33 +121,135 @@ class MessageDispatcher:
   def __init__(self,
                token,
                channel,
-               cache):
+               cache,
+               http_cache_ttl=6 * 3600.0,
+               sharded=None,
+               metrics_port=None,
+               memory_budget=None,
+               dedup_threshold=0.7):
     """
     Constructor
     :param token: Authentification token for bot
-    :param channel: Name of the channel where the bot is hosted
+    :param channel: Name, or list of names, of the channels where the bot is
+                    hosted
     :param cache:   Location where to cache data
+    :param http_cache_ttl:  Time during which arxiv responses are served from
+                            the cache, in seconds
+    :param sharded: If True, categories are searched concurrently, one query
+                    per category. Saved value, or False, if None
+    :param metrics_port:  Port where metrics are served on localhost,
+                          disabled if None
+    :param memory_budget: Memory allowed for the articles of a daily search
+                          kept for later, in MB. Spilled to disk beyond.
+                          Saved value, or 32MB, if None
+    :param dedup_threshold: Similarity of the summaries above which articles
+                            are posted as near-duplicates, disabled if 0
     """
-    #  Bot mention detection
-    self._self_mention = None
-    self._channel = channel
+    self._channels = [channel] if isinstance(channel, str) else list(channel)
     self._bot_id = None
+    self._token = token
+    # Outgoing messages
+    self._outbox = Outbox(token=token)
+    self._renderer = BlockRenderer()
 
     # Commands
+    # Default keywords, for channels without their own
     self._keywords = []
-    self._authors = []
-    self._known_cmd = {'help': (self._help_callback, ''),
-                       'list_keywords': (self._list_keyords_callback,
-                                         ''),
-                       'add_keywords': (self._add_keyords_callback,
-                                        'List of space separated keywords '
-                                        'to add'),
-                       'run_daily_arxiv_search': (self._run_daily_arxiv_search,
-                                                  '')}
+    # Per channel configuration, channel -> {'categories': list,
+    # 'keywords': list}, both optional
+    self._channel_cfg = {}
+    self._matchers = {}
+    self._subscriptions = Subscriptions()
+    # Commands addressed to the bot. Short handlers run on Slack's event
+    # loop, the blocking ones in a thread pool
+    self._router = CommandRouter(notify=self._command_feedback)
+    self._router.add('help', self._help_callback)
+    self._router.add('list_keywords', self._list_keyords_callback)
+    self._router.add('add_keywords',
+                     self._add_keyords_callback,
+                     'List of space separated keywords to add, "quoted '
+                     'phrase" or prefix*')
+    self._router.add('categories',
+                     self._categories_callback,
+                     'List of space separated arxiv categories searched for '
+                     'the channel, i.e. cs.CV cs.LG')
+    self._router.add('run_daily_arxiv_search', self._run_daily_arxiv_search)
+    self._router.add('backfill',
+                     self._backfill_callback,
+                     'Search past submissions, <YYYY-MM-DD> [<YYYY-MM-DD>]')
+    self._router.add('subscribe',
+                     self._subscribe_callback,
+                     'Follow keywords or authors in a daily direct message, '
+                     '<keywords> author:"<name>"')
+    self._router.add('unsubscribe',
+                     self._unsubscribe_callback,
+                     'Stop following keywords or authors, everything if '
+                     'empty')
+    self._router.add('search',
+                     self._search_callback,
+                     'Search articles seen so far, <terms>',
+                     timeout=20.0,
+                     max_concurrency=2,
+                     blocking=True)
+    self._router.add('schedule',
+                     self._schedule_callback,
+                     'List daily searches of the channel, add or remove one '
+                     'with `add|remove <minute> <hour> <day> <month> '
+                     '<weekday> [<timezone>]`')
+    self._router.add('rank',
+                     self._rank_callback,
+                     'Post only the <k> most relevant papers of the daily '
+                     'search, ranked against the keywords and the papers '
+                     'reacted to, `<k>|off`')
+    self._router.add('compact',
+                     self._compact_callback,
+                     'Post the daily papers as one line each, abstracts are '
+                     'sent on reply in the thread, `on|off`')
+    self._router.add('stats',
+                     self._stats_callback,
+                     'Summary of fetch, parse, match and post metrics')
+    self._router.add('status',
+                     self._status_callback,
+                     'List running and recent background jobs')
+    # Metrics endpoint
+    self._metrics_server = None
+    if metrics_port is not None:
+      self._metrics_server = MetricsServer(port=metrics_port)
+    # Background jobs, keep slack's event loop free
+    self._jobs = JobExecutor(max_workers=1, max_queued=8)
+    # Daily searches, channel -> list of cron-like expressions. Host channels
+    # without any entry get the default schedule
+    self._scheduler = Scheduler()
+    self._schedules = None
+    self._schedule_ids = {}
+    # Daily searches pending, key -> (Job, channels waiting for the results)
+    self._daily_lock = Lock()
+    self._daily_pending = {}
+    self._daily_ids = count(1)
+    # Articles already sent to subscribers, user -> (date, ids)
+    self._digested = {}
+    # Articles already posted by daily searches, channel -> (date,
+    # dict ID -> entry number)
+    self._posted = {}
+    # Daily searches deferred after an error, feed -> (date, attempts)
+    self._deferred = {}
+    # Papers of the messages posted, (channel, ts) -> (dict entry number ->
+    # ID, compact), to trace reactions and answer replies in threads
+    self._messages = OrderedDict()
+    self._messages_lock = Lock()
 
     # Arxiv wrapper
     self._cache_folder = cache
     self._arxiv_cfg = _join(self._cache_folder, 'arxiv.cfg')
+    self._store = ArticleStore(_join(self._cache_folder, 'articles.db'))
+    self._http_cache = ResponseCache(_join(self._cache_folder, 'http'),
+                                     ttl=http_cache_ttl)
+    self._index = SearchIndex(_join(self._cache_folder, 'index.db'))
+    self._dedup = None
+    if dedup_threshold > 0.0:
+      self._dedup = NearDuplicateIndex(_join(self._cache_folder,
+                                             'duplicates.db'),
+                                       threshold=dedup_threshold)
     if not _exists(self._arxiv_cfg):
       # cs.CV: Compute Vision
       # cs.AI: Artificial Inteligence
@@ -131,12 +260,32 @@ class MessageDispatcher:
                                           'cs.AI',
                                           'cs.LG',
                                           'stat.ML',
-                                          'cs.GR'])
+                                          'cs.GR'],
+                                store=self._store,
+                                cache=self._http_cache,
+                                index=self._index)
       self._arxiv.save_config(self._arxiv_cfg)
     else:
-      self._arxiv = ArxivParser.from_config(self._arxiv_cfg)
-    # Reload authors/keywords
+      self._arxiv = ArxivParser.from_config(self._arxiv_cfg,
+                                            store=self._store,
+                                            cache=self._http_cache,
+                                            index=self._index)
+    # Given values replace the saved ones, kept for the next start
+    if sharded is not None or memory_budget is not None:
+      if sharded is not None:
+        self._arxiv.sharded = sharded
+      if memory_budget is not None:
+        self._arxiv.memory_budget = int(memory_budget * 2 ** 20)
+      self._arxiv.save_config(self._arxiv_cfg)
+    # Category set -> ArxivParser, share a single rate limit
+    self._parsers = {self._arxiv.feed: self._arxiv}
+    # Reload keywords and subscriptions
     self._load_config(self._cache_folder)
+    # Index articles stored before the search index existed
+    if len(self._index) == 0 and len(self._store) > 0:
+      self._jobs.submit('build_index',
+                        'Build search index',
+                        lambda: self._index.add(self._store.iter_all()))
     #  Create client, define message callback + start service
     # run aynchronously
     # https://github.com/slackapi/python-slackclient/blob/master/tutorial/PythOnBoardingBot/async_app.py
@@ -147,12 +296,18 @@ class MessageDispatcher:
     self.client = RTMClient(token=token, run_async=True, loop=loop)
     self.client.on(event='open', callback=self.open_callback)
     self.client.on(event='message', callback=self.message_callback)
-    loop.run_until_complete(asyncio.gather(self._daily_scheduler(token),
+    self.client.on(event='reaction_added', callback=self.reaction_callback)
+    loop.run_until_complete(asyncio.gather(self._scheduler.run(),
                                            self.client.start()))
     loop.close()
 
   def __del__(self):
     self._save_config(self._cache_folder)
+    self._router.shutdown()
+    self._jobs.shutdown(wait=False)
+    self._outbox.close()
+    if self._metrics_server is not None:
+      self._metrics_server.close()
 
   def _save_config(self, filename):
     """
@@ -161,7 +316,9 @@ class MessageDispatcher:
     """
     with open(_join(filename, 'bot.cfg'), 'w') as f:
       cfg = {'keywords': self._keywords,
-             'authors': self._authors}
+             'channels': self._channel_cfg,
+             'subscriptions': self._subscriptions.to_dict(),
+             'schedules': self._schedules}
       dump(cfg, f)
 
   def _load_config(self, filename):
@@ -174,29 +331,121 @@ class MessageDispatcher:
       with open(fname, 'r') as f:
         cfg = load(f)
         self._keywords = cfg['keywords']
-        self._authors = cfg['authors']
+        self._channel_cfg = cfg.get('channels', {})
+        self._subscriptions = Subscriptions(cfg.get('subscriptions', {}))
+        self._schedules = cfg.get('schedules', None)
+      # Bot-wide authors of older configurations are followed by the host
+      # channels, their digest is posted there
+      authors = cfg.get('authors', [])
+      if authors:
+        for channel in self._channels:
+          self._subscriptions.subscribe(channel, authors=authors)
+        self._save_config(filename)
+    self._matchers = {}
 
-  async def _daily_scheduler(self, token):
+  def _channel_categories(self, channel):
     """
-    Post request to trigger daily search
-    :param token: Slack bot's token
+    Arxiv categories searched for a channel
+    :param channel: Channel ID
+    :return:  List of categories
     """
+    categories = self._channel_cfg.get(channel, {}).get('categories', None)
+    return categories or self._arxiv.category
 
-    # Create scheduled function
-    def _start_daily_search():
-      """
-      Trigger daily search by posting message to Slack Bot
-      :param client: Slack webclient to post messages
-      """
-      cmd = '<@{}> run_daily_arxiv_search'.format(self._bot_id)
-      self.client._web_client.chat_postMessage(channel=self._channel, text=cmd)
+  def _channel_keywords(self, channel):
+    """
+    Keywords of interest of a channel, default ones if not configured
+    :param channel: Channel ID
+    :return:  List of keywords
+    """
+    return self._channel_cfg.get(channel, {}).get('keywords', self._keywords)
 
-    # Add callback to scheduler
-    schedule.every().day.at('09:00').do(_start_daily_search)
-    # Start loop
-    while True:
-      schedule.run_pending()  # Run pending job
-      await asyncio.sleep(5)  # Sleep for 5'
+  def _channel_matcher(self, channel):
+    """
+    Compiled keywords of a channel
+    :param channel: Channel ID
+    :return:  KeywordMatcher
+    """
+    matcher = self._matchers.get(channel, None)
+    if matcher is None:
+      matcher = KeywordMatcher(self._channel_keywords(channel))
+      self._matchers[channel] = matcher
+    return matcher
+
+  def _channel_ranker(self, channel):
+    """
+    Ranking of the daily papers of a channel
+    :param channel: Channel ID
+    :return:  Tuple (TfidfRanker, k) or None if papers are not ranked
+    """
+    cfg = self._channel_cfg.get(channel, {})
+    k = cfg.get('top_k', None)
+    if k is None:
+      return None
+    liked = [self._store.get(arxiv_id) for arxiv_id in cfg.get('liked', [])]
+    ranker = TfidfRanker(keywords=self._channel_keywords(channel),
+                         liked=[art for art in liked if art is not None])
+    return ranker, k
+
+  def _channel_compact(self, channel):
+    """
+    Check if the papers of a channel are posted one line each
+    :param channel: Channel ID
+    :return:  bool
+    """
+    return self._channel_cfg.get(channel, {}).get('compact', False)
+
+  def _parser(self, categories):
+    """
+    Arxiv wrapper for a set of categories, created on first use
+    :param categories:  List of categories
+    :return:  ArxivParser
+    """
+    feed = feed_name(categories)
+    parser = self._parsers.get(feed, None)
+    if parser is None:
+      parser = self._arxiv.for_category(categories)
+      self._parsers[feed] = parser
+    return parser
+
+  def _start_schedules(self, host_channels):
+    """
+    Register daily searches with the scheduler
+    :param host_channels: IDs of the channels where the bot is hosted
+    """
+    if self._schedules is None:
+      self._schedules = {}
+    # Host channels never configured get the default schedule, removed
+    # schedules are kept as an empty list
+    added = False
+    for c in host_channels:
+      if c not in self._schedules:
+        self._schedules[c] = [_default_schedule]
+        added = True
+    if added:
+      self._save_config(self._cache_folder)
+    for channel, exprs in self._schedules.items():
+      for expr in exprs:
+        key = (channel, expr)
+        if key in self._schedule_ids:
+          continue
+        try:
+          self._schedule_ids[key] = self._scheduler.add(expr,
+                                                        self._scheduled_search,
+                                                        channel)
+        except ValueError as e:
+          print('Invalid schedule for {}: {}'.format(channel, e))
+
+  def _scheduled_search(self, channel):
+    """
+    Start daily search when a schedule fires, runs on the event loop
+    :param channel: Channel where to post the results
+    """
+    try:
+      self._queue_daily_search(channel)
+    except RuntimeError as e:
+      self._outbox.post(channel,
+                        text='Scheduled search not started: {}'.format(e))
 
   def open_callback(self, **payload):
     """
@@ -211,45 +460,124 @@ class MessageDispatcher:
       # Retrive channels info
       res = web_client.conversations_list()
       channels = res['channels']
-      host_chan = self._channel[1:] if self._channel[0] == '#' else self._channel
+      host_chans = [c[1:] if c[0] == '#' else c for c in self._channels]
+      host_ids = []
       for c in channels:
-        if c['name'] == host_chan:
-          web_client.chat_postMessage(channel=c['id'],
-                                      text='PaperBot is now online.')
-          break
+        if c['name'] in host_chans:
+          self._outbox.post(c['id'], text='PaperBot is now online.')
+          host_ids.append(c['id'])
+      self._start_schedules(host_channels=host_ids)
 
-  def message_callback(self, **payload):
+  async def message_callback(self, **payload):
     """
-    Callback invoked when message is send to the channel
+    Callback invoked when message is send to the channel, executed on Slack's
+    event loop. Messages not addressed to the bot are dropped before parsing.
     :param payload: Message payload
     """
-    cmd = BotCommand.FromText(search=self._self_mention, payload=payload)
-    if cmd.cmd:
-      cb = self._known_cmd.get(cmd.cmd, None)
-      if cb is not None:
-        cb[0](cmd=cmd)
+    data = payload.get('data', None) or {}
+    route = self._router.route(data.get('text', None))
+    if route is None:
+      thread_ts = data.get('thread_ts', None)
+      # Replies of bots, this one included, are ignored
+      if thread_ts is not None and thread_ts != data.get('ts', None) and \
+              'subtype' not in data and 'bot_id' not in data and \
+              data.get('user', None) != self._bot_id:
+        self._abstract_reply(data.get('channel', None),
+                             thread_ts,
+                             data.get('text', None) or '')
+      return
+    cmd = BotCommand(command=route[0],
+                     args=route[1],
+                     user=data.get('user', None),
+                     channel=data.get('channel', None),
+                     web_client=payload.get('web_client', None))
+    if cmd.cmd in self._router:
+      _commands.inc(command=cmd.cmd)
+      self._router.dispatch(cmd.cmd, cmd)
+    else:
+      self._boilerplate_callback(cmd=cmd)
+
+  def _command_feedback(self, cmd, text):
+    """
+    Tell the user about a command rejected, timed out or failed
+    :param cmd:   Command
+    :param text:  Message
+    """
+    if cmd.user is not None:
+      text = '<@{}> {}'.format(cmd.user, text)
+    self._outbox.post(cmd.channel, text=text)
+
+  async def reaction_callback(self, **payload):
+    """
+    Callback invoked when a reaction is added, executed on Slack's event
+    loop. The paper of the message reacted to joins the interest profile of
+    the channel, see `rank`. Reactions apply to whole messages, the ones
+    holding several papers are ignored.
+    :param payload: Reaction payload
+    """
+    data = payload.get('data', None) or {}
+    item = data.get('item', None) or {}
+    if item.get('type', None) != 'message' or data.get('user') == self._bot_id:
+      return
+    channel = item.get('channel', None)
+    with self._messages_lock:
+      entries, _ = self._messages.get((channel, item.get('ts', None)),
+                                      (None, False))
+    if entries is None or len(entries) != 1:
+      return
+    ids = list(entries.values())
+    cfg = self._channel_cfg.setdefault(channel, {})
+    liked = [i for i in cfg.get('liked', []) if i not in ids] + ids
+    cfg['liked'] = liked[-_max_liked:]
+    self._save_config(self._cache_folder)
+
+  def _abstract_reply(self, channel, thread_ts, text):
+    """
+    Answer a reply in the thread of a compact message listing papers with
+    their abstracts, served from the store. Papers are referred to by their
+    number in the list, `#3`, or their arxiv ID.
+    :param channel:   Channel ID
+    :param thread_ts: Timestamp of the message the thread belongs to
+    :param text:      Reply
+    """
+    with self._messages_lock:
+      entries, compact = self._messages.get((channel, thread_ts),
+                                            (None, False))
+    if not compact:
+      return
+    refs = []
+    for number, arxiv_id in _paper_ref.findall(text):
+      ref = entries.get(int(number), None) if number else arxiv_id
+      if ref is not None and ref not in refs:
+        refs.append(ref)
+    numbers = {arxiv_id: k for k, arxiv_id in entries.items()}
+    blocks = []
+    for arxiv_id in refs[:_max_abstracts]:
+      art = self._store.get(arxiv_id)
+      if art is None:
+        blocks.append({'type': 'section',
+                       'text': {'type': 'mrkdwn',
+                                'text': '`{}` is not known'.format(arxiv_id)}})
       else:
-        self._boilerplate_callback(cmd=cmd)
+        blocks.extend(self._renderer.blocks(art,
+                                            numbers.get(arxiv_id, arxiv_id)))
+    if blocks:
+      self._outbox.post(channel, blocks=blocks, thread_ts=thread_ts)
 
   def _initialize_self_mention(self, client):
     """
     Initialize self mention detection
     :param client:  Web client passed to through the message
     """
-
-    #  Build regex to detect when bot is mentionned in the message and reach to
-    #  the command.
-    #  Retrieve bot ID first
+    #  Bot should react at: @<BotID> <command> but not to <...> @<BotID> <...>
+    #  Retrieve bot ID first
     r = client.auth_test()
     if r['ok']:
       bot_id = r['user_id']
     else:
-      #  Something went wrong
+      #  Something went wrong
       raise RuntimeError('Could not retrive bot ID: {}'.format(r['error']))
-
-    # Bot should react at: @<BotID> <command> but not to <...> @<BotID> <...>
-    # self._self_mention = _re_compile(r"^<@{}>".format(bot_id))
-    self._self_mention = _re_compile(r"^(<@\w*>) (\w*) ?(.*)".format(bot_id))
+    self._router.set_mention(bot_id)
 
   def _boilerplate_callback(self, cmd):
     """
@@ -263,7 +591,7 @@ class MessageDispatcher:
     else:
       msg = 'Sorry <@{}>, the command is *unrecognized*, '.format(cmd.user)
     msg += 'here is a list of all _known_ commands:\n'
-    for k in self._known_cmd.keys():
+    for k, _ in self._router.commands():
       msg += '• {}\n'.format(k)
 
     # Insert into blocks in order to have markdown formatting
@@ -271,9 +599,7 @@ class MessageDispatcher:
               'text': {'type': 'mrkdwn',
                        'text': msg}}
     # Post on chat
-    client = cmd.client
-    client.chat_postMessage(channel=cmd.channel,
-                            blocks=[blocks])
+    self._outbox.post(cmd.channel, blocks=[blocks])
 
   def _help_callback(self, cmd):
     """
@@ -285,31 +611,36 @@ class MessageDispatcher:
     else:
       msg = 'Hi <@{}>, here is a list of all recognized '\
             'commands\n'.format(cmd.user)
-    for k, v in self._known_cmd.items():
-      line = ('• {}\n'.format(k) if v[1] == '' else
-              '• {}    {}\n'.format(k, v[1]))
+    for k, v in self._router.commands():
+      line = ('• {}\n'.format(k) if v == '' else
+              '• {}    {}\n'.format(k, v))
       msg += line
     # Insert into blocks in order to have markdown formatting
     blocks = {'type': 'section',
               'text': {'type': 'mrkdwn',
                        'text': msg}}
-    cmd.client.chat_postMessage(channel=cmd.channel, blocks=[blocks])
+    self._outbox.post(cmd.channel, blocks=[blocks])
 
   def _add_keyords_callback(self, cmd):
     """
     Add new keyword
     :param cmd: Command
     """
-    new_kw = cmd.args.split(' ')
+    new_kw = parse_keywords(cmd.args)
+    cfg = self._channel_cfg.setdefault(cmd.channel, {})
+    keywords = list(self._channel_keywords(cmd.channel))
     for kw in new_kw:
-      kw = kw.lower()
-      if kw not in self._keywords:
-        self._keywords.append(kw)
+      kw = normalize_keyword(kw)
+      if kw and kw not in keywords:
+        keywords.append(kw)
+    cfg['keywords'] = keywords
+    # Keyword set changed, recompile matcher
+    self._matchers.pop(cmd.channel, None)
     # Save
     self._save_config(self._cache_folder)
     # User feedback
     msg = 'Added following keywords: {}'.format(new_kw)
-    cmd.client.chat_postMessage(channel=cmd.channel, text=msg)
+    self._outbox.post(cmd.channel, text=msg)
 
   def _list_keyords_callback(self, cmd):
     """
@@ -317,53 +648,707 @@ class MessageDispatcher:
     :param cmd: Command
     """
     msg = 'List of _keywords_ of interest:\n'
-    for kw in self._keywords:
+    for kw in self._channel_keywords(cmd.channel):
       msg += '• {}\n'.format(kw)
     # Insert into blocks in order to have markdown formatting
     blocks = {'type': 'section',
               'text': {'type': 'mrkdwn',
                        'text': msg}}
-    cmd.client.chat_postMessage(channel=cmd.channel, blocks=[blocks])
+    self._outbox.post(cmd.channel, blocks=[blocks])
+
+  def _categories_callback(self, cmd):
+    """
+    Set arxiv categories searched for the channel, list them if no argument
+    is given
+    :param cmd: Command
+    """
+    categories = (cmd.args or '').split()
+    if categories:
+      try:
+        # Check the categories can be searched
+        Search(search=categories)
+      except RuntimeError as e:
+        self._outbox.post(cmd.channel, text=str(e))
+        return
+      cfg = self._channel_cfg.setdefault(cmd.channel, {})
+      cfg['categories'] = sorted(set(categories))
+      self._save_config(self._cache_folder)
+    msg = 'Arxiv categories searched: {}'.format(
+      ', '.join(self._channel_categories(cmd.channel)))
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _rank_callback(self, cmd):
+    """
+    Rank the daily papers of the channel and post only the most relevant
+    ones, `rank <k>`. `rank off` posts every match in submission order again
+    :param cmd: Command
+    """
+    arg = (cmd.args or '').strip()
+    cfg = self._channel_cfg.setdefault(cmd.channel, {})
+    if arg == 'off':
+      cfg.pop('top_k', None)
+      self._save_config(self._cache_folder)
+    elif arg:
+      try:
+        k = int(arg)
+        if k <= 0:
+          raise ValueError('k must be positive')
+      except ValueError:
+        self._outbox.post(cmd.channel, text='Usage: rank <k>|off')
+        return
+      cfg['top_k'] = k
+      self._save_config(self._cache_folder)
+    n_liked = len(cfg.get('liked', []))
+    if cfg.get('top_k', None) is None:
+      msg = ('Daily papers are posted in submission order, ranking is off '
+             '({} papers reacted to).'.format(n_liked))
+    else:
+      msg = ('Daily search posts the *{}* most relevant papers, ranked '
+             'against the keywords and {} papers reacted to.'.format(
+              cfg['top_k'], n_liked))
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _compact_callback(self, cmd):
+    """
+    Post the daily papers of the channel as one line each, `compact on|off`
+    :param cmd: Command
+    """
+    arg = (cmd.args or '').strip()
+    cfg = self._channel_cfg.setdefault(cmd.channel, {})
+    if arg in ('on', 'off'):
+      cfg['compact'] = arg == 'on'
+      self._save_config(self._cache_folder)
+    elif arg:
+      self._outbox.post(cmd.channel, text='Usage: compact on|off')
+      return
+    if cfg.get('compact', False):
+      msg = ('Daily papers are posted one line each, reply in the thread '
+             'with their number, i.e. #3, or arXiv ID to read the '
+             'abstracts.')
+    else:
+      msg = 'Daily papers are posted with their abstract.'
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _status_callback(self, cmd):
+    """
+    List background jobs
+    :param cmd: Command
+    """
+    jobs = self._jobs.status()
+    if len(jobs) == 0:
+      msg = 'No background job.'
+    else:
+      msg = 'Background jobs:\n'
+      for job in jobs:
+        msg += '• {}\n'.format(job.describe())
+    stats = self._http_cache.stats()
+    msg += ('\nHTTP cache: {hits} hits, {misses} misses, {revalidated} '
+            'revalidated, {evictions} evictions, {entries} entries '
+            '({size} bytes)'.format(**stats))
+    blocks = {'type': 'section',
+              'text': {'type': 'mrkdwn',
+                       'text': msg}}
+    self._outbox.post(cmd.channel, blocks=[blocks])
+
+  def _stats_callback(self, cmd):
+    """
+    Summarize metrics, counters are reported as totals and histograms as
+    number of observations with their average
+    :param cmd: Command
+    """
+    msg = 'Metrics since startup:\n'
+    for metric in REGISTRY.metrics():
+      name = metric.name.replace('paperbot_', '')
+      if metric.kind == 'counter':
+        msg += '• {}: {:g}\n'.format(name, metric.total())
+      else:
+        n = metric.count()
+        avg = metric.sum() / n if n else 0.0
+        msg += '• {}: {} observed, avg {:.4g}\n'.format(name, n, avg)
+    blocks = {'type': 'section',
+              'text': {'type': 'mrkdwn',
+                       'text': msg}}
+    self._outbox.post(cmd.channel, blocks=[blocks])
+
+  def _search_callback(self, cmd):
+    """
+    Search the local index of articles
+    :param cmd: Command
+    """
+    if not cmd.args:
+      self._outbox.post(cmd.channel,
+                        text='Usage: search <terms>')
+      return
+    results = self._index.search(cmd.args, limit=10)
+    articles = [self._store.get(arxiv_id) for arxiv_id, _ in results]
+    articles = [art for art in articles if art is not None]
+    if len(articles) == 0:
+      msg = 'No article matching _{}_'.format(cmd.args)
+    else:
+      msg = 'Best matches for _{}_:\n'.format(cmd.args)
+      for k, art in enumerate(articles):
+        msg += '{}. *<{}|{}>* - {} ({})\n'.format(k + 1,
+                                                  art.link,
+                                                  art.title,
+                                                  ', '.join(art.authors[:3]),
+                                                  art.date[:10])
+    blocks = {'type': 'section',
+              'text': {'type': 'mrkdwn',
+                       'text': msg}}
+    self._outbox.post(cmd.channel, blocks=[blocks])
 
   def _run_daily_arxiv_search(self, cmd):
     """
-    Run daily arxiv search for new papers
+    Queue daily arxiv search for new papers. Searches triggered for the same
+    day and channel while one is pending are merged together.
     :param cmd: Command
     """
-    articles = self._arxiv.run_daily_search(self._keywords)
-    # Format output similar to slack's block kit template
-    # Header
-    msg = 'Found *{} papers* on Arxiv, {}'.format(len(articles),
-                                                  datetime.today().strftime('%Y-%m-%d'))
+    try:
+      job, created = self._queue_daily_search(cmd.channel)
+    except RuntimeError as e:
+      self._outbox.post(cmd.channel,
+                        text='Search not started: {}'.format(e))
+      return
+    if created:
+      msg = 'Daily search queued, job #{}'.format(job.id)
+    else:
+      msg = 'Daily search already {}, job #{}'.format(job.state, job.id)
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _queue_daily_search(self, channel):
+    """
+    Submit daily search job. Channels searching the same categories share a
+    single job as long as it has not completed.
+    :param channel: Channel where to post the results
+    :return:  Tuple (Job, created)
+    """
+    today = datetime.today().strftime('%Y-%m-%d')
+    categories = self._channel_categories(channel)
+    key = 'run_daily_arxiv_search:{}:{}'.format(feed_name(categories), today)
+    with self._daily_lock:
+      pending = self._daily_pending.get(key, None)
+      if pending is not None:
+        pending[1].add(channel)
+        return pending[0], False
+      # Never coalesced with a job about to complete
+      job, created = self._jobs.submit('{}:{}'.format(key,
+                                                      next(self._daily_ids)),
+                                       'Daily search {}'.format(today),
+                                       self._daily_arxiv_search_job,
+                                       daily_key=key,
+                                       categories=categories)
+      self._daily_pending[key] = (job, {channel})
+    return job, created
+
+  def _schedule_callback(self, cmd):
+    """
+    List, add or remove daily searches of a channel
+    :param cmd: Command
+    """
+    action, _, expr = (cmd.args or '').strip().partition(' ')
+    expr = ' '.join(expr.split())
+    schedules = self._schedules
+    if schedules is None:
+      schedules = {}
+    exprs = schedules.get(cmd.channel, [])
+    key = (cmd.channel, expr)
+    if action == 'add':
+      try:
+        sid = self._scheduler.add(expr, self._scheduled_search, cmd.channel)
+      except ValueError as e:
+        self._outbox.post(cmd.channel,
+                          text='Invalid schedule: {}'.format(e))
+        return
+      if key in self._schedule_ids:
+        self._scheduler.remove(self._schedule_ids[key])
+      else:
+        exprs.append(expr)
+      self._schedule_ids[key] = sid
+    elif action == 'remove':
+      if expr not in exprs:
+        self._outbox.post(cmd.channel,
+                          text='Unknown schedule: `{}`'.format(expr))
+        return
+      exprs.remove(expr)
+      self._scheduler.remove(self._schedule_ids.pop(key))
+    elif action:
+      self._outbox.post(cmd.channel,
+                        text='Usage: schedule [add|remove <schedule>]')
+      return
+    if action:
+      schedules[cmd.channel] = exprs
+      self._schedules = schedules
+      self._save_config(self._cache_folder)
+    if len(exprs) == 0:
+      msg = 'No daily search scheduled in this channel.'
+    else:
+      msg = 'Daily searches:\n'
+      for expr in exprs:
+        deadline = self._scheduler.next_deadline(
+          self._schedule_ids.get((cmd.channel, expr), None))
+        when = ''
+        if deadline is not None:
+          when = datetime.fromtimestamp(deadline).strftime('%Y-%m-%d %H:%M')
+        msg += '• `{}`, next {}\n'.format(expr, when)
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _daily_arxiv_search_job(self, daily_key, categories):
+    """
+    Run daily arxiv search for new papers and post them as they are found,
+    executed in a background worker. Articles are fetched once and posted in
+    every channel waiting for these categories, channels joining while the
+    search runs are served from the store afterward. Subscribers receive their
+    own digest once the search is completed.
+    :param daily_key:   Key of the search in `_daily_pending`
+    :param categories:  Categories to search
+    """
+    today = datetime.today().strftime('%Y-%m-%d')
+    parser = self._parser(categories)
+    try:
+      while True:
+        with self._daily_lock:
+          job, channels = self._daily_pending[daily_key]
+          if not channels:
+            del self._daily_pending[daily_key]
+            break
+          self._daily_pending[daily_key] = (job, set())
+        try:
+          self._daily_search(parser, channels, today)
+        except FetchError as e:
+          self._defer_daily_search(parser.feed, channels, today, e)
+    except BaseException:
+      with self._daily_lock:
+        self._daily_pending.pop(daily_key, None)
+      raise
+
+  def _defer_daily_search(self, feed, channels, today, error):
+    """
+    Schedule a new attempt of a daily search that failed, it resumes from
+    where the failed one stopped. Attempts are spaced exponentially and
+    postponed while arxiv is considered unavailable.
+    :param feed:      Categories searched, see `feed_name`
+    :param channels:  Channels waiting for the results
+    :param today:     Date of the search
+    :param error:     FetchError raised by the search
+    """
+    day, attempts = self._deferred.get(feed, (today, 0))
+    attempts = attempts + 1 if day == today else 1
+    self._deferred[feed] = (today, attempts)
+    if attempts > _max_deferrals:
+      msg = ('Daily search failed: {}. Giving up for today, '
+             '`run_daily_arxiv_search` resumes it.'.format(error))
+      for channel in channels:
+        self._outbox.post(channel, text=msg)
+      return
+    delay = max(_retry_delay * 2 ** (attempts - 1),
+                getattr(error, 'retry_after', 0.0))
+    when = time() + delay
+    msg = ('Daily search interrupted: {}. Resuming at {}, papers already '
+           'posted are not repeated.'.format(
+            error, datetime.fromtimestamp(when).strftime('%H:%M')))
+    for channel in channels:
+      self._scheduler.call_at(when, self._scheduled_search, channel)
+      self._outbox.post(channel, text=msg)
+
+  def _daily_search(self, parser, channels, today):
+    """
+    Fetch today's articles and post them in several channels. Articles
+    already posted in a channel by an earlier, interrupted, search of the
+    same day are skipped.
+    :param parser:    ArxivParser to use
+    :param channels:  Channels where to post the results
+    :param today:     Date of the search
+    :raises FetchError: if arxiv could not be queried, once the articles
+                        fetched so far are posted
+    """
+    subscriptions = self._subscriptions
+    if self._dedup is not None:
+      self._dedup.prune(today)
+    # Articles matching a subscription, kept until the search is completed,
+    # and their subscribers, dict user -> reasons, in the same order
+    matched = ArticleSpool(budget=parser.memory_budget,
+                           folder=self._cache_folder)
+    readers = []
+
+    def _dispatch(articles):
+      for art in articles:
+        subscribers = subscriptions.match(art)
+        if subscribers:
+          readers.append(subscribers)
+          matched.append(art)
+        yield art
+
+    # Subscriptions need every article, not only channel's matches
+    start = monotonic()
+    checkpoint = _join(self._cache_folder,
+                       'daily_{}.json'.format(parser.feed))
+    articles = parser.iter_daily_articles(checkpoint=checkpoint)
+    matchers = {c: self._channel_matcher(c) for c in channels}
+    posted = {}
+    for channel in channels:
+      day, ids = self._posted.get(channel, (today, {}))
+      posted[channel] = ids if day == today else {}
+      self._posted[channel] = (today, posted[channel])
+    ranked = {}
+    for channel in channels:
+      ranking = self._channel_ranker(channel)
+      if ranking is not None:
+        ranked[channel] = ranking
+    compact = {c for c in channels if self._channel_compact(c)}
+    try:
+      self._post_articles(matchers,
+                          _dispatch(articles),
+                          posted=posted,
+                          ranked=ranked,
+                          compact=compact)
+    except FetchError:
+      matched.close()
+      raise
+    _search_seconds.observe(monotonic() - start)
+    for channel, ids in posted.items():
+      msg = 'Found *{} papers* on Arxiv, {}'.format(len(ids), today)
+      self._outbox.post(channel, text=msg)
+    try:
+      # Single pass over the spool, digests only need titles and links
+      digests = defaultdict(list)
+      for art, subscribers in zip(matched, readers):
+        ref = _DigestItem(art.arxiv_id, art.link, art.title)
+        for user, reasons in subscribers.items():
+          digests[user].append((ref, reasons))
+      for user, items in digests.items():
+        self._post_digest(user, items, today)
+    finally:
+      matched.close()
+
+  def _post_digest(self, user, items, date):
+    """
+    Send personal digest as a direct message
+    :param user:    User ID
+    :param items:   List of tuple (Article or _DigestItem, reasons)
+    :param date:    Date of the digest
+    """
+    # Same article can be found by several searches
+    day, sent = self._digested.get(user, (date, set()))
+    if day != date:
+      sent = set()
+    items = [(art, r) for art, r in items if art.arxiv_id not in sent]
+    if len(items) == 0:
+      return
+    sent.update(art.arxiv_id for art, _ in items)
+    self._digested[user] = (date, sent)
+    header = 'Your Arxiv digest, {}: *{} papers*'.format(date, len(items))
+    lines = []
+    for art, reasons in items:
+      lines.append('• *<{}|{}>*\n      _{}_'.format(art.link,
+                                                   art.title,
+                                                   ', '.join(reasons)))
+    # Section text is limited to 3000 characters
     blocks = [{'type': 'section',
-               'text': {'type': 'mrkdwn',
-                        'text': msg}},
-              ]
-    # Body
-    for k, art in enumerate(articles):
-      # Create body content
-      authors = ', '.join(art.authors)
-      msg = '[{}/{}] *<{}|{}>*\n_*Author(s)*:_ {}\n_{}_'.format(k + 1,
-                                                                len(articles),
-                                                                art.link,
-                                                                art.title,
-                                                                authors,
-                                                                art.summary)
-      bloc = [{'type': 'divider'},
-              {'type': 'section',
-               'text': {'type': 'mrkdwn',
-                        'text': msg}}
-              ]
-      blocks.extend(bloc)
-
-    for k in range(0, len(blocks), 50):
-      # k=0, 50, 100, ...
-      start = k
-      stop = k + 50
-      bck = blocks[start:stop]
-      # Post batch of blocks since there is a limit of 50 blocks per layout
-      # See: https://api.slack.com/reference/block-kit/blocks
-      cmd.client.chat_postMessage(channel=cmd.channel, blocks=bck)
+               'text': {'type': 'mrkdwn', 'text': header}}]
+    text = ''
+    for line in lines:
+      if len(text) + len(line) + 1 > 3000:
+        blocks.append({'type': 'section',
+                       'text': {'type': 'mrkdwn', 'text': text}})
+        text = ''
+      text += line + '\n'
+    if text:
+      blocks.append({'type': 'section',
+                     'text': {'type': 'mrkdwn', 'text': text}})
+    self._outbox.post(user, blocks=blocks)
+
+  def _subscribe_callback(self, cmd):
+    """
+    Add personal subscriptions, list them if no argument is given
+    :param cmd: Command
+    """
+    keywords, authors = parse_subscription(cmd.args)
+    if keywords or authors:
+      keywords, authors = self._subscriptions.subscribe(cmd.user,
+                                                        keywords=keywords,
+                                                        authors=authors)
+      self._save_config(self._cache_folder)
+      msg = 'Subscribed <@{}> to keywords: {}, authors: {}'.format(cmd.user,
+                                                                  keywords,
+                                                                  authors)
+    else:
+      keywords, authors = self._subscriptions.get(cmd.user)
+      msg = '<@{}> follows keywords: {}, authors: {}'.format(cmd.user,
+                                                            keywords,
+                                                            authors)
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _unsubscribe_callback(self, cmd):
+    """
+    Remove personal subscriptions
+    :param cmd: Command
+    """
+    keywords, authors = parse_subscription(cmd.args)
+    keywords, authors = self._subscriptions.unsubscribe(cmd.user,
+                                                        keywords=keywords,
+                                                        authors=authors)
+    self._save_config(self._cache_folder)
+    msg = 'Unsubscribed <@{}> from keywords: {}, authors: {}'.format(cmd.user,
+                                                                    keywords,
+                                                                    authors)
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _post_blocks(self, channel, blocks, compact=False, entries=None):
+    """
+    Post a message of article blocks and remember which papers it holds, so
+    reactions can be traced back to them
+    :param channel: Channel ID
+    :param blocks:  Blocks, see `BlockRenderer.blocks`
+    :param compact: If True, abstracts are sent on reply in the thread, see
+                    `_abstract_reply`
+    :param entries: dict entry number -> arxiv ID of the papers in the
+                    message, read from the blocks if None
+    """
+    ids = entries
+    if ids is None:
+      ids = {}
+      for b in blocks:
+        number = _entry_number.match(b['text']['text'])
+        if 'block_id' in b and number is not None:
+          ids[int(number.group(1))] = b['block_id']
+
+    def _track(future):
+      if future.cancelled() or future.exception() is not None:
+        return
+      with self._messages_lock:
+        self._messages[(channel, future.result()['ts'])] = (ids, compact)
+        while len(self._messages) > _max_tracked_messages:
+          self._messages.popitem(last=False)
+
+    self._outbox.post(channel, blocks=blocks).add_done_callback(_track)
+
+  def _post_articles(self,
+                     matchers,
+                     articles,
+                     posted=None,
+                     ranked=None,
+                     compact=()):
+    """
+    Post articles while they are produced, each channel receives the ones
+    matching its keywords. A message is sent as soon as it is full, articles
+    are packed into as few messages as possible. Articles produced before an
+    error are posted. Channels whose papers are ranked receive the top ones,
+    most relevant first and one per message, once every article is known.
+    Near-duplicates are posted as a single entry linking to the others when
+    they are found close to each other, as a single line pointing to the
+    one posted earlier in the channel otherwise.
+    :param matchers:  dict channel -> KeywordMatcher
+    :param articles:  Iterable of Article
+    :param posted:    dict channel -> dict of IDs already posted -> entry
+                      number, skipped and updated, optional
+    :param ranked:    dict channel -> tuple (TfidfRanker, k), optional
+    :param compact:   Channels receiving one line per article, abstracts are
+                      sent on demand, see `_abstract_reply`
+    :return:  dict channel -> number of articles posted
+    """
+    n_posted = dict.fromkeys(matchers, 0)
+    n_entries = {c: max(posted[c].values(), default=0) if posted else 0
+                 for c in matchers}
+    packers = {c: BlockPacker() for c in matchers}
+    # One line per article, many lines per section
+    lines = {c: LinePacker(header=_compact_header) for c in matchers}
+    ranked = ranked or {}
+    # Matches of ranked channels, until the batch is complete
+    candidates = {c: ArticleSpool(budget=self._arxiv.memory_budget,
+                                  folder=self._cache_folder)
+                  for c in ranked}
+    # Entries not rendered yet, channel -> cluster -> list of
+    # (Article, keywords). Keywords depend on the channel
+    pending = {c: OrderedDict() for c in matchers}
+    clusters = {}
+
+    def _cluster(art):
+      if self._dedup is None:
+        return art.arxiv_id
+      cluster = clusters.get(art.arxiv_id, None)
+      if cluster is None:
+        cluster = clusters[art.arxiv_id] = self._dedup.cluster(art)
+      return cluster
+
+    def _render(channel, cluster, members):
+      for art, keywords in members:
+        art.keywords = keywords
+      n_entries[channel] += 1
+      n_posted[channel] += len(members)
+      index = n_entries[channel]
+      if posted is not None:
+        for art, _ in members:
+          posted[channel][art.arxiv_id] = index
+      head = members[0][0]
+      original = None
+      if self._dedup is not None:
+        # Near-duplicate of an article the channel received earlier
+        earlier = self._dedup.posted(channel, cluster)
+        if earlier is not None:
+          original = self._store.get(earlier)
+        self._dedup.add_posted(channel,
+                               cluster,
+                               [art.arxiv_id for art, _ in members])
+      related = [art for art, _ in members[1:]]
+      if original is not None:
+        related.insert(0, original)
+      if channel in compact:
+        line = self._renderer.line(head, index, related=related)
+        if channel in ranked:
+          # One paper per message, a reaction is about a single paper
+          self._post_blocks(channel,
+                            [{'type': 'section',
+                              'text': {'type': 'mrkdwn', 'text': line}}],
+                            compact=True,
+                            entries={index: head.arxiv_id})
+          return
+        full = lines[channel].add(line, (index, head.arxiv_id))
+        if full is not None:
+          self._post_blocks(channel,
+                            full[0],
+                            compact=True,
+                            entries=dict(full[1]))
+        return
+      if original is not None and len(members) == 1:
+        blocks = self._renderer.duplicate_blocks(head, original, index)
+      else:
+        blocks = self._renderer.blocks(head, index, related=related)
+      if channel in ranked:
+        # One paper per message, a reaction is about a single paper
+        self._post_blocks(channel, blocks)
+        return
+      full = packers[channel].add(blocks,
+                                  sum(len(b['text']['text']) for b in blocks))
+      if full is not None:
+        self._post_blocks(channel, full)
+
+    def _add(channel, art):
+      cluster = _cluster(art)
+      entries = pending[channel]
+      if cluster in entries:
+        entries[cluster].append((art, art.keywords))
+        return
+      entries[cluster] = [(art, art.keywords)]
+      while len(entries) > _cluster_window:
+        _render(channel, *entries.popitem(last=False))
+
+    try:
+      for art in articles:
+        for channel, matcher in matchers.items():
+          if posted is not None and art.arxiv_id in posted[channel]:
+            continue
+          start = monotonic()
+          art.keywords = matcher.match(art)
+          _match_seconds.observe(monotonic() - start)
+          if len(matcher) > 0 and not art.keywords:
+            continue
+          _matches.inc(channel=channel)
+          if channel in candidates:
+            candidates[channel].append(art)
+          else:
+            _add(channel, art)
+      for channel, (ranker, k) in ranked.items():
+        spool = candidates[channel]
+        order = [pos for pos, _ in ranker.top_k(spool, k)]
+        top = set(order)
+        selected = {pos: art for pos, art in enumerate(spool) if pos in top}
+        for pos in order:
+          art = selected[pos]
+          # Keywords are overwritten by the other channels
+          art.keywords = matchers[channel].match(art)
+          _add(channel, art)
+    finally:
+      for channel, packer in packers.items():
+        entries = pending[channel]
+        while entries:
+          _render(channel, *entries.popitem(last=False))
+        full = packer.flush()
+        if full is not None:
+          self._post_blocks(channel, full)
+        for blocks, keys in lines[channel].flush():
+          self._post_blocks(channel, blocks, compact=True, entries=dict(keys))
+      for spool in candidates.values():
+        spool.close()
+    return n_posted
+
+  def _backfill_callback(self, cmd):
+    """
+    Queue search over past submissions
+    :param cmd: Command
+    """
+    args = (cmd.args or '').split()
+    try:
+      if len(args) not in (1, 2):
+        raise ValueError('Wrong number of arguments')
+      dates = [datetime.strptime(a, '%Y-%m-%d').strftime('%Y-%m-%d')
+               for a in args]
+    except ValueError:
+      msg = 'Usage: backfill <YYYY-MM-DD> [<YYYY-MM-DD>]'
+      self._outbox.post(cmd.channel, text=msg)
+      return
+    date_from = dates[0]
+    date_to = dates[1] if len(dates) == 2 else \
+      datetime.today().strftime('%Y-%m-%d')
+    key = 'backfill:{}:{}:{}'.format(cmd.channel, date_from, date_to)
+    try:
+      job, created = self._jobs.submit(key,
+                                       'Backfill {} - {}'.format(date_from,
+                                                                 date_to),
+                                       self._backfill_job,
+                                       channel=cmd.channel,
+                                       date_from=date_from,
+                                       date_to=date_to)
+    except RuntimeError as e:
+      self._outbox.post(cmd.channel,
+                        text='Backfill not started: {}'.format(e))
+      return
+    if created:
+      msg = 'Backfill queued, job #{}'.format(job.id)
+    else:
+      msg = 'Backfill already {}, job #{}'.format(job.state, job.id)
+    self._outbox.post(cmd.channel, text=msg)
+
+  def _backfill_job(self, channel, date_from, date_to):
+    """
+    Search articles submitted within a range of dates and post the ones
+    matching the keywords as they are found, executed in a background worker.
+    Resumes from the last checkpoint if a backfill of the same range was
+    interrupted in the same channel, the checkpoint is deleted once done.
+    :param channel:   Channel where to post the results
+    :param date_from: First submission date, `YYYY-MM-DD`
+    :param date_to:   Last submission date, `YYYY-MM-DD`
+    """
+    parser = self._parser(self._channel_categories(channel))
+    checkpoint = _join(self._cache_folder,
+                       'backfill_{}_{}_{}.json'.format(channel,
+                                                       date_from,
+                                                       date_to))
+    n_seen = 0
+
+    def _count(articles):
+      nonlocal n_seen
+      for art in articles:
+        n_seen += 1
+        yield art
+
+    articles = parser.backfill(date_from=date_from,
+                               date_to=date_to,
+                               checkpoint=checkpoint)
+    try:
+      compact = {channel} if self._channel_compact(channel) else ()
+      n_match = self._post_articles({channel: self._channel_matcher(channel)},
+                                    _count(articles),
+                                    compact=compact)[channel]
+    except FetchError as e:
+      msg = ('Backfill {} - {} interrupted after {} papers: {}. Run it again '
+             'to resume.'.format(date_from, date_to, n_seen, e))
+      self._outbox.post(channel, text=msg)
+      return
+    if _exists(checkpoint):
+      remove(checkpoint)
+    msg = 'Backfill {} - {} done, *{} papers* matching out of {}'.format(
+      date_from, date_to, n_match, n_seen)
+    self._outbox.post(channel, text=msg)
 
 
 if __name__ == "__main__":
@@ -375,11 +1360,48 @@ if __name__ == "__main__":
                  help='Location where to cache data')
   p.add_argument('--channel',
                  type=str,
-                 default='#paperbot_debug',
-                 help='Name of the channel where the bot live')
+                 nargs='+',
+                 default=['#paperbot_debug'],
+                 help='Names of the channels where the bot live')
+  p.add_argument('--http_cache_ttl',
+                 type=float,
+                 default=6 * 3600.0,
+                 help='Time during which arxiv responses are reused, in '
+                      'seconds')
+  p.add_argument('--sharded',
+                 action='store_true',
+                 default=None,
+                 help='Search each arxiv category with its own concurrent '
+                      'query, saved for the next start')
+  p.add_argument('--no_sharded',
+                 dest='sharded',
+                 action='store_false',
+                 help='Search every arxiv category with a single query, '
+                      'saved for the next start')
+  p.add_argument('--metrics_port',
+                 type=int,
+                 default=None,
+                 help='Port where metrics are exposed in Prometheus text '
+                      'format, on localhost only')
+  p.add_argument('--memory_budget',
+                 type=float,
+                 default=None,
+                 help='Memory allowed for the articles of a daily search '
+                      'kept for later, in MB, spilled to disk beyond. Saved '
+                      'for the next start, 32 by default')
+  p.add_argument('--dedup_threshold',
+                 type=float,
+                 default=0.7,
+                 help='Similarity of the abstracts above which papers are '
+                      'posted as near-duplicates, 0 to disable')
   args = p.parse_args()
 
   # Start bot
   dispatcher = MessageDispatcher(token=environ['SLACK_BOT_TOKEN'],
                                  channel=args.channel,
-                                 cache=args.cache_folder)
+                                 cache=args.cache_folder,
+                                 http_cache_ttl=args.http_cache_ttl,
+                                 sharded=args.sharded,
+                                 metrics_port=args.metrics_port,
+                                 memory_budget=args.memory_budget,
+                                 dedup_threshold=args.dedup_threshold)
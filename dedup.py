@@ -0,0 +1,253 @@
+# coding=utf-8
+"""
+Detection of near-duplicate articles with MinHash and locality sensitive
+hashing.
+
+The summary of an article is reduced to its set of word shingles and
+summarized by a MinHash signature, the fraction of equal values between two
+signatures estimates the Jaccard similarity of the sets. Signatures are split
+into bands, articles sharing one band end up in the same bucket, only those
+are compared. Finding the near-duplicates of an article therefore costs a few
+index lookups whatever the size of the history.
+
+Signatures and buckets are persisted in SQLite. Each article belongs to a
+cluster, identified by its first member, new versions, companion papers or
+workshop/full paper pairs join the cluster of the article they resemble.
+Members posted in a channel are recorded, an article is only presented as a
+near-duplicate of one the channel has already received.
+
+See:
+  - https://en.wikipedia.org/wiki/MinHash
+  - http://infolab.stanford.edu/~ullman/mmds/ch3n.pdf
+"""
+import sqlite3
+from datetime import date as _date, timedelta
+from hashlib import blake2b
+from threading import Lock
+from zlib import crc32
+import numpy as np
+from index import tokenize
+
+__author__ = 'Christophe Ecabert'
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS signatures (
+  id TEXT PRIMARY KEY,
+  cluster TEXT NOT NULL,
+  date TEXT NOT NULL,
+  signature BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_signatures_date ON signatures(date);
+CREATE TABLE IF NOT EXISTS buckets (
+  band INTEGER NOT NULL,
+  key INTEGER NOT NULL,
+  id TEXT NOT NULL,
+  PRIMARY KEY (band, key, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_buckets_id ON buckets(id);
+CREATE TABLE IF NOT EXISTS posted (
+  channel TEXT NOT NULL,
+  cluster TEXT NOT NULL,
+  id TEXT NOT NULL,
+  PRIMARY KEY (channel, cluster, id)
+) WITHOUT ROWID;
+"""
+
+# Mersenne prime used by the hash family
+_prime = (1 << 61) - 1
+
+
+def shingles(text, size=3):
+  """
+  Hashed word shingles of a text
+  :param text:  str
+  :param size:  Number of words per shingle
+  :return:  numpy array of unique uint64 hashes, stable across processes
+  """
+  terms = tokenize(text)
+  if len(terms) < size:
+    terms = [' '.join(terms)] if terms else []
+  else:
+    terms = [' '.join(terms[k:k + size])
+             for k in range(len(terms) - size + 1)]
+  return np.unique(np.asarray([crc32(t.encode('utf-8')) for t in terms],
+                              dtype=np.uint64))
+
+
+class MinHash:
+  """ MinHash signatures, `(a * x + b) mod p` permutations """
+
+  def __init__(self, num_perm=64, seed=1):
+    """
+    Constructor
+    :param num_perm:  Length of the signatures
+    :param seed:      Seed of the permutations, signatures are only
+                      comparable if computed with the same one
+    """
+    self.num_perm = num_perm
+    rnd = np.random.RandomState(seed)
+    self._a = rnd.randint(1, _prime, size=num_perm, dtype=np.uint64)
+    self._b = rnd.randint(0, _prime, size=num_perm, dtype=np.uint64)
+
+  def signature(self, text):
+    """
+    Signature of a text
+    :param text:  str
+    :return:  numpy array of uint32, `num_perm` values
+    """
+    values = shingles(text)
+    if values.size == 0:
+      return np.full(self.num_perm, 0xffffffff, dtype=np.uint32)
+    # Products wrap around 64 bits, still a valid family of hashes
+    h = (np.outer(self._a, values) + self._b[:, None]) % _prime
+    return (h.min(axis=1) & 0xffffffff).astype(np.uint32)
+
+  @staticmethod
+  def similarity(sig_a, sig_b):
+    """
+    Estimated Jaccard similarity
+    :param sig_a: Signature
+    :param sig_b: Signature
+    :return:  float in [0, 1]
+    """
+    return float(np.mean(sig_a == sig_b))
+
+
+class NearDuplicateIndex:
+  """ Persistent clusters of near-duplicate articles """
+
+  def __init__(self,
+               filename,
+               threshold=0.7,
+               num_perm=64,
+               bands=16,
+               retention_days=90):
+    """
+    Constructor
+    :param filename:  Path to the database file, created if needed
+    :param threshold: Minimum estimated Jaccard similarity of the summaries
+                      of two near-duplicates
+    :param num_perm:  Length of the signatures
+    :param bands:     Number of bands, must divide `num_perm`. More bands
+                      find pairs of lower similarity
+    :param retention_days:  Articles are forgotten after this number of
+                            days
+    """
+    if num_perm % bands != 0:
+      raise ValueError('Number of bands must divide signature length')
+    self.filename = filename
+    self.threshold = threshold
+    self.bands = bands
+    self.retention_days = retention_days
+    self._minhash = MinHash(num_perm=num_perm)
+    self._rows = num_perm // bands
+    # Shared between channels' daily searches
+    self._conn = sqlite3.connect(filename, check_same_thread=False)
+    self._lock = Lock()
+    with self._lock, self._conn:
+      self._conn.executescript(_schema)
+
+  def close(self):
+    """ Close underlying database """
+    with self._lock:
+      self._conn.close()
+
+  def __len__(self):
+    with self._lock:
+      return self._conn.execute(
+        'SELECT COUNT(*) FROM signatures').fetchone()[0]
+
+  def _keys(self, signature):
+    """
+    Bucket of each band of a signature
+    :param signature: Signature
+    :return:  List of tuple (band, key)
+    """
+    keys = []
+    for band in range(self.bands):
+      rows = signature[band * self._rows:(band + 1) * self._rows]
+      digest = blake2b(rows.tobytes(), digest_size=8).digest()
+      keys.append((band, int.from_bytes(digest, 'little', signed=True)))
+    return keys
+
+  def cluster(self, article):
+    """
+    Cluster of an article, added to the index if unknown. Calling it again
+    with the same article gives the same answer.
+    :param article: Article, kept until `retention_days` after its
+                    publication date
+    :return:  Arxiv ID of the first article of its cluster, its own if the
+              article has no near-duplicate
+    """
+    date = article.date[:10] if article.date else _date.today().isoformat()
+    with self._lock:
+      r = self._conn.execute('SELECT cluster FROM signatures WHERE id = ?',
+                             (article.arxiv_id,)).fetchone()
+    if r is not None:
+      return r[0]
+    signature = self._minhash.signature(article.summary)
+    keys = self._keys(signature)
+    with self._lock, self._conn:
+      candidates = set()
+      for band, key in keys:
+        candidates.update(i for i, in self._conn.execute(
+          'SELECT id FROM buckets WHERE band = ? AND key = ?', (band, key)))
+      best, cluster = self.threshold, article.arxiv_id
+      for arxiv_id in candidates:
+        other, blob = self._conn.execute(
+          'SELECT cluster, signature FROM signatures WHERE id = ?',
+          (arxiv_id,)).fetchone()
+        sim = MinHash.similarity(signature,
+                                 np.frombuffer(blob, dtype=np.uint32))
+        if sim >= best:
+          best, cluster = sim, other
+      self._conn.execute('INSERT INTO signatures VALUES (?, ?, ?, ?)',
+                         (article.arxiv_id, cluster, date,
+                          signature.tobytes()))
+      self._conn.executemany('INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)',
+                             [(band, key, article.arxiv_id)
+                              for band, key in keys])
+    return cluster
+
+  def posted(self, channel, cluster):
+    """
+    Member of a cluster already posted in a channel
+    :param channel: Channel ID
+    :param cluster: Cluster, see `cluster`
+    :return:  Arxiv ID of the first member posted, None if the channel has
+              not received any
+    """
+    with self._lock:
+      r = self._conn.execute('SELECT id FROM posted WHERE channel = ? AND '
+                             'cluster = ? ORDER BY id LIMIT 1',
+                             (channel, cluster)).fetchone()
+    return r[0] if r is not None else None
+
+  def add_posted(self, channel, cluster, ids):
+    """
+    Record members of a cluster posted in a channel
+    :param channel: Channel ID
+    :param cluster: Cluster, see `cluster`
+    :param ids:     List of arxiv IDs
+    """
+    with self._lock, self._conn:
+      self._conn.executemany('INSERT OR IGNORE INTO posted VALUES (?, ?, ?)',
+                             [(channel, cluster, i) for i in ids])
+
+  def prune(self, today=None):
+    """
+    Forget articles older than the retention period
+    :param today: Current date, `YYYY-MM-DD`, today if None
+    :return:  Number of articles removed
+    """
+    today = _date.fromisoformat(today) if today else _date.today()
+    limit = (today - timedelta(days=self.retention_days)).isoformat()
+    with self._lock, self._conn:
+      for table in ('buckets', 'posted'):
+        self._conn.execute('DELETE FROM {} WHERE id IN (SELECT id FROM '
+                           'signatures WHERE date < ?)'.format(table),
+                           (limit,))
+      n = self._conn.execute('DELETE FROM signatures WHERE date < ?',
+                             (limit,)).rowcount
+    return n
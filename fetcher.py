@@ -0,0 +1,621 @@
+# coding=utf-8
+"""
+Asynchronous HTTP fetch engine used to query Arxiv API.
+
+Connections are pooled and kept alive between consecutive requests, responses
+are requested gzip compressed and the request rate is controlled with a token
+bucket. An optional ResponseCache serves repeated requests locally. Bodies
+can be consumed incrementally and the transfer dropped early. Page sizes can
+follow the observed transfer times, see `PageSizer`.
+
+Server errors and timeouts are retried with jittered exponential backoff. A
+circuit breaker stops sending requests to a host failing repeatedly.
+
+See:
+  - https://docs.aiohttp.org/en/stable/client_advanced.html#connectors
+  - https://en.wikipedia.org/wiki/Token_bucket
+  - https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+  - https://martinfowler.com/bliki/CircuitBreaker.html
+"""
+import asyncio
+import heapq
+from random import uniform
+from collections import namedtuple
+from time import monotonic
+import aiohttp
+from metrics import REGISTRY
+
+__author__ = 'Christophe Ecabert'
+
+
+# Outcome of an http request
+Response = namedtuple('Response', ['status', 'body'])
+
+_requests = REGISTRY.counter('paperbot_http_requests_total',
+                             'Requests to arxiv by outcome: cache, http '
+                             'status or error')
+_fetch_seconds = REGISTRY.histogram('paperbot_fetch_seconds',
+                                    'Time until response headers are received')
+_bytes = REGISTRY.counter('paperbot_bytes_downloaded_total',
+                          'Bytes of response bodies read from the network, '
+                          'decompressed')
+_rate_wait = REGISTRY.histogram('paperbot_rate_limit_wait_seconds',
+                                'Time spent waiting for a rate limiter')
+_retries = REGISTRY.counter('paperbot_http_retries_total',
+                            'Requests to arxiv retried, by cause')
+
+
+class FetchError(RuntimeError):
+  """ Request failed for good, retries included """
+
+
+class CircuitOpenError(FetchError):
+  """ Request not sent, the host failed too many times recently """
+
+  def __init__(self, retry_after):
+    """
+    Constructor
+    :param retry_after: Time before a request is allowed again, in seconds
+    """
+    super(CircuitOpenError, self).__init__('arxiv unavailable, retry in '
+                                           '{:.0f}s'.format(retry_after))
+    self.retry_after = retry_after
+
+
+def run_sync(coro):
+  """
+  Run a coroutine to completion on a private event loop. Used to expose
+  blocking entry points on top of asynchronous implementations
+  :param coro:  Coroutine to run
+  :return:  Coroutine's result
+  """
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(coro)
+  finally:
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+def iter_sync(agen):
+  """
+  Iterate over an asynchronous generator from blocking code, the generator
+  runs on a private event loop
+  :param agen:  Asynchronous generator
+  :return:  Generator
+  """
+  loop = asyncio.new_event_loop()
+  try:
+    while True:
+      try:
+        yield loop.run_until_complete(agen.__anext__())
+      except StopAsyncIteration:
+        break
+  finally:
+    loop.run_until_complete(agen.aclose())
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+class _Reversed:
+  """ Sorting key in reverse order """
+
+  __slots__ = ('value',)
+
+  def __init__(self, value):
+    self.value = value
+
+  def __lt__(self, other):
+    return other.value < self.value
+
+  def __eq__(self, other):
+    return self.value == other.value
+
+
+async def _pump(agen, queue):
+  """
+  Move the items of an asynchronous iterator into a queue. The end of the
+  iterator is reported with `(True, None)` or `(True, exception)`.
+  :param agen:  Asynchronous iterator
+  :param queue: asyncio.Queue receiving tuple (False, item)
+  """
+  try:
+    async for item in agen:
+      await queue.put((False, item))
+  except Exception as e:
+    await queue.put((True, e))
+  else:
+    await queue.put((True, None))
+
+
+async def amerge(iterators, key, reverse=False, buffer_size=100):
+  """
+  Merge sorted asynchronous iterators with a k-way heap merge. Iterators are
+  consumed concurrently by background tasks, each one buffering up to
+  `buffer_size` items ahead of the merge, so a slow iterator only delays the
+  output once its buffer is needed.
+  :param iterators:   List of asynchronous iterators, sorted by `key`
+  :param key:         Sorting key of an item
+  :param reverse:     If True, iterators are sorted in descending order
+  :param buffer_size: Number of items read ahead per iterator
+  :return:  Asynchronous generator of items
+  """
+  queues = [asyncio.Queue(maxsize=buffer_size) for _ in iterators]
+  tasks = [asyncio.ensure_future(_pump(it, q))
+           for it, q in zip(iterators, queues)]
+  order = _Reversed if reverse else (lambda v: v)
+  heap = []
+
+  async def _next(k):
+    end, item = await queues[k].get()
+    if not end:
+      heapq.heappush(heap, (order(key(item)), k, item))
+    elif item is not None:
+      raise item
+
+  try:
+    for k in range(len(queues)):
+      await _next(k)
+    while heap:
+      _, k, item = heapq.heappop(heap)
+      yield item
+      await _next(k)
+  finally:
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class TokenBucket:
+  """ Token bucket rate limiter shared by all requests sent to a host """
+
+  def __init__(self, rate, capacity=1.0):
+    """
+    Constructor
+    :param rate:      Number of tokens refilled per second, `None` or 0 means
+                      no limit
+    :param capacity:  Maximum number of tokens the bucket can hold, i.e. size
+                      of the allowed burst
+    """
+    self.rate = rate
+    self.capacity = capacity
+    self._tokens = capacity
+    self._last = monotonic()
+    self._lock = None
+    self._loop = None
+
+  @classmethod
+  def FromWaitTime(cls, wait_time):
+    """
+    Create a limiter allowing one request every `wait_time` seconds
+    :param wait_time: Minimum time between two requests, in seconds
+    :return:  TokenBucket
+    """
+    return cls(rate=1.0 / wait_time if wait_time > 0.0 else None)
+
+  def _refill(self):
+    """ Add tokens accumulated since last refill """
+    now = monotonic()
+    self._tokens = min(self.capacity,
+                       self._tokens + (now - self._last) * self.rate)
+    self._last = now
+
+  async def acquire(self, tokens=1.0):
+    """
+    Wait until enough tokens are available and consume them
+    :param tokens:  Number of tokens to consume
+    :return:  Time spent waiting, in seconds
+    """
+    if not self.rate:
+      return 0.0
+    # Lock is bound to the loop it is used from, bucket can outlive loops
+    loop = asyncio.get_event_loop()
+    if self._lock is None or self._loop is not loop:
+      self._lock = asyncio.Lock()
+      self._loop = loop
+    waited = 0.0
+    async with self._lock:
+      self._refill()
+      while self._tokens < tokens:
+        delay = (tokens - self._tokens) / self.rate
+        await asyncio.sleep(delay)
+        waited += delay
+        self._refill()
+      self._tokens -= tokens
+    return waited
+
+
+class PageSizer:
+  """
+  Number of results to request per page, adapted to the transfers observed.
+  Pages grow while their body is received within `target_seconds` and
+  shrink otherwise, their size in bytes is bounded by `max_bytes` since a
+  page can be held entirely in memory (i.e. to be cached).
+  """
+
+  def __init__(self,
+               size=100,
+               min_size=50,
+               max_size=1000,
+               target_seconds=2.0,
+               max_bytes=2 * 2 ** 20,
+               smoothing=0.5):
+    """
+    Constructor
+    :param size:            Initial page size
+    :param min_size:        Smallest page size
+    :param max_size:        Largest page size, arxiv recommends at most 1000
+                            results per request
+    :param target_seconds:  Desired duration of a page transfer, in seconds
+    :param max_bytes:       Maximum size of a page, in bytes
+    :param smoothing:       Weight of the latest observation in the running
+                            averages
+    """
+    self.size = size
+    self.min_size = min_size
+    self.max_size = max_size
+    self.target_seconds = target_seconds
+    self.max_bytes = max_bytes
+    self._smoothing = smoothing
+    # Running averages per entry
+    self._seconds = None
+    self._bytes = None
+
+  def observe(self, n_entries, n_bytes, seconds):
+    """
+    Update page size with a completed transfer
+    :param n_entries: Number of entries received
+    :param n_bytes:   Size of the body, in bytes
+    :param seconds:   Transfer duration, in seconds
+    """
+    if n_entries == 0:
+      return
+    a = self._smoothing
+    seconds = seconds / n_entries
+    n_bytes = n_bytes / n_entries
+    if self._seconds is None:
+      self._seconds, self._bytes = seconds, n_bytes
+    else:
+      self._seconds = a * seconds + (1.0 - a) * self._seconds
+      self._bytes = a * n_bytes + (1.0 - a) * self._bytes
+    size = self.max_bytes / max(self._bytes, 1.0)
+    if self._seconds > 0.0:
+      size = min(size, self.target_seconds / self._seconds)
+    # At most double at once, a single fast page is not a trend
+    size = min(size, 2 * self.size)
+    self.size = int(max(self.min_size, min(self.max_size, size)))
+
+
+class CircuitBreaker:
+  """
+  Stop sending requests to a failing host. After `threshold` consecutive
+  failures the circuit opens and requests fail right away during
+  `reset_timeout` seconds. A single trial request is then allowed, it closes
+  the circuit if successful and opens it again otherwise. Other requests
+  wait for its outcome, the trial is released if it is cancelled.
+  """
+
+  def __init__(self, threshold=5, reset_timeout=900.0):
+    """
+    Constructor
+    :param threshold:     Number of consecutive failures opening the circuit
+    :param reset_timeout: Time before a trial request, in seconds
+    """
+    self.threshold = threshold
+    self.reset_timeout = reset_timeout
+    self._failures = 0
+    self._opened = None
+    # Token of the trial request in flight
+    self._trial = None
+
+  @property
+  def state(self):
+    """ `closed`, `open` or `half-open` """
+    if self._opened is None:
+      return 'closed'
+    if self._trial is not None or \
+            monotonic() < self._opened + self.reset_timeout:
+      return 'open'
+    return 'half-open'
+
+  def check(self):
+    """
+    Raise if no request can be sent, reserve the trial request otherwise
+    :return:  Token of the trial request, see `release`, None if the circuit
+              is closed
+    """
+    if self._opened is None:
+      return None
+    remaining = self._opened + self.reset_timeout - monotonic()
+    if remaining > 0.0 or self._trial is not None:
+      _requests.inc(outcome='circuit_open')
+      raise CircuitOpenError(retry_after=max(remaining, 0.0))
+    self._trial = object()
+    return self._trial
+
+  async def wait(self, poll=0.1):
+    """
+    Check if a request can be sent, waits for the outcome of the trial
+    request in flight if any. Polled since the breaker is shared by requests
+    running on different event loops.
+    :param poll:  Time between two checks, in seconds
+    :return:  Token of the trial request, see `check`
+    :raises CircuitOpenError: if the circuit is open
+    """
+    while self._trial is not None:
+      await asyncio.sleep(poll)
+    return self.check()
+
+  def release(self, trial):
+    """
+    Give up a trial request whose outcome will never be recorded, i.e.
+    cancelled, another request can try
+    :param trial: Token returned by `check`
+    """
+    if trial is not None and self._trial is trial:
+      self._trial = None
+
+  def success(self):
+    """ Record a successful request """
+    self._failures = 0
+    self._opened = None
+    self._trial = None
+
+  def failure(self):
+    """ Record a failed request """
+    self._failures += 1
+    if self._trial is not None or self._failures >= self.threshold:
+      self._opened = monotonic()
+    self._trial = None
+
+
+class StreamedResponse:
+  """ Response whose body is read incrementally """
+
+  def __init__(self, status, body=None, response=None, on_complete=None):
+    """
+    Constructor
+    :param status:    Http status
+    :param body:      Complete body if already available (i.e. cached)
+    :param response:  aiohttp.ClientResponse to read from otherwise
+    :param on_complete: Callable invoked with the full body once it has been
+                        entirely read, optional
+    """
+    self.status = status
+    self._body = body
+    self._response = response
+    self._on_complete = on_complete
+    self._complete = body is not None
+    # Transfer statistics, waiting for the consumer is not accounted
+    self.nbytes = 0
+    self.transfer_seconds = 0.0
+
+  async def iter_chunks(self, chunk_size=16384):
+    """
+    Iterate over body
+    :param chunk_size:  Maximum size of a chunk in bytes
+    :return:  Asynchronous generator of bytes
+    """
+    if self._body is not None:
+      self.nbytes = len(self._body)
+      yield self._body
+      return
+    buffer = [] if self._on_complete is not None else None
+    start = monotonic()
+    async for chunk in self._response.content.iter_chunked(chunk_size):
+      self.transfer_seconds += monotonic() - start
+      self.nbytes += len(chunk)
+      _bytes.inc(len(chunk))
+      if buffer is not None:
+        buffer.append(chunk)
+      yield chunk
+      start = monotonic()
+    self._complete = True
+    if buffer is not None:
+      self._on_complete(b''.join(buffer))
+
+  async def read(self):
+    """
+    Read the entire body
+    :return:  bytes
+    """
+    return b''.join([chunk async for chunk in self.iter_chunks()])
+
+  def close(self):
+    """ Release the connection, dropped if the body was not fully read """
+    if self._response is not None:
+      if self._complete:
+        self._response.release()
+      else:
+        self._response.close()
+      self._response = None
+
+
+def discard(task):
+  """
+  Cancel a pending `AsyncFetcher.prefetch` task, or close its response if it
+  has already completed
+  :param task:  Task returned by `prefetch`
+  """
+  if not task.done():
+    task.cancel()
+  elif not task.cancelled() and task.exception() is None:
+    task.result().close()
+
+
+class AsyncFetcher:
+  """
+  Pooled http client. Must be used as an asynchronous context manager:
+
+    async with AsyncFetcher(limiter) as fetcher:
+      response = await fetcher.fetch(url)
+  """
+
+  def __init__(self,
+               limiter=None,
+               cache=None,
+               max_connections=2,
+               timeout=60.0,
+               breaker=None,
+               max_retries=3,
+               backoff=2.0,
+               max_backoff=60.0):
+    """
+    Constructor
+    :param limiter:   TokenBucket throttling the requests, optional
+    :param cache:     ResponseCache storing successful responses, optional
+    :param max_connections: Maximum number of simultaneous connections
+    :param timeout:   Total time allowed for a single request, in seconds
+    :param breaker:   CircuitBreaker shared by the requests to the host,
+                      optional
+    :param max_retries: Number of retries of a request on server error,
+                        rate limiting or timeout
+    :param backoff:   Initial delay between two attempts, doubled at every
+                      retry, in seconds
+    :param max_backoff: Longest delay between two attempts, in seconds
+    """
+    self._limiter = limiter
+    self._cache = cache
+    self._breaker = breaker
+    self.max_retries = max_retries
+    self._backoff = backoff
+    self._max_backoff = max_backoff
+    self._max_connections = max_connections
+    self._timeout = timeout
+    self._session = None
+
+  async def __aenter__(self):
+    connector = aiohttp.TCPConnector(limit=self._max_connections)
+    self._session = aiohttp.ClientSession(
+      connector=connector,
+      headers={'Accept-Encoding': 'gzip'},
+      timeout=aiohttp.ClientTimeout(total=self._timeout))
+    return self
+
+  async def __aexit__(self, exc_type, exc, tb):
+    await self._session.close()
+    self._session = None
+
+  def retry_delay(self, attempt):
+    """
+    Delay before retrying, exponential with full jitter on its upper half
+    :param attempt: Number of attempts already failed, starting at 1
+    :return:  Delay in seconds
+    """
+    delay = min(self._backoff * 2 ** (attempt - 1), self._max_backoff)
+    return delay / 2.0 + uniform(0.0, delay / 2.0)
+
+  def record(self, success):
+    """
+    Report the outcome of a transfer to the circuit breaker, if any
+    :param success: True if the transfer succeeded
+    """
+    if self._breaker is not None:
+      if success:
+        self._breaker.success()
+      else:
+        self._breaker.failure()
+
+  async def open(self, url):
+    """
+    Send a request for a given url, waits for the rate limiter first. Fresh
+    cached responses are returned without network access, stale ones are
+    revalidated. Server errors (5xx), rate limiting (429) and network errors
+    are retried, a final error status is returned as is. The response must
+    be closed by the caller.
+    :param url: Url to download
+    :return:  StreamedResponse, body is decompressed
+    :raises CircuitOpenError: if the circuit breaker rejects the request
+    """
+    entry = None
+    headers = {}
+    if self._cache is not None:
+      entry = self._cache.get(url)
+      if entry is not None:
+        if self._cache.is_fresh(entry):
+          _requests.inc(outcome='cache')
+          return StreamedResponse(status=200, body=entry.body)
+        headers = entry.validators()
+      self._cache.miss()
+    attempt = 0
+    trial = None
+    try:
+      while True:
+        if self._breaker is not None:
+          trial = await self._breaker.wait()
+        if self._limiter is not None:
+          _rate_wait.observe(await self._limiter.acquire(), limiter='arxiv')
+        attempt += 1
+        start = monotonic()
+        try:
+          r = await self._session.get(url, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+          _requests.inc(outcome='error')
+          self.record(success=False)
+          if attempt > self.max_retries:
+            raise
+          _retries.inc(cause='network')
+          await asyncio.sleep(self.retry_delay(attempt))
+          continue
+        _fetch_seconds.observe(monotonic() - start)
+        _requests.inc(outcome=r.status)
+        if r.status < 500 and r.status != 429:
+          self.record(success=True)
+          break
+        self.record(success=False)
+        if attempt > self.max_retries:
+          break
+        _retries.inc(cause='rate_limited' if r.status == 429 else 'server')
+        wait = self.retry_delay(attempt)
+        try:
+          wait = min(float(r.headers.get('Retry-After', wait)),
+                     self._max_backoff)
+        except ValueError:
+          # Retry-After given as a date
+          pass
+        r.release()
+        await asyncio.sleep(wait)
+    except BaseException:
+      # Trial request cancelled or failed before its outcome is known
+      if self._breaker is not None:
+        self._breaker.release(trial)
+      raise
+    on_complete = None
+    if self._cache is not None:
+      if r.status == 304 and entry is not None:
+        # Not modified, cached body is still valid
+        r.release()
+        self._cache.refresh(entry)
+        return StreamedResponse(status=200, body=entry.body)
+      if r.status == 200:
+        # Only complete bodies are cached
+        def on_complete(body):
+          self._cache.put(url,
+                          body,
+                          etag=r.headers.get('ETag', None),
+                          last_modified=r.headers.get('Last-Modified', None))
+    return StreamedResponse(status=r.status,
+                            response=r,
+                            on_complete=on_complete)
+
+  async def fetch(self, url):
+    """
+    Download a given url entirely, see `open`
+    :param url: Url to download
+    :return:  Response, body is decompressed
+    """
+    res = await self.open(url)
+    try:
+      body = await res.read()
+    finally:
+      res.close()
+    return Response(status=res.status, body=body)
+
+  def prefetch(self, url):
+    """
+    Start sending the request for `url` in the background, the body is
+    buffered until it is consumed
+    :param url: Url to download
+    :return:  asyncio.Task resolving to a StreamedResponse, see `discard`
+    """
+    return asyncio.ensure_future(self.open(url))
@@ -0,0 +1,224 @@
+# coding=utf-8
+"""
+On-disk HTTP response cache.
+
+Responses are keyed by their request url. Fresh entries (younger than `ttl`)
+are served without any network access, stale ones are revalidated with a
+conditional request (ETag / Last-Modified) when the server provided
+validators. The total size of the cache is bounded, least recently used
+entries are evicted first.
+"""
+import os
+from os.path import join as _join
+from os.path import exists as _exists
+from collections import OrderedDict
+from hashlib import sha1
+from json import load, dump
+from threading import Lock
+from time import time
+
+__author__ = 'Christophe Ecabert'
+
+
+class CacheEntry:
+  """ Cached response """
+
+  def __init__(self, key, body, etag=None, last_modified=None, stored=None):
+    """
+    Constructor
+    :param key:   Cache key, derived from the url
+    :param body:  Response's body
+    :param etag:  ETag header if any
+    :param last_modified: Last-Modified header if any
+    :param stored:  Time when the response was received / revalidated
+    """
+    self.key = key
+    self.body = body
+    self.etag = etag
+    self.last_modified = last_modified
+    self.stored = stored or time()
+
+  def validators(self):
+    """
+    Headers for a conditional request
+    :return:  dict
+    """
+    headers = {}
+    if self.etag is not None:
+      headers['If-None-Match'] = self.etag
+    if self.last_modified is not None:
+      headers['If-Modified-Since'] = self.last_modified
+    return headers
+
+
+class ResponseCache:
+  """ Size bounded LRU cache of http responses stored in a folder """
+
+  def __init__(self,
+               folder,
+               ttl=6 * 3600.0,
+               max_size=50 * 1024 * 1024):
+    """
+    Constructor
+    :param folder:    Location where responses are stored, created if needed
+    :param ttl:       Time during which a response is served without
+                      revalidation, in seconds
+    :param max_size:  Maximum size of all stored bodies, in bytes
+    """
+    self.folder = folder
+    self.ttl = ttl
+    self.max_size = max_size
+    self.hits = 0
+    self.misses = 0
+    self.revalidated = 0
+    self.evictions = 0
+    self._lock = Lock()
+    # key -> body size, least recently used first
+    self._lru = OrderedDict()
+    self._size = 0
+    os.makedirs(folder, exist_ok=True)
+    self._load_index()
+
+  @staticmethod
+  def key(url):
+    """
+    Cache key for a given url
+    :param url: Request url
+    :return:  str
+    """
+    return sha1(url.encode('utf-8')).hexdigest()
+
+  def _path(self, key, ext):
+    return _join(self.folder, '{}.{}'.format(key, ext))
+
+  def _load_index(self):
+    """ Rebuild LRU order from files already in the cache folder """
+    entries = []
+    for fname in os.listdir(self.folder):
+      if fname.endswith('.body'):
+        st = os.stat(_join(self.folder, fname))
+        entries.append((st.st_mtime, fname[:-5], st.st_size))
+    for _, key, size in sorted(entries):
+      self._lru[key] = size
+      self._size += size
+
+  def _remove(self, key):
+    """
+    Delete an entry, lock must be held
+    :param key: Entry's key
+    """
+    self._size -= self._lru.pop(key, 0)
+    for ext in ('body', 'meta'):
+      path = self._path(key, ext)
+      if _exists(path):
+        os.remove(path)
+
+  def get(self, url):
+    """
+    Retrieve cached response, fresh or not. Fresh responses count as hits.
+    :param url: Request url
+    :return:  CacheEntry or None
+    """
+    key = self.key(url)
+    with self._lock:
+      if key not in self._lru:
+        return None
+      try:
+        with open(self._path(key, 'meta'), 'r') as f:
+          meta = load(f)
+        with open(self._path(key, 'body'), 'rb') as f:
+          body = f.read()
+      except (OSError, ValueError):
+        # Partially written entry
+        self._remove(key)
+        return None
+      # Mark as recently used
+      self._lru.move_to_end(key)
+      os.utime(self._path(key, 'body'))
+      entry = CacheEntry(key=key, body=body, **meta)
+      if self.is_fresh(entry):
+        self.hits += 1
+    return entry
+
+  def remove(self, url):
+    """
+    Drop the cached response of a url, if any
+    :param url: Request url
+    """
+    with self._lock:
+      self._remove(self.key(url))
+
+  def is_fresh(self, entry):
+    """
+    Check if an entry can be served without revalidation
+    :param entry: CacheEntry
+    :return:  True if fresh
+    """
+    return time() - entry.stored < self.ttl
+
+  def miss(self):
+    """ Count a request sent over the network, see `get` """
+    with self._lock:
+      self.misses += 1
+
+  def put(self, url, body, etag=None, last_modified=None):
+    """
+    Store a downloaded response and evict old entries if needed
+    :param url:   Request url
+    :param body:  Response's body
+    :param etag:  ETag header if any
+    :param last_modified: Last-Modified header if any
+    :return:  CacheEntry
+    """
+    entry = CacheEntry(key=self.key(url),
+                       body=body,
+                       etag=etag,
+                       last_modified=last_modified)
+    with self._lock:
+      if len(body) > self.max_size:
+        return entry
+      self._remove(entry.key)
+      with open(self._path(entry.key, 'body'), 'wb') as f:
+        f.write(body)
+      self._write_meta(entry)
+      self._lru[entry.key] = len(body)
+      self._size += len(body)
+      while self._size > self.max_size:
+        old_key = next(iter(self._lru))
+        self._remove(old_key)
+        self.evictions += 1
+    return entry
+
+  def refresh(self, entry):
+    """
+    Mark an entry as revalidated by the server
+    :param entry: CacheEntry
+    """
+    entry.stored = time()
+    with self._lock:
+      self.revalidated += 1
+      if entry.key in self._lru:
+        self._write_meta(entry)
+
+  def _write_meta(self, entry):
+    """
+    Dump entry's metadata, lock must be held
+    :param entry: CacheEntry
+    """
+    with open(self._path(entry.key, 'meta'), 'w') as f:
+      dump({'etag': entry.etag,
+            'last_modified': entry.last_modified,
+            'stored': entry.stored}, f)
+
+  def stats(self):
+    """
+    Cache counters
+    :return:  dict
+    """
+    with self._lock:
+      return {'hits': self.hits,
+              'misses': self.misses,
+              'revalidated': self.revalidated,
+              'evictions': self.evictions,
+              'entries': len(self._lru),
+              'size': self._size}
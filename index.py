@@ -0,0 +1,154 @@
+# coding=utf-8
+"""
+On-disk inverted index over articles with BM25 ranking.
+
+Postings are stored in SQLite, one row per (term, article) with the term
+frequency. Title terms count twice. Documents are only indexed once, so the
+index can be updated incrementally after every search.
+
+See:
+  - https://en.wikipedia.org/wiki/Okapi_BM25
+"""
+import re
+import sqlite3
+from collections import Counter
+from math import log
+from threading import Lock
+
+__author__ = 'Christophe Ecabert'
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS docs (
+  id TEXT PRIMARY KEY,
+  length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+  term TEXT PRIMARY KEY,
+  df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+  term TEXT NOT NULL,
+  id TEXT NOT NULL,
+  tf INTEGER NOT NULL,
+  PRIMARY KEY (term, id)
+) WITHOUT ROWID;
+"""
+
+_stop_words = frozenset(('a', 'an', 'and', 'are', 'as', 'at', 'be', 'by',
+                         'for', 'from', 'has', 'have', 'in', 'into', 'is',
+                         'it', 'its', 'of', 'on', 'or', 'our', 'that', 'the',
+                         'their', 'this', 'to', 'we', 'which', 'with'))
+
+
+def tokenize(text):
+  """
+  Split text into index terms
+  :param text:  str
+  :return:  List of terms
+  """
+  return [t for t in re.findall(r'\w+', text.lower())
+          if len(t) > 1 and t not in _stop_words]
+
+
+def article_terms(article):
+  """
+  Terms of an article, title is weighted twice
+  :param article: Article
+  :return:  Counter term -> frequency
+  """
+  title = tokenize(article.title)
+  terms = Counter(title)
+  terms.update(title)
+  terms.update(tokenize(article.summary))
+  for author in article.authors:
+    terms.update(tokenize(author))
+  return terms
+
+
+class SearchIndex:
+  """ Inverted index of articles ranked with BM25 """
+
+  def __init__(self, filename, k1=1.2, b=0.75):
+    """
+    Constructor
+    :param filename:  Path to the index file, created if needed
+    :param k1:  BM25 term frequency saturation
+    :param b:   BM25 document length normalization
+    """
+    self.filename = filename
+    self.k1 = k1
+    self.b = b
+    self._conn = sqlite3.connect(filename, check_same_thread=False)
+    self._lock = Lock()
+    with self._lock, self._conn:
+      self._conn.executescript(_schema)
+      n, total = self._conn.execute('SELECT COUNT(*), TOTAL(length) '
+                                    'FROM docs').fetchone()
+    self._n_docs = n
+    self._total_length = total
+
+  def __len__(self):
+    return self._n_docs
+
+  def close(self):
+    """ Close underlying database """
+    with self._lock:
+      self._conn.close()
+
+  def add(self, articles):
+    """
+    Index articles, the ones already indexed are skipped
+    :param articles:  Iterable of Article
+    :return:  Number of articles added
+    """
+    n_added = 0
+    with self._lock, self._conn:
+      for art in articles:
+        terms = article_terms(art)
+        length = sum(terms.values())
+        cur = self._conn.execute('INSERT OR IGNORE INTO docs VALUES (?, ?)',
+                                 (art.arxiv_id, length))
+        if cur.rowcount == 0:
+          continue
+        self._conn.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                               [(t, art.arxiv_id, tf)
+                                for t, tf in terms.items()])
+        new_terms = [(t,) for t in terms]
+        self._conn.executemany('INSERT OR IGNORE INTO terms VALUES (?, 0)',
+                               new_terms)
+        self._conn.executemany('UPDATE terms SET df = df + 1 WHERE term = ?',
+                               new_terms)
+        self._n_docs += 1
+        self._total_length += length
+        n_added += 1
+    return n_added
+
+  def search(self, query, limit=10):
+    """
+    Rank indexed articles against a free text query
+    :param query: Query, i.e. `neural radiance field`
+    :param limit: Maximum number of results
+    :return:  List of tuple (arxiv_id, score), best match first
+    """
+    terms = set(tokenize(query))
+    if not terms or self._n_docs == 0:
+      return []
+    avg_length = self._total_length / self._n_docs
+    scores = Counter()
+    with self._lock:
+      for term in terms:
+        r = self._conn.execute('SELECT df FROM terms WHERE term = ?',
+                               (term,)).fetchone()
+        if r is None:
+          continue
+        df = r[0]
+        idf = log((self._n_docs - df + 0.5) / (df + 0.5) + 1.0)
+        rows = self._conn.execute('SELECT p.id, p.tf, d.length '
+                                  'FROM postings p JOIN docs d '
+                                  'ON p.id = d.id WHERE p.term = ?',
+                                  (term,))
+        for arxiv_id, tf, length in rows:
+          norm = self.k1 * (1.0 - self.b + self.b * length / avg_length)
+          scores[arxiv_id] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+    return scores.most_common(limit)
@@ -0,0 +1,143 @@
+# coding=utf-8
+"""
+Background job subsystem. Long running tasks (i.e. arxiv queries + posting)
+are executed in a worker pool so the Slack event loop stays responsive.
+
+Jobs submitted with the same key while a previous one is still queued or
+running are coalesced into a single run.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import count
+from threading import Lock
+from datetime import datetime
+from traceback import print_exc
+
+__author__ = 'Christophe Ecabert'
+
+
+class Job:
+  """ Container for a background job """
+
+  QUEUED = 'queued'
+  RUNNING = 'running'
+  DONE = 'done'
+  FAILED = 'failed'
+
+  def __init__(self, job_id, key, name):
+    """
+    Constructor
+    :param job_id:  Unique job identifier
+    :param key:     Coalescing key
+    :param name:    Human readable job name
+    """
+    self.id = job_id
+    self.key = key
+    self.name = name
+    self.state = Job.QUEUED
+    self.submitted = datetime.now()
+    self.started = None
+    self.finished = None
+    self.error = None
+    self.future = None
+
+  @property
+  def active(self):
+    return self.state in (Job.QUEUED, Job.RUNNING)
+
+  def describe(self):
+    """
+    Short description of the job
+    :return:  str
+    """
+    msg = '#{} {} - *{}*'.format(self.id, self.name, self.state)
+    if self.state == Job.QUEUED:
+      msg += ' since {}'.format(self.submitted.strftime('%H:%M:%S'))
+    elif self.state == Job.RUNNING:
+      msg += ' since {}'.format(self.started.strftime('%H:%M:%S'))
+    else:
+      elapsed = (self.finished - self.started).total_seconds()
+      msg += ' in {:.1f}s'.format(elapsed)
+      if self.error is not None:
+        msg += ' ({})'.format(self.error)
+    return msg
+
+
+class JobExecutor:
+  """ Bounded pool of workers running background jobs """
+
+  def __init__(self,
+               max_workers=1,
+               max_queued=8,
+               history=20):
+    """
+    Constructor
+    :param max_workers: Number of jobs running simultaneously
+    :param max_queued:  Maximum number of jobs waiting or running
+    :param history:     Number of finished jobs to keep for reporting
+    """
+    self._pool = ThreadPoolExecutor(max_workers=max_workers)
+    self._max_queued = max_queued
+    self._ids = count(1)
+    self._lock = Lock()
+    self._active = {}
+    self._finished = deque(maxlen=history)
+
+  def submit(self, key, name, fn, *args, **kwargs):
+    """
+    Submit a new job. If a job with the same key is already queued or
+    running, it is returned instead of starting a new one.
+    :param key:   Coalescing key
+    :param name:  Human readable job name
+    :param fn:    Callable to run
+    :param args:  Positional arguments for `fn`
+    :param kwargs:  Keyword arguments for `fn`
+    :return:  Tuple (Job, bool), flag is False when the job is coalesced
+    """
+    with self._lock:
+      job = self._active.get(key, None)
+      if job is not None:
+        return job, False
+      if len(self._active) >= self._max_queued:
+        raise RuntimeError('Job queue is full ({} jobs pending)'
+                           .format(len(self._active)))
+      job = Job(job_id=next(self._ids), key=key, name=name)
+      self._active[key] = job
+      job.future = self._pool.submit(self._run, job, fn, *args, **kwargs)
+    return job, True
+
+  def _run(self, job, fn, *args, **kwargs):
+    """
+    Worker entry point
+    :param job: Job being executed
+    :param fn:  Callable to run
+    """
+    job.state = Job.RUNNING
+    job.started = datetime.now()
+    try:
+      return fn(*args, **kwargs)
+    except Exception as e:
+      job.error = str(e) or type(e).__name__
+      print_exc()
+    finally:
+      job.finished = datetime.now()
+      job.state = Job.DONE if job.error is None else Job.FAILED
+      with self._lock:
+        self._active.pop(job.key, None)
+        self._finished.appendleft(job)
+
+  def status(self):
+    """
+    Jobs currently active followed by the most recent finished ones
+    :return:  List of Job
+    """
+    with self._lock:
+      active = sorted(self._active.values(), key=lambda j: j.id)
+      return active + list(self._finished)
+
+  def shutdown(self, wait=True):
+    """
+    Stop accepting jobs and release workers
+    :param wait:  If True, wait for pending jobs to complete
+    """
+    self._pool.shutdown(wait=wait)
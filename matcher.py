@@ -0,0 +1,148 @@
+# coding=utf-8
+"""
+Multi-pattern keyword matcher.
+
+All keywords are compiled into a single regular expression shaped as a prefix
+tree, therefore the cost of a search depends on the length of the text and
+not on the number of keywords. Keyword syntax:
+
+  - `gan`             Whole word, does not match `organ`
+  - `neural field`    Phrase, words separated by any amount of whitespace
+  - `segment*`        Prefix, matches `segmentation`, `segmenting`, ...
+"""
+import re
+
+__author__ = 'Christophe Ecabert'
+
+
+# Separator inserted between fields, neither a word nor a whitespace character
+# so matches can not span two fields
+_field_sep = '\x00'
+
+
+def parse_keywords(text):
+  """
+  Split a list of keywords, phrases can be grouped with double quotes
+  :param text:  Space separated keywords, i.e. `gan "neural field" segment*`
+  :return:  List of keywords
+  """
+  res = re.findall(r'["“”]([^"“”]+)["“”]|(\S+)',
+                   text or '')
+  return [p or w for p, w in res]
+
+
+def normalize_keyword(keyword):
+  """
+  Normalize keyword: lower case and single space between words
+  :param keyword: Keyword to normalize
+  :return:  str
+  """
+  return ' '.join(keyword.lower().split())
+
+
+class _Node:
+  """ Prefix tree node """
+
+  __slots__ = ('children', 'word', 'prefix')
+
+  def __init__(self):
+    self.children = {}
+    # Keyword ending here and requiring a word boundary
+    self.word = None
+    # Keyword ending here and matching any continuation
+    self.prefix = None
+
+
+class KeywordMatcher:
+  """ Compiled set of keywords """
+
+  def __init__(self, keywords=()):
+    """
+    Constructor
+    :param keywords:  List of keywords
+    """
+    self.keywords = []
+    # Matched stem -> (word keyword, prefix keyword)
+    self._stems = {}
+    root = _Node()
+    for kw in keywords:
+      kw = normalize_keyword(kw)
+      is_prefix = kw.endswith('*')
+      stem = kw.rstrip('*').rstrip()
+      if not stem or kw in self.keywords:
+        continue
+      self.keywords.append(kw)
+      node = root
+      for c in stem:
+        node = node.children.setdefault(c, _Node())
+      if is_prefix:
+        node.prefix = kw
+      else:
+        node.word = kw
+      self._stems[stem] = (node.word, node.prefix)
+    self._regex = None
+    if self.keywords:
+      self._regex = re.compile(r'(?<!\w)' + self._build(root),
+                               flags=re.IGNORECASE)
+
+  def __len__(self):
+    return len(self.keywords)
+
+  def _build(self, node):
+    """
+    Convert a prefix tree into a regular expression, longest keywords are
+    tried first
+    :param node:  Root of the tree
+    :return:  str, regular expression
+    """
+    alts = []
+    for c in sorted(node.children):
+      sub = r'\s+' if c == ' ' else re.escape(c)
+      alts.append(sub + self._build(node.children[c]))
+    if node.word is not None:
+      alts.append(r'(?!\w)')
+    if node.prefix is not None:
+      alts.append('')
+    if len(alts) == 1:
+      return alts[0]
+    return '(?:{})'.format('|'.join(alts))
+
+  def _resolve(self, text, m):
+    """
+    Find which keyword produced a match
+    :param text:  Text searched
+    :param m:     Match object
+    :return:  str, keyword
+    """
+    word, prefix = self._stems[normalize_keyword(m.group())]
+    if word is not None:
+      end = m.end()
+      if end == len(text) or not (text[end].isalnum() or text[end] == '_'):
+        return word
+    return prefix
+
+  def match_text(self, *fields):
+    """
+    Search keywords in a list of text fields
+    :param fields:  Strings to search
+    :return:  List of keywords found, in order of first occurrence
+    """
+    if self._regex is None:
+      return []
+    text = _field_sep.join(fields)
+    hits = []
+    for m in self._regex.finditer(text):
+      kw = self._resolve(text, m)
+      if kw not in hits:
+        hits.append(kw)
+    return hits
+
+  def match(self, article):
+    """
+    Search keywords in the title, summary and authors of an article
+    :param article: Article to search
+    :return:  List of keywords found, in order of first occurrence
+    """
+    return self.match_text(article.title,
+                           article.summary,
+                           _field_sep.join(article.authors))
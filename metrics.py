@@ -0,0 +1,304 @@
+# coding=utf-8
+"""
+Counters and histograms describing the activity of the bot.
+
+Metrics live in a process wide registry and are rendered in Prometheus text
+exposition format, either through a small http endpoint bound to localhost or
+as a summary posted in Slack.
+
+See:
+  - https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from time import monotonic
+
+__author__ = 'Christophe Ecabert'
+
+
+# Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+  """
+  Hashable representation of a set of labels
+  :param labels:  dict
+  :return:  Tuple of (name, value)
+  """
+  return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+  """
+  Format labels, i.e. `{status="200"}`
+  :param key:   Tuple of (name, value), see `_label_key`
+  :param extra: Additional (name, value)
+  :return:  str, empty without labels
+  """
+  items = list(key) + list(extra)
+  if not items:
+    return ''
+  return '{' + ','.join('{}="{}"'.format(k, v.replace('"', '\\"'))
+                        for k, v in items) + '}'
+
+
+def _format_value(value):
+  """
+  Format a sample value
+  :param value: float
+  :return:  str
+  """
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+  """ Monotonically increasing value, one per set of labels """
+
+  kind = 'counter'
+
+  def __init__(self, name, doc):
+    """
+    Constructor
+    :param name:  Metric name, i.e. `paperbot_pages_fetched_total`
+    :param doc:   Description
+    """
+    self.name = name
+    self.doc = doc
+    self._values = {}
+    self._lock = Lock()
+
+  def inc(self, amount=1.0, **labels):
+    """
+    Increase the counter
+    :param amount:  Increment, must be positive
+    :param labels:  Labels of the sample
+    """
+    key = _label_key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0.0) + amount
+
+  def value(self, **labels):
+    """
+    Current value
+    :param labels:  Labels of the sample
+    :return:  float
+    """
+    with self._lock:
+      return self._values.get(_label_key(labels), 0.0)
+
+  def total(self):
+    """
+    Sum over every set of labels
+    :return:  float
+    """
+    with self._lock:
+      return sum(self._values.values())
+
+  def samples(self):
+    """
+    Samples to expose
+    :return:  List of (name, labels, value)
+    """
+    with self._lock:
+      if not self._values:
+        return [(self.name, '', 0.0)]
+      return [(self.name, _format_labels(k), v)
+              for k, v in sorted(self._values.items())]
+
+
+class Histogram:
+  """ Distribution of observed values, cumulative buckets per set of labels """
+
+  kind = 'histogram'
+
+  def __init__(self, name, doc, buckets=DEFAULT_BUCKETS):
+    """
+    Constructor
+    :param name:    Metric name, i.e. `paperbot_fetch_seconds`
+    :param doc:     Description
+    :param buckets: Sorted upper bounds of the buckets
+    """
+    self.name = name
+    self.doc = doc
+    self.buckets = tuple(buckets) + (float('inf'),)
+    self._values = {}
+    self._lock = Lock()
+
+  def observe(self, value, **labels):
+    """
+    Record an observation
+    :param value:   Observed value
+    :param labels:  Labels of the sample
+    """
+    key = _label_key(labels)
+    k = bisect_left(self.buckets, value)
+    with self._lock:
+      counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+      counts[k] += 1
+      self._values[key] = (counts, total + value)
+
+  @contextmanager
+  def time(self, **labels):
+    """
+    Observe the duration of a block of code, in seconds
+    :param labels:  Labels of the sample
+    """
+    start = monotonic()
+    try:
+      yield
+    finally:
+      self.observe(monotonic() - start, **labels)
+
+  def count(self):
+    """
+    Number of observations over every set of labels
+    :return:  int
+    """
+    with self._lock:
+      return sum(sum(c) for c, _ in self._values.values())
+
+  def sum(self):
+    """
+    Sum of the observations over every set of labels
+    :return:  float
+    """
+    with self._lock:
+      return sum(t for _, t in self._values.values())
+
+  def samples(self):
+    """
+    Samples to expose
+    :return:  List of (name, labels, value)
+    """
+    res = []
+    with self._lock:
+      for key, (counts, total) in sorted(self._values.items()):
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+          cumulative += n
+          res.append((self.name + '_bucket',
+                      _format_labels(key, [('le', _format_value(bound))]),
+                      cumulative))
+        res.append((self.name + '_sum', _format_labels(key), total))
+        res.append((self.name + '_count', _format_labels(key), cumulative))
+    return res
+
+
+class Registry:
+  """ Collection of metrics """
+
+  def __init__(self):
+    """ Constructor """
+    self._metrics = {}
+    self._lock = Lock()
+
+  def _get(self, cls, name, *args):
+    """
+    Retrieve a metric, created on first use
+    :param cls:   Metric type
+    :param name:  Metric name
+    :param args:  Constructor arguments
+    :return:  Metric
+    """
+    with self._lock:
+      metric = self._metrics.get(name, None)
+      if metric is None:
+        metric = cls(name, *args)
+        self._metrics[name] = metric
+      elif not isinstance(metric, cls):
+        raise RuntimeError('Metric {} is already a {}'.format(name,
+                                                              metric.kind))
+      return metric
+
+  def counter(self, name, doc):
+    """
+    Retrieve a counter, created on first use
+    :param name:  Metric name
+    :param doc:   Description
+    :return:  Counter
+    """
+    return self._get(Counter, name, doc)
+
+  def histogram(self, name, doc, buckets=DEFAULT_BUCKETS):
+    """
+    Retrieve a histogram, created on first use
+    :param name:    Metric name
+    :param doc:     Description
+    :param buckets: Upper bounds of the buckets
+    :return:  Histogram
+    """
+    return self._get(Histogram, name, doc, buckets)
+
+  def metrics(self):
+    """
+    Registered metrics, sorted by name
+    :return:  List of Counter or Histogram
+    """
+    with self._lock:
+      return [self._metrics[k] for k in sorted(self._metrics)]
+
+  def render(self):
+    """
+    Text exposition of every metric
+    :return:  str
+    """
+    lines = []
+    for metric in self.metrics():
+      lines.append('# HELP {} {}'.format(metric.name, metric.doc))
+      lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+      for name, labels, value in metric.samples():
+        lines.append('{}{} {}'.format(name, labels, _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+# Registry shared by every module
+REGISTRY = Registry()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+
+class MetricsServer:
+  """ Expose a registry over http, served from a background thread """
+
+  def __init__(self, port, host='127.0.0.1', registry=REGISTRY):
+    """
+    Constructor, starts serving right away
+    :param port:      Port to listen on
+    :param host:      Interface to bind, localhost by default
+    :param registry:  Registry to expose
+    """
+    class _Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+          self.send_error(404)
+          return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, fmt, *args):
+        pass
+
+    self._server = _ThreadingHTTPServer((host, port), _Handler)
+    self.port = self._server.server_address[1]
+    self._thread = Thread(target=self._server.serve_forever,
+                          name='metrics',
+                          daemon=True)
+    self._thread.start()
+
+  def close(self):
+    """ Stop serving """
+    self._server.shutdown()
+    self._server.server_close()
@@ -0,0 +1,268 @@
+# coding=utf-8
+"""
+Outbound message queue for Slack.
+
+Messages are sent from a dedicated thread running its own event loop, callers
+only enqueue them. Each channel has its own queue so ordering is preserved per
+channel while a rate limited channel does not delay the others. Blocks larger
+than Slack's layout limits are split into several messages, see
+`render.BlockPacker` to fill messages, and failed requests are retried,
+honouring `Retry-After` on 429 responses.
+
+See:
+  - https://api.slack.com/docs/rate-limits
+  - https://api.slack.com/reference/block-kit/blocks
+"""
+import asyncio
+from concurrent.futures import Future
+from threading import Thread
+from random import uniform
+from aiohttp import ClientError
+from slack import WebClient
+from slack.errors import SlackApiError
+from fetcher import TokenBucket
+from metrics import REGISTRY
+
+__author__ = 'Christophe Ecabert'
+
+
+# Maximum number of blocks per message
+MAX_BLOCKS = 50
+# Maximum number of characters in a message
+MAX_CHARS = 40000
+
+_posted = REGISTRY.counter('paperbot_messages_posted_total',
+                           'Messages sent to Slack')
+_failed = REGISTRY.counter('paperbot_messages_failed_total',
+                           'Messages dropped after an error')
+_retries = REGISTRY.counter('paperbot_slack_retries_total',
+                            'Attempts retried, by cause')
+_post_seconds = REGISTRY.histogram('paperbot_post_seconds',
+                                   'Latency of a chat.postMessage call')
+_rate_wait = REGISTRY.histogram('paperbot_rate_limit_wait_seconds',
+                                'Time spent waiting for a rate limiter')
+
+
+def _blocks_length(blocks):
+  """
+  Number of characters of text in a list of blocks
+  :param blocks:  List of blocks
+  :return:  int
+  """
+  n = 0
+  for b in blocks:
+    text = b.get('text', None)
+    if text is not None:
+      n += len(text.get('text', ''))
+  return n
+
+
+def split_text(text, limit=MAX_CHARS):
+  """
+  Split a long text on line boundaries into chunks of at most `limit`
+  characters
+  :param text:  str
+  :param limit: Maximum size of a chunk
+  :return:  List of str
+  """
+  chunks = []
+  current = ''
+  for line in text.splitlines(True):
+    while len(line) > limit:
+      chunks.append(line[:limit])
+      line = line[limit:]
+    if len(current) + len(line) > limit:
+      chunks.append(current)
+      current = ''
+    current += line
+  if current or not chunks:
+    chunks.append(current)
+  return chunks
+
+
+class _Message:
+  """ Queued message """
+
+  __slots__ = ('kwargs', 'blocks', 'future')
+
+  def __init__(self, kwargs, blocks, future):
+    self.kwargs = kwargs
+    self.blocks = blocks
+    self.future = future
+
+
+class Outbox:
+  """ Asynchronous, rate limited, message sender """
+
+  def __init__(self,
+               token,
+               rate=1.0,
+               max_retries=5,
+               backoff=1.0,
+               base_url=None):
+    """
+    Constructor
+    :param token:       Slack bot token
+    :param rate:        Maximum number of messages per second and channel
+    :param max_retries: Number of attempts for a message before giving up
+    :param backoff:     Initial delay between two attempts, doubled at every
+                        retry, in seconds
+    :param base_url:    Slack Web API location, optional (i.e. for testing)
+    """
+    self.rate = rate
+    self.max_retries = max_retries
+    self.backoff = backoff
+    # Counters
+    self.sent = 0
+    self.failed = 0
+    self.retries = 0
+    self.rate_limited = 0
+    self._queues = {}
+    self._limiters = {}
+    self._workers = []
+    self._loop = asyncio.new_event_loop()
+    kwargs = {'base_url': base_url} if base_url else {}
+    self._client = WebClient(token=token,
+                             run_async=True,
+                             loop=self._loop,
+                             **kwargs)
+    self._thread = Thread(target=self._run, name='outbox', daemon=True)
+    self._thread.start()
+
+  def _run(self):
+    """ Sender thread """
+    asyncio.set_event_loop(self._loop)
+    self._loop.run_forever()
+    # Stopped, let workers handle their cancellation
+    for task in self._workers:
+      task.cancel()
+    self._loop.run_until_complete(asyncio.gather(*self._workers,
+                                                 return_exceptions=True))
+    self._loop.close()
+
+  def close(self):
+    """ Stop the sender, pending messages are dropped """
+    if self._thread.is_alive():
+      self._loop.call_soon_threadsafe(self._loop.stop)
+      self._thread.join()
+
+  def post(self, channel, text=None, blocks=None, **kwargs):
+    """
+    Queue a message, can be called from any thread. Texts longer than the
+    message limit are split and a list of blocks larger than the layout limit
+    is sent as several messages.
+    :param channel: Channel, or user, ID
+    :param text:    Message's text, optional
+    :param blocks:  Message's blocks, optional
+    :param kwargs:  Extra `chat.postMessage` arguments (i.e. `thread_ts`)
+    :return:  concurrent.futures.Future resolving to the response of the
+              last message sent
+    """
+    messages = []
+    if blocks:
+      if text is not None:
+        kwargs['text'] = text
+      messages.extend(self._split_blocks(blocks, kwargs))
+    else:
+      for chunk in split_text(text or ''):
+        messages.append(_Message(dict(kwargs, text=chunk), None, Future()))
+    self._loop.call_soon_threadsafe(self._enqueue, channel, messages)
+    return messages[-1].future
+
+  @staticmethod
+  def _split_blocks(blocks, kwargs):
+    """
+    Split a list of blocks into messages within layout limits
+    :param blocks:  List of blocks
+    :param kwargs:  Extra `chat.postMessage` arguments
+    :return:  List of _Message
+    """
+    messages = []
+    current = []
+    n_chars = 0
+    for b in blocks:
+      length = _blocks_length([b])
+      if current and (len(current) >= MAX_BLOCKS or
+                      n_chars + length > MAX_CHARS):
+        messages.append(_Message(dict(kwargs), current, Future()))
+        current = []
+        n_chars = 0
+      current.append(b)
+      n_chars += length
+    messages.append(_Message(dict(kwargs), current, Future()))
+    return messages
+
+  def _enqueue(self, channel, messages):
+    """
+    Add messages to the channel's queue, runs in the sender thread
+    :param channel:   Channel ID
+    :param messages:  List of _Message
+    """
+    queue = self._queues.get(channel, None)
+    if queue is None:
+      queue = asyncio.Queue()
+      self._queues[channel] = queue
+      self._limiters[channel] = TokenBucket(rate=self.rate)
+      self._workers.append(
+        asyncio.ensure_future(self._channel_worker(channel, queue)))
+    for msg in messages:
+      queue.put_nowait(msg)
+
+  async def _channel_worker(self, channel, queue):
+    """
+    Send the messages of a channel in order
+    :param channel: Channel ID
+    :param queue:   Channel's queue
+    """
+    limiter = self._limiters[channel]
+    while True:
+      msg = await queue.get()
+      _rate_wait.observe(await limiter.acquire(), limiter='slack')
+      kwargs = dict(msg.kwargs)
+      if msg.blocks is not None:
+        kwargs['blocks'] = msg.blocks
+      try:
+        res = await self._send(channel, kwargs)
+      except Exception as e:
+        self.failed += 1
+        _failed.inc()
+        print('Slack error in channel {}: {}'.format(channel, e))
+        msg.future.set_exception(e)
+      else:
+        self.sent += 1
+        _posted.inc()
+        msg.future.set_result(res)
+
+  async def _send(self, channel, kwargs):
+    """
+    Post a message, retried on rate limiting, server and network errors
+    :param channel: Channel ID
+    :param kwargs:  `chat.postMessage` arguments
+    :return:  SlackResponse
+    """
+    delay = self.backoff
+    for attempt in range(self.max_retries):
+      try:
+        with _post_seconds.time():
+          return await self._client.chat_postMessage(channel=channel,
+                                                     **kwargs)
+      except SlackApiError as e:
+        status = e.response.status_code
+        if attempt + 1 == self.max_retries or (status != 429 and
+                                               status < 500):
+          raise
+        if status == 429:
+          self.rate_limited += 1
+          _retries.inc(cause='rate_limited')
+          wait = float(e.response.headers.get('Retry-After', delay))
+        else:
+          _retries.inc(cause='server')
+          wait = delay + uniform(0.0, delay)
+      except (ClientError, asyncio.TimeoutError):
+        if attempt + 1 == self.max_retries:
+          raise
+        _retries.inc(cause='network')
+        wait = delay + uniform(0.0, delay)
+      self.retries += 1
+      delay *= 2.0
+      await asyncio.sleep(wait)
@@ -0,0 +1,176 @@
+# coding=utf-8
+"""
+Relevance ranking of a batch of articles against an interest profile.
+
+A TF-IDF model is fitted over the titles, abstracts and authors of the batch
+and stored as a sparse matrix in CSR layout. The profile combines the terms of
+the keywords with the papers users reacted to, scoring the whole batch is a
+single sparse matrix-vector product. Rows and profile are L2 normalized, the
+scores are therefore cosine similarities.
+
+Keywords follow the matcher syntax: phrases contribute each of their terms
+and prefixes, `segment*`, all the terms of the batch starting with them.
+
+See:
+  - https://en.wikipedia.org/wiki/Tf%E2%80%93idf
+  - https://en.wikipedia.org/wiki/Sparse_matrix#Compressed_sparse_row_(CSR,_CRS_or_Yale_format)
+"""
+import numpy as np
+from index import tokenize, article_terms
+
+__author__ = 'Christophe Ecabert'
+
+
+def _unit(vector):
+  """
+  Scale a vector to unit length
+  :param vector:  numpy array
+  :return:  numpy array, unchanged if null
+  """
+  norm = np.linalg.norm(vector)
+  return vector / norm if norm > 0.0 else vector
+
+
+class TfidfRanker:
+  """ Rank articles by similarity with keywords and liked articles """
+
+  def __init__(self, keywords=(), liked=(), keyword_weight=0.5):
+    """
+    Constructor
+    :param keywords:  List of keywords, see `matcher.KeywordMatcher`
+    :param liked:     List of Article users showed interest for
+    :param keyword_weight:  Share of the keywords in the profile, the liked
+                            articles get the rest. Ignored if one of them is
+                            empty
+    """
+    self.keywords = list(keywords)
+    self.liked = list(liked)
+    self.keyword_weight = keyword_weight
+
+  @staticmethod
+  def _count(articles, vocab, grow):
+    """
+    Term counts of articles in CSR layout
+    :param articles:  Iterable of Article
+    :param vocab:     dict term -> column
+    :param grow:      If True, unknown terms are added to `vocab`, dropped
+                      otherwise
+    :return:  Tuple (indptr, indices, counts) of numpy arrays
+    """
+    indptr = [0]
+    indices = []
+    counts = []
+    for art in articles:
+      for term, n in article_terms(art).items():
+        col = vocab.get(term, None)
+        if col is None:
+          if not grow:
+            continue
+          col = vocab[term] = len(vocab)
+        indices.append(col)
+        counts.append(n)
+      indptr.append(len(indices))
+    return (np.asarray(indptr, dtype=np.int64),
+            np.asarray(indices, dtype=np.int64),
+            np.asarray(counts, dtype=np.float64))
+
+  @staticmethod
+  def _weights(indptr, indices, counts, idf):
+    """
+    Sublinear TF-IDF weights with L2 normalized rows
+    :param indptr:  Row pointers
+    :param indices: Columns
+    :param counts:  Term counts
+    :param idf:     Inverse document frequency of each column
+    :return:  Tuple (rows, weights)
+    """
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    weights = (1.0 + np.log(counts)) * idf[indices]
+    norms = np.sqrt(np.bincount(rows,
+                                weights=weights ** 2,
+                                minlength=len(indptr) - 1))
+    weights /= np.maximum(norms, 1e-12)[rows]
+    return rows, weights
+
+  def _keyword_profile(self, vocab, idf):
+    """
+    Profile built from the keywords
+    :param vocab: dict term -> column
+    :param idf:   Inverse document frequency of each column
+    :return:  Dense vector
+    """
+    profile = np.zeros(len(idf))
+    for kw in self.keywords:
+      prefix = kw.endswith('*')
+      terms = tokenize(kw.rstrip('*'))
+      if not terms:
+        continue
+      cols = [vocab[t] for t in terms[:-1] if t in vocab]
+      if prefix:
+        cols.extend(c for t, c in vocab.items() if t.startswith(terms[-1]))
+      elif terms[-1] in vocab:
+        cols.append(vocab[terms[-1]])
+      if cols:
+        # Every keyword weights the same, whatever its number of terms
+        cols = np.asarray(cols)
+        profile[cols] += idf[cols] / np.linalg.norm(idf[cols])
+    return profile
+
+  def _liked_profile(self, vocab, idf):
+    """
+    Profile built from the liked articles, centroid of their vectors
+    :param vocab: dict term -> column
+    :param idf:   Inverse document frequency of each column
+    :return:  Dense vector
+    """
+    profile = np.zeros(len(idf))
+    if self.liked:
+      indptr, indices, counts = self._count(self.liked, vocab, grow=False)
+      _, weights = self._weights(indptr, indices, counts, idf)
+      np.add.at(profile, indices, weights)
+    return profile
+
+  def score(self, articles):
+    """
+    Score a batch of articles
+    :param articles:  Iterable of Article, iterated once
+    :return:  numpy array of cosine similarities, one per article
+    """
+    vocab = {}
+    indptr, indices, counts = self._count(articles, vocab, grow=True)
+    n_docs = len(indptr) - 1
+    if n_docs == 0:
+      return np.zeros(0)
+    # Smoothed inverse document frequency
+    df = np.bincount(indices, minlength=len(vocab))
+    idf = np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+    rows, weights = self._weights(indptr, indices, counts, idf)
+    # Interest profile
+    keywords = _unit(self._keyword_profile(vocab, idf))
+    liked = _unit(self._liked_profile(vocab, idf))
+    if keywords.any() and liked.any():
+      profile = (self.keyword_weight * keywords +
+                 (1.0 - self.keyword_weight) * liked)
+    else:
+      profile = keywords + liked
+    if not profile.any():
+      return np.zeros(n_docs)
+    profile = _unit(profile)
+    # Sparse matrix-vector product
+    return np.bincount(rows,
+                       weights=weights * profile[indices],
+                       minlength=n_docs)
+
+  def top_k(self, articles, k=None):
+    """
+    Positions of the most relevant articles
+    :param articles:  Iterable of Article, iterated once
+    :param k:         Number of articles to keep, all if None
+    :return:  List of tuple (position, score), highest score first. Ties
+              keep the order of the batch
+    """
+    scores = self.score(articles)
+    order = np.argsort(-scores, kind='stable')
+    if k is not None:
+      order = order[:k]
+    return [(int(i), float(scores[i])) for i in order]
@@ -0,0 +1,324 @@
+# coding=utf-8
+"""
+Slack layout of articles.
+
+Articles are rendered once into mrkdwn and kept in a small LRU cache keyed by
+arxiv ID, so an article posted again, or in several channels, is not formatted
+again. Texts are truncated to fit into a single section block and rendered
+articles are packed into as few messages as Slack's layout limits allow.
+
+See:
+  - https://api.slack.com/reference/block-kit/blocks#section
+"""
+from collections import OrderedDict
+from threading import Lock
+from outbox import MAX_BLOCKS, MAX_CHARS
+
+__author__ = 'Christophe Ecabert'
+
+
+# Maximum number of characters in a section's text
+MAX_SECTION_CHARS = 3000
+# Maximum number of characters used by the list of authors
+MAX_AUTHORS_CHARS = 500
+
+
+def truncate(text, limit):
+  """
+  Shorten a text on a word boundary, an ellipsis is appended if needed
+  :param text:  str
+  :param limit: Maximum number of characters
+  :return:  str
+  """
+  if len(text) <= limit:
+    return text
+  if limit < 1:
+    return ''
+  cut = text[:limit - 1]
+  space = cut.rfind(' ')
+  if space > limit // 2:
+    cut = cut[:space]
+  return cut.rstrip() + '…'
+
+
+def _links(prefix, articles):
+  """
+  List of links to articles fitting into a section, links not fitting are
+  counted instead of being cut
+  :param prefix:    Text before the links
+  :param articles:  List of Article
+  :return:  str
+  """
+  text = prefix
+  for k, art in enumerate(articles):
+    link = '<{}|{}>'.format(art.link, truncate(art.title, 200))
+    more = ' and {} more'.format(len(articles) - k)
+    if len(text) + len(link) + 2 + len(more) > MAX_SECTION_CHARS:
+      return text + more
+    text += (', ' if k > 0 else '') + link
+  return text
+
+
+class BlockPacker:
+  """
+  Group lists of blocks into messages. The order of the items is kept, hence
+  filling each message before starting the next one gives the fewest number
+  of messages.
+  """
+
+  def __init__(self, max_blocks=MAX_BLOCKS, max_chars=MAX_CHARS):
+    """
+    Constructor
+    :param max_blocks:  Maximum number of blocks per message
+    :param max_chars:   Maximum number of characters per message
+    """
+    self.max_blocks = max_blocks
+    self.max_chars = max_chars
+    self._current = []
+    self._n_chars = 0
+
+  def add(self, blocks, length):
+    """
+    Append blocks to the message being filled
+    :param blocks:  List of blocks
+    :param length:  Number of characters in the blocks
+    :return:  Completed message, list of blocks, or None
+    """
+    full = None
+    if self._current and (len(self._current) + len(blocks) > self.max_blocks
+                          or self._n_chars + length > self.max_chars):
+      full = self.flush()
+    self._current.extend(blocks)
+    self._n_chars += length
+    return full
+
+  def flush(self):
+    """
+    Complete the message being filled
+    :return:  List of blocks or None if empty
+    """
+    full = self._current or None
+    self._current = []
+    self._n_chars = 0
+    return full
+
+
+class LinePacker:
+  """
+  Group one-line entries into sections, filled up to Slack's section limit,
+  and sections into messages. Each line comes with a key, i.e. the article
+  it describes, returned along with the message holding it.
+  """
+
+  def __init__(self,
+               header=None,
+               max_blocks=MAX_BLOCKS,
+               max_chars=MAX_CHARS,
+               max_section_chars=MAX_SECTION_CHARS):
+    """
+    Constructor
+    :param header:      Line starting every message, optional
+    :param max_blocks:  Maximum number of blocks per message
+    :param max_chars:   Maximum number of characters per message
+    :param max_section_chars: Maximum number of characters per section
+    """
+    self.header = header
+    self.max_chars = max_chars
+    self.max_section_chars = max_section_chars
+    # Room left for the header's own block
+    if header is not None:
+      max_blocks -= 1
+      max_chars -= len(header)
+    self._blocks = BlockPacker(max_blocks=max_blocks, max_chars=max_chars)
+    self._section = []
+    self._n_chars = 0
+    # Keys of the lines in the message being filled, sections included
+    self._keys = []
+    self._pending_keys = []
+
+  def add(self, line, key=None):
+    """
+    Append a line to the message being filled
+    :param line:  str, at most `max_section_chars` characters
+    :param key:   Value associated with the line
+    :return:  Completed message, tuple (list of blocks, list of keys), or
+              None
+    """
+    full = None
+    if self._section and \
+            self._n_chars + 1 + len(line) > self.max_section_chars:
+      full = self._close_section()
+    self._n_chars += len(line) + (1 if self._section else 0)
+    self._section.append(line)
+    self._pending_keys.append(key)
+    return full
+
+  def _close_section(self):
+    """
+    Move the section being filled into the message
+    :return:  Completed message or None
+    """
+    text = '\n'.join(self._section)
+    blocks = self._blocks.add([{'type': 'section',
+                                'text': {'type': 'mrkdwn', 'text': text}}],
+                              len(text))
+    full = None
+    if blocks is not None:
+      full = self._message(blocks), self._keys
+      self._keys = []
+    self._keys.extend(self._pending_keys)
+    self._pending_keys = []
+    self._section = []
+    self._n_chars = 0
+    return full
+
+  def flush(self):
+    """
+    Complete the messages being filled
+    :return:  List of tuple (list of blocks, list of keys), empty if nothing
+              is left
+    """
+    messages = []
+    if self._section:
+      full = self._close_section()
+      if full is not None:
+        messages.append(full)
+    blocks = self._blocks.flush()
+    if blocks is not None:
+      messages.append((self._message(blocks), self._keys))
+      self._keys = []
+    return messages
+
+  def _message(self, blocks):
+    """
+    Start a completed message with the header, if any
+    :param blocks:  List of blocks
+    :return:  List of blocks
+    """
+    if self.header is None:
+      return blocks
+    return [{'type': 'section',
+             'text': {'type': 'mrkdwn', 'text': self.header}}] + blocks
+
+
+class BlockRenderer:
+  """ Memoised formatting of articles as slack blocks """
+
+  def __init__(self, max_entries=4096):
+    """
+    Constructor
+    :param max_entries: Number of rendered articles kept in memory
+    """
+    self.max_entries = max_entries
+    self._cache = OrderedDict()
+    self._lock = Lock()
+    # Counters
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    return len(self._cache)
+
+  def _render(self, art, prefix_length):
+    """
+    Format an article's body, everything but its position
+    :param art:           Article
+    :param prefix_length: Room to leave for the position in the list
+    :return:  str
+    """
+    authors = truncate(', '.join(art.authors), MAX_AUTHORS_CHARS)
+    head = '*<{}|{}>*\n_*Author(s)*:_ {}\n'.format(art.link,
+                                                  art.title,
+                                                  authors)
+    tail = ''
+    if art.keywords:
+      tail = '\n_*Keyword(s)*:_ {}'.format(', '.join(art.keywords))
+    # Abstract gets whatever is left in the section
+    room = MAX_SECTION_CHARS - prefix_length - len(head) - len(tail) - 2
+    return '{}_{}_{}'.format(head, truncate(art.summary, room), tail)
+
+  def text(self, art):
+    """
+    Body of an article, cached per arxiv ID and keywords
+    :param art: Article
+    :return:  str
+    """
+    key = (art.arxiv_id, tuple(art.keywords or ()))
+    with self._lock:
+      text = self._cache.get(key, None)
+      if text is not None:
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return text
+    # Keep room for the position, i.e. `[1234] `
+    text = self._render(art, prefix_length=16)
+    with self._lock:
+      self.misses += 1
+      self._cache[key] = text
+      while len(self._cache) > self.max_entries:
+        self._cache.popitem(last=False)
+    return text
+
+  def blocks(self, art, index, related=()):
+    """
+    Format an article as slack blocks
+    :param art:     Article
+    :param index:   Position of the article in the list
+    :param related: List of Article, near-duplicates linked below the
+                    article
+    :return:  List of blocks
+    """
+    text = '[{}] {}'.format(index, self.text(art))
+    # Identifies the article a reaction is about
+    blocks = [{'type': 'section',
+               'block_id': art.arxiv_id,
+               'text': {'type': 'mrkdwn',
+                        'text': text}}]
+    if related:
+      blocks.append({'type': 'section',
+                     'text': {'type': 'mrkdwn',
+                              'text': _links('_*Related*:_ ', related)}})
+    return blocks
+
+  @staticmethod
+  def line(art, index, related=()):
+    """
+    Format an article as a single line, without its abstract
+    :param art:     Article
+    :param index:   Position of the article in the list
+    :param related: List of Article, near-duplicates linked after the
+                    article
+    :return:  str, fits into a section
+    """
+    authors = ', '.join(art.authors[:1])
+    if len(art.authors) > 1:
+      authors += ' et al.'
+    text = '[{}] *<{}|{}>* {}'.format(index,
+                                      art.link,
+                                      truncate(art.title, 500),
+                                      authors)
+    if art.keywords:
+      text += ' _({})_'.format(truncate(', '.join(art.keywords), 200))
+    if related:
+      text = _links(text + ' · _Related_: ', related)
+    return text
+
+  @staticmethod
+  def duplicate_blocks(art, original, index):
+    """
+    Format an article as a single line pointing to the near-duplicate posted
+    earlier
+    :param art:       Article
+    :param original:  Article posted earlier
+    :param index:     Position of the article in the list
+    :return:  List of blocks
+    """
+    text = '[{}] *<{}|{}>*\n{}'.format(index,
+                                        art.link,
+                                        truncate(art.title, 500),
+                                        _links('_Near-duplicate of_ ',
+                                               [original]))
+    return [{'type': 'section',
+             'block_id': art.arxiv_id,
+             'text': {'type': 'mrkdwn',
+                      'text': text}}]
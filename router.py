@@ -0,0 +1,185 @@
+# coding=utf-8
+"""
+Routing of chat commands to their handlers.
+
+Messages not starting with the bot's mention are rejected with a string
+comparison, before any parsing. Handlers run as asyncio tasks on Slack's
+event loop, each command has its own timeout and a cap on the number of
+concurrent runs so a slow command can not starve the others. Handlers are
+either:
+
+- coroutine functions, awaited on the event loop
+- blocking functions, run in a small thread pool
+- short functions, called directly on the event loop
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from traceback import print_exc
+
+__author__ = 'Christophe Ecabert'
+
+
+class _Route:
+  """ Handler of a command with its limits """
+
+  def __init__(self, handler, help, timeout, max_concurrency, blocking):
+    """
+    Constructor
+    :param handler:         Callable taking the command as `cmd` keyword
+    :param help:            Description shown to users
+    :param timeout:         Time after which the user is told the command
+                            timed out, in seconds
+    :param max_concurrency: Maximum number of runs at the same time
+    :param blocking:        If True, a regular handler runs in the thread pool
+    """
+    self.handler = handler
+    self.help = help
+    self.timeout = timeout
+    self.max_concurrency = max_concurrency
+    self.blocking = blocking
+    self.running = 0
+
+
+class CommandRouter:
+  """ Dispatch commands addressed to the bot """
+
+  def __init__(self,
+               notify,
+               timeout=10.0,
+               max_concurrency=2,
+               max_workers=4):
+    """
+    Constructor
+    :param notify:          Callable `notify(cmd, text)` used to tell users a
+                            command was rejected, timed out or failed
+    :param timeout:         Default timeout of commands, in seconds
+    :param max_concurrency: Default number of concurrent runs of a command
+    :param max_workers:     Number of threads running blocking handlers
+    """
+    self._notify = notify
+    self._timeout = timeout
+    self._max_concurrency = max_concurrency
+    self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                    thread_name_prefix='command')
+    self._routes = {}
+    self._mention = None
+    # Keep a reference on running tasks, asyncio only holds weak ones
+    self._tasks = set()
+
+  def __contains__(self, name):
+    return name in self._routes
+
+  def set_mention(self, user_id):
+    """
+    Set the user the commands must be addressed to
+    :param user_id: Slack ID of the bot's user
+    """
+    self._mention = '<@{}>'.format(user_id)
+
+  def add(self,
+          name,
+          handler,
+          help='',
+          timeout=None,
+          max_concurrency=None,
+          blocking=False):
+    """
+    Register a command
+    :param name:            Command name
+    :param handler:         Coroutine function or callable, invoked with the
+                            command as `cmd` keyword
+    :param help:            Description shown to users
+    :param timeout:         Timeout in seconds, default one if None
+    :param max_concurrency: Maximum concurrent runs, default one if None
+    :param blocking:        If True, a regular handler runs in the thread
+                            pool, otherwise on the event loop. Ignored for
+                            coroutine functions
+    """
+    self._routes[name] = _Route(handler=handler,
+                                help=help,
+                                timeout=timeout or self._timeout,
+                                max_concurrency=(max_concurrency or
+                                                 self._max_concurrency),
+                                blocking=blocking)
+
+  def commands(self):
+    """
+    Registered commands
+    :return:  List of tuple (name, help)
+    """
+    return [(name, r.help) for name, r in self._routes.items()]
+
+  def route(self, text):
+    """
+    Extract a command addressed to the bot: `<@BotID> <command> <args>`
+    :param text:  Message text
+    :return:  Tuple (command, args) or None if the bot is not addressed
+    """
+    # Cheap rejection of the chatter
+    if not text or self._mention is None or \
+            not text.startswith(self._mention):
+      return None
+    rest = text[len(self._mention):]
+    if not rest[:1].isspace():
+      return None
+    parts = rest.split(None, 1)
+    if not parts:
+      return None
+    return parts[0], parts[1] if len(parts) == 2 else ''
+
+  def dispatch(self, name, cmd):
+    """
+    Start a command without waiting for it, must be called from the event
+    loop. The command is rejected if too many runs of it are in progress.
+    :param name:  Registered command name
+    :param cmd:   Command passed to the handler
+    :return:  True if started, False if rejected
+    """
+    route = self._routes[name]
+    if route.running >= route.max_concurrency:
+      self._notify(cmd, '`{}` is busy, try again later.'.format(name))
+      return False
+    route.running += 1
+    task = asyncio.ensure_future(self._run(name, route, cmd))
+    self._tasks.add(task)
+    task.add_done_callback(self._tasks.discard)
+    return True
+
+  async def _run(self, name, route, cmd):
+    """
+    Run a handler within its timeout
+    :param name:  Command name
+    :param route: _Route
+    :param cmd:   Command passed to the handler
+    """
+    try:
+      if asyncio.iscoroutinefunction(route.handler):
+        await asyncio.wait_for(route.handler(cmd=cmd), route.timeout)
+      elif route.blocking:
+        loop = asyncio.get_event_loop()
+        fut = loop.run_in_executor(self._pool,
+                                   partial(route.handler, cmd=cmd))
+        try:
+          await asyncio.wait_for(asyncio.shield(fut), route.timeout)
+        except asyncio.TimeoutError:
+          self._notify(cmd, '`{}` is taking longer than {:g}s, results will '
+                            'follow.'.format(name, route.timeout))
+          # A thread can not be interrupted, hold its slot until it is done
+          await fut
+      else:
+        route.handler(cmd=cmd)
+    except asyncio.TimeoutError:
+      self._notify(cmd, '`{}` timed out after {:g}s.'.format(name,
+                                                             route.timeout))
+    except Exception as e:
+      print_exc()
+      self._notify(cmd, '`{}` failed: {}'.format(name, e))
+    finally:
+      route.running -= 1
+
+  def shutdown(self):
+    """ Cancel running commands and stop the thread pool """
+    for task in list(self._tasks):
+      task.cancel()
+    self._pool.shutdown(wait=False)
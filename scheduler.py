@@ -0,0 +1,248 @@
+# coding=utf-8
+"""
+Deadline driven scheduler running on an asyncio event loop.
+
+Schedules are cron-like expressions, `minute hour day month weekday`, with an
+optional time zone, i.e. `0 20 * * 0-4 America/New_York` for arXiv's
+announcements. The scheduler sleeps until the earliest deadline instead of
+polling and is woken up whenever the schedules change.
+
+See:
+  - https://man7.org/linux/man-pages/man5/crontab.5.html
+  - https://arxiv.org/help/availability
+"""
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from itertools import count
+from threading import Lock
+from time import time
+try:
+  from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:   # Python < 3.9
+  try:
+    from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+  except ImportError:
+    ZoneInfo = None
+
+__author__ = 'Christophe Ecabert'
+
+
+# Longest uninterrupted sleep, deadlines are re-evaluated afterward in case the
+# wall clock jumped (i.e. suspend, NTP adjustment)
+_max_sleep = 600.0
+
+
+def _parse_field(field, low, high):
+  """
+  Parse one field of a cron expression, i.e. `*`, `1,3`, `0-4` or `*/15`
+  :param field: Field to parse
+  :param low:   Smallest accepted value
+  :param high:  Largest accepted value
+  :return:  Sorted list of values
+  """
+  values = set()
+  for part in field.split(','):
+    rng, _, step = part.partition('/')
+    step = int(step) if step else 1
+    if rng == '*':
+      first, last = low, high
+    elif '-' in rng:
+      first, last = (int(v) for v in rng.split('-', 1))
+    else:
+      first = int(rng)
+      last = high if step > 1 else first
+    if first < low or last > high or first > last or step < 1:
+      raise ValueError('Invalid field: {}'.format(field))
+    values.update(range(first, last + 1, step))
+  return sorted(values)
+
+
+class CronSchedule:
+  """ Cron-like schedule """
+
+  def __init__(self, expr):
+    """
+    Constructor
+    :param expr:  `minute hour day month weekday [timezone]`, weekday starts
+                  on Sunday (0 or 7)
+    """
+    fields = expr.split()
+    if len(fields) not in (5, 6):
+      raise ValueError('Expected `minute hour day month weekday [timezone]`,'
+                       ' got: {}'.format(expr))
+    self.expr = ' '.join(fields)
+    self.minutes = _parse_field(fields[0], 0, 59)
+    self.hours = _parse_field(fields[1], 0, 23)
+    self.days = set(_parse_field(fields[2], 1, 31))
+    self.months = set(_parse_field(fields[3], 1, 12))
+    self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+    # Cron semantic: if both day and weekday are restricted, either matches
+    self._any_day = fields[2] != '*' and fields[4] != '*'
+    self.tz = None
+    if len(fields) == 6:
+      if ZoneInfo is None:
+        raise ValueError('Time zones require python 3.9 or newer, or '
+                         'backports.zoneinfo')
+      try:
+        self.tz = ZoneInfo(fields[5])
+      except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError('Unknown time zone: {}'.format(fields[5]))
+
+  def __repr__(self):
+    return self.expr
+
+  def _day_matches(self, day):
+    """
+    Check if a day is part of the schedule
+    :param day: date
+    :return:  bool
+    """
+    if day.month not in self.months:
+      return False
+    in_days = day.day in self.days
+    in_weekdays = day.isoweekday() % 7 in self.weekdays
+    if self._any_day:
+      return in_days or in_weekdays
+    return in_days and in_weekdays
+
+  def next_after(self, timestamp):
+    """
+    Next deadline strictly after a given time
+    :param timestamp: POSIX timestamp
+    :return:  POSIX timestamp
+    """
+    now = datetime.fromtimestamp(timestamp, self.tz).replace(tzinfo=None)
+    t = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    day = t.date()
+    # Leap days can be 8 years apart
+    for _ in range(366 * 8):
+      if self._day_matches(day):
+        first = (t.hour, t.minute) if day == t.date() else (0, 0)
+        for h in self.hours:
+          if h < first[0]:
+            continue
+          for m in self.minutes:
+            if (h, m) >= first:
+              dt = datetime(day.year, day.month, day.day, h, m)
+              return dt.replace(tzinfo=self.tz).timestamp()
+      day += timedelta(days=1)
+    raise ValueError('Schedule never fires: {}'.format(self.expr))
+
+
+class Scheduler:
+  """ Run callbacks at the deadlines of cron-like schedules """
+
+  def __init__(self):
+    """ Constructor """
+    self._lock = Lock()
+    self._heap = []
+    self._schedules = {}
+    self._ids = count()
+    self._loop = None
+    self._wakeup = None
+
+  def add(self, expr, callback, *args):
+    """
+    Add a schedule, can be called from any thread
+    :param expr:      Cron-like expression, see `CronSchedule`
+    :param callback:  Function called at every deadline, on the event loop
+    :param args:      Arguments of the callback
+    :return:  Schedule's ID
+    """
+    schedule = CronSchedule(expr)
+    with self._lock:
+      sid = next(self._ids)
+      self._schedules[sid] = (schedule, callback, args)
+      heapq.heappush(self._heap, (schedule.next_after(time()), sid))
+    self._notify()
+    return sid
+
+  def call_at(self, timestamp, callback, *args):
+    """
+    Run a callback once, can be called from any thread
+    :param timestamp: POSIX timestamp of the deadline
+    :param callback:  Function called at the deadline, on the event loop
+    :param args:      Arguments of the callback
+    :return:  Schedule's ID
+    """
+    with self._lock:
+      sid = next(self._ids)
+      self._schedules[sid] = (None, callback, args)
+      heapq.heappush(self._heap, (timestamp, sid))
+    self._notify()
+    return sid
+
+  def remove(self, sid):
+    """
+    Remove a schedule, can be called from any thread
+    :param sid: Schedule's ID
+    :return:  True if the schedule existed
+    """
+    with self._lock:
+      # Heap entry is dropped lazily
+      found = self._schedules.pop(sid, None) is not None
+    self._notify()
+    return found
+
+  def next_deadline(self, sid):
+    """
+    Upcoming deadline of a schedule
+    :param sid: Schedule's ID
+    :return:  POSIX timestamp or None
+    """
+    with self._lock:
+      for deadline, s in self._heap:
+        if s == sid:
+          return deadline
+    return None
+
+  def _notify(self):
+    """ Wake up the scheduler to recompute its deadline """
+    if self._loop is not None:
+      self._loop.call_soon_threadsafe(self._wakeup.set)
+
+  def _pop_due(self, now):
+    """
+    Remove schedules whose deadline has passed and push their next deadline
+    :param now: Current POSIX timestamp
+    :return:  Tuple (list of (callback, args) to run, next deadline or None)
+    """
+    due = []
+    with self._lock:
+      while self._heap and (self._heap[0][0] <= now or
+                            self._heap[0][1] not in self._schedules):
+        deadline, sid = heapq.heappop(self._heap)
+        entry = self._schedules.get(sid, None)
+        if entry is None:
+          continue
+        schedule, callback, args = entry
+        due.append((callback, args))
+        if schedule is None:
+          # One-off, see `call_at`
+          del self._schedules[sid]
+        else:
+          heapq.heappush(self._heap, (schedule.next_after(now), sid))
+      deadline = self._heap[0][0] if self._heap else None
+    return due, deadline
+
+  async def run(self):
+    """ Scheduling loop, runs forever """
+    self._loop = asyncio.get_event_loop()
+    self._wakeup = asyncio.Event()
+    while True:
+      # Cleared first, changes made while running callbacks are not missed
+      self._wakeup.clear()
+      due, deadline = self._pop_due(time())
+      for callback, args in due:
+        try:
+          callback(*args)
+        except Exception as e:
+          print('Scheduled task failed: {}'.format(e))
+      delay = _max_sleep
+      if deadline is not None:
+        delay = min(max(deadline - time(), 0.0), _max_sleep)
+      try:
+        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+      except asyncio.TimeoutError:
+        pass
@@ -0,0 +1,186 @@
+# coding=utf-8
+"""
+Persistent article store backed by SQLite.
+
+Articles are keyed by their arxiv identifier (without version) and indexed by
+submission date and primary category so history can be queried without
+touching the network. Articles also remember the feeds, i.e. set of
+categories, that returned them since cross-listed articles belong to several.
+"""
+import sqlite3
+from threading import Lock
+from json import dumps, loads
+from arxiv import Article
+
+__author__ = 'Christophe Ecabert'
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS articles (
+  id TEXT PRIMARY KEY,
+  title TEXT NOT NULL,
+  authors TEXT NOT NULL,
+  summary TEXT NOT NULL,
+  date TEXT NOT NULL,
+  submitted TEXT NOT NULL,
+  category TEXT,
+  link TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_submitted ON articles(submitted);
+CREATE INDEX IF NOT EXISTS idx_articles_category ON articles(category);
+CREATE TABLE IF NOT EXISTS feeds (
+  feed TEXT NOT NULL,
+  id TEXT NOT NULL,
+  PRIMARY KEY (feed, id)
+) WITHOUT ROWID;
+"""
+
+_columns = 'id, title, authors, summary, date, category, link'
+
+
+class ArticleStore:
+  """ Local database of articles seen on arxiv """
+
+  def __init__(self, filename):
+    """
+    Constructor
+    :param filename:  Path to the database file, created if needed
+    """
+    self.filename = filename
+    # Shared between slack's callbacks and background jobs
+    self._conn = sqlite3.connect(filename, check_same_thread=False)
+    self._lock = Lock()
+    with self._lock, self._conn:
+      self._conn.executescript(_schema)
+
+  def close(self):
+    """ Close underlying database """
+    with self._lock:
+      self._conn.close()
+
+  def __len__(self):
+    with self._lock:
+      return self._conn.execute('SELECT COUNT(*) FROM articles').fetchone()[0]
+
+  def __contains__(self, arxiv_id):
+    with self._lock:
+      r = self._conn.execute('SELECT 1 FROM articles WHERE id = ?',
+                             (arxiv_id,)).fetchone()
+    return r is not None
+
+  def in_feed(self, feed, arxiv_id):
+    """
+    Check if an article was returned by a given feed
+    :param feed:      Feed name
+    :param arxiv_id:  Arxiv identifier
+    :return:  bool
+    """
+    with self._lock:
+      r = self._conn.execute('SELECT 1 FROM feeds WHERE feed = ? AND id = ?',
+                             (feed, arxiv_id)).fetchone()
+    return r is not None
+
+  def add(self, articles, feed=None):
+    """
+    Insert or update articles
+    :param articles:  List of Article, must have an `arxiv_id`
+    :param feed:      Name of the feed that returned the articles, optional
+    """
+    rows = [(a.arxiv_id,
+             a.title,
+             dumps(a.authors),
+             a.summary,
+             a.date,
+             a.date[:10],
+             a.category,
+             a.link) for a in articles]
+    with self._lock, self._conn:
+      self._conn.executemany('INSERT OR REPLACE INTO articles '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+      if feed is not None:
+        self._conn.executemany('INSERT OR IGNORE INTO feeds VALUES (?, ?)',
+                               [(feed, r[0]) for r in rows])
+
+  @staticmethod
+  def _to_article(row):
+    """
+    Convert a database row into an Article
+    :param row: Tuple matching `_columns`
+    :return:  Article
+    """
+    arxiv_id, title, authors, summary, date, category, link = row
+    return Article(title=title,
+                   authors=loads(authors),
+                   summary=summary,
+                   date=date,
+                   link=link,
+                   arxiv_id=arxiv_id,
+                   category=category)
+
+  def _select(self, where, params, limit=None):
+    """
+    Run a select query on articles, most recent first
+    :param where:   SQL condition
+    :param params:  Condition's parameters
+    :param limit:   Maximum number of articles returned, optional
+    :return:  List of Article
+    """
+    query = 'SELECT {} FROM articles WHERE {} ORDER BY date DESC'.format(
+      _columns, where)
+    if limit is not None:
+      query += ' LIMIT {:d}'.format(limit)
+    with self._lock:
+      rows = self._conn.execute(query, params).fetchall()
+    return [self._to_article(r) for r in rows]
+
+  def iter_all(self, batch_size=500):
+    """
+    Iterate over every stored article, loaded by batches
+    :param batch_size:  Number of articles loaded at once
+    :return:  Generator of Article
+    """
+    last_id = ''
+    while True:
+      query = 'SELECT {} FROM articles WHERE id > ? ORDER BY id LIMIT ?'.format(
+        _columns)
+      with self._lock:
+        rows = self._conn.execute(query, (last_id, batch_size)).fetchall()
+      if not rows:
+        break
+      for r in rows:
+        yield self._to_article(r)
+      last_id = rows[-1][0]
+
+  def get(self, arxiv_id):
+    """
+    Retrieve a single article
+    :param arxiv_id:  Arxiv identifier, i.e. `2001.01234`
+    :return:  Article or None if not stored
+    """
+    res = self._select('id = ?', (arxiv_id,))
+    return res[0] if res else None
+
+  def by_date(self, submitted, until=None, feed=None):
+    """
+    Retrieve articles submitted on a given day or range of days
+    :param submitted: First submission date, `YYYY-MM-DD`
+    :param until:     Last submission date (included), defaults to
+                      `submitted`
+    :param feed:      Only the articles returned by this feed, optional
+    :return:  List of Article
+    """
+    if feed is None:
+      return self._select('submitted BETWEEN ? AND ?',
+                          (submitted, until or submitted))
+    return self._select('submitted BETWEEN ? AND ? AND id IN '
+                        '(SELECT id FROM feeds WHERE feed = ?)',
+                        (submitted, until or submitted, feed))
+
+  def by_category(self, category, limit=100):
+    """
+    Retrieve the latest articles of a given primary category
+    :param category:  Category, i.e. `cs.CV`
+    :param limit:     Maximum number of articles
+    :return:  List of Article
+    """
+    return self._select('category = ?', (category,), limit=limit)
@@ -0,0 +1,160 @@
+# coding=utf-8
+"""
+Per-user keyword and author subscriptions.
+
+Keywords of every subscriber are compiled into a single KeywordMatcher and
+authors into a single lookup table, so an article is matched once against all
+subscriptions whatever the number of subscribers.
+"""
+import re
+from collections import defaultdict
+from matcher import KeywordMatcher, normalize_keyword
+
+__author__ = 'Christophe Ecabert'
+
+
+def normalize_author(name):
+  """
+  Normalize author name: lower case and single space between words
+  :param name:  Author name
+  :return:  str
+  """
+  return ' '.join(name.lower().split())
+
+
+def parse_subscription(text):
+  """
+  Split subscription arguments into keywords and authors. Authors are prefixed
+  with `author:`, phrases and names can be grouped with double quotes, i.e.
+  `gan "neural field" author:"Jane Doe"`
+  :param text:  Subscription arguments
+  :return:  Tuple (keywords, authors)
+  """
+  keywords = []
+  authors = []
+  res = re.findall(r'(author:)?(?:["“”]([^"“”]+)["“”]|(\S+))',
+                   text or '')
+  for is_author, quoted, word in res:
+    value = quoted or word
+    if is_author:
+      authors.append(value)
+    else:
+      keywords.append(value)
+  return keywords, authors
+
+
+class Subscriptions:
+  """ Subscriptions of all users, matched in a single pass """
+
+  def __init__(self, subscriptions=None):
+    """
+    Constructor
+    :param subscriptions: dict user -> {'keywords': list, 'authors': list},
+                          i.e. output of `to_dict`
+    """
+    self._users = {}
+    for user, sub in (subscriptions or {}).items():
+      self._users[user] = {'keywords': list(sub.get('keywords', [])),
+                           'authors': list(sub.get('authors', []))}
+    self._rebuild()
+
+  def __len__(self):
+    return len(self._users)
+
+  def to_dict(self):
+    """
+    Serializable representation
+    :return:  dict
+    """
+    return self._users
+
+  def get(self, user):
+    """
+    Subscriptions of a given user
+    :param user:  User ID
+    :return:  Tuple (keywords, authors)
+    """
+    sub = self._users.get(user, {'keywords': [], 'authors': []})
+    return list(sub['keywords']), list(sub['authors'])
+
+  def _rebuild(self):
+    """ Recompile the combined index over all subscriptions """
+    self._keyword_users = defaultdict(set)
+    self._author_users = defaultdict(set)
+    for user, sub in self._users.items():
+      for kw in sub['keywords']:
+        self._keyword_users[kw].add(user)
+      for author in sub['authors']:
+        self._author_users[normalize_author(author)].add(user)
+    self._matcher = KeywordMatcher(self._keyword_users.keys())
+
+  def subscribe(self, user, keywords=(), authors=()):
+    """
+    Add subscriptions for a user
+    :param user:      User ID
+    :param keywords:  Keywords to follow
+    :param authors:   Authors to follow
+    :return:  Tuple (keywords, authors) actually added
+    """
+    sub = self._users.setdefault(user, {'keywords': [], 'authors': []})
+    new_kw = []
+    for kw in keywords:
+      kw = normalize_keyword(kw)
+      if kw and kw not in sub['keywords']:
+        sub['keywords'].append(kw)
+        new_kw.append(kw)
+    new_authors = []
+    known = [normalize_author(a) for a in sub['authors']]
+    for author in authors:
+      author = ' '.join(author.split())
+      if author and normalize_author(author) not in known:
+        sub['authors'].append(author)
+        known.append(normalize_author(author))
+        new_authors.append(author)
+    if new_kw or new_authors:
+      self._rebuild()
+    return new_kw, new_authors
+
+  def unsubscribe(self, user, keywords=(), authors=()):
+    """
+    Remove subscriptions of a user, everything is removed if neither
+    keywords nor authors are given
+    :param user:      User ID
+    :param keywords:  Keywords to stop following
+    :param authors:   Authors to stop following
+    :return:  Tuple (keywords, authors) actually removed
+    """
+    sub = self._users.get(user, None)
+    if sub is None:
+      return [], []
+    if not keywords and not authors:
+      del self._users[user]
+      self._rebuild()
+      return sub['keywords'], sub['authors']
+    keywords = [normalize_keyword(kw) for kw in keywords]
+    authors = [normalize_author(a) for a in authors]
+    old_kw = [kw for kw in sub['keywords'] if kw in keywords]
+    old_authors = [a for a in sub['authors']
+                   if normalize_author(a) in authors]
+    sub['keywords'] = [kw for kw in sub['keywords'] if kw not in old_kw]
+    sub['authors'] = [a for a in sub['authors'] if a not in old_authors]
+    if not sub['keywords'] and not sub['authors']:
+      del self._users[user]
+    if old_kw or old_authors:
+      self._rebuild()
+    return old_kw, old_authors
+
+  def match(self, article):
+    """
+    Find subscribers interested in an article
+    :param article: Article
+    :return:  dict user -> list of reasons (keywords or author names)
+    """
+    res = defaultdict(list)
+    for kw in self._matcher.match(article):
+      for user in self._keyword_users[kw]:
+        res[user].append(kw)
+    for author in article.authors:
+      for user in self._author_users.get(normalize_author(author), ()):
+        res[user].append(author)
+    return res